@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+occupancy.py
+Incrementally maintained class × day-of-week × minute-of-day occupancy cube.
+
+"When does class X usually happen?" views (clockVis.py --occupancy; the web
+clock still rescans) used to rescan raw events every time. This keeps a
+precomputed aggregate instead:
+
+    for every (day, class, minute-of-day) that saw events:
+        count, sum of confidence (%), sum of dB
+
+stored sparsely as flat .npy columns sorted by (day, class, minute) under
+output/cache/occupancy/<source key>_utc<H>/gen-<n>/ (see sources.py). Only
+cells that actually occurred are stored, so a year of logs is a few tens of
+MB, and since every column is memory-mapped on open, a query is a
+searchsorted on the day column plus a single bincount – milliseconds, no
+matter how long the log is.
+
+New rows are folded in with update(): only the tail of the cube from the
+first affected day is re-aggregated. save() writes the columns and meta.json
+into a new generation directory and then switches the CURRENT file to it
+with one os.replace, so a crash mid-save leaves the previous cube intact.
+update_from() re-reads the source (see sources.py) from the start of the
+last complete local day before the watermark and rebuilds those days. Rows
+that arrive late (a publisher backlog, a sensor that was offline) are
+therefore still counted, as long as they are at most a day behind. A short
+settle window is left for rows that are still in the classifier / publisher
+buffers.
+
+Usage
+-----
+python scripts/analysis/occupancy.py update --source csv --utc-offset -4
+python scripts/analysis/occupancy.py query  --class "Vehicle" --class "Car" \
+       --start 2025-05-01 --minute-bin 15 --json output/occupancy_vehicle.json
+
+Dependencies: numpy, pandas (csv source), psycopg2 (postgres source)
+"""
+from __future__ import annotations
+
+import argparse
+import difflib
+import json
+import os
+import shutil
+import time
+from dataclasses import dataclass
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+
+from sources import (NUM_CLASSES, PROJECT_ROOT, LOG_CSV, CsvSource, DbSource, db_location, load_class_names,
+                     location_key)
+
+DAY_SEC      = 86_400
+MINUTES      = 1_440
+CELLS        = NUM_CLASSES * MINUTES          # (class, minute) cells per day
+EPOCH_DOW    = 3                              # 1970-01-01 was a Thursday (Mon = 0)
+SETTLE_SEC   = 120                            # rows younger than this may still be buffered upstream
+RESCAN_DAYS  = 1                              # complete days before the watermark's day rebuilt on every update
+CACHE_ROOT   = PROJECT_ROOT / "output" / "cache" / "occupancy"
+COLUMNS      = ("day", "cell", "count", "cf_sum", "db_sum")
+DTYPES       = (np.int32, np.int32, np.uint32, np.float32, np.float32)
+
+
+@dataclass
+class CubeSlice:
+    """Result of OccupancyCube.query(): arrays shaped (groups, 7, minutes // minute_bin)."""
+    labels:     list[str]
+    minute_bin: int
+    counts:     np.ndarray
+    cf_sum:     np.ndarray
+    db_sum:     np.ndarray
+
+    @property
+    def cf_mean(self) -> np.ndarray:
+        return np.divide(self.cf_sum, self.counts, out=np.zeros_like(self.cf_sum), where=self.counts > 0)
+
+    @property
+    def db_mean(self) -> np.ndarray:
+        return np.divide(self.db_sum, self.counts, out=np.full_like(self.db_sum, np.nan), where=self.counts > 0)
+
+    def to_json(self) -> dict:
+        return {
+            "labels": self.labels,
+            "minute_bin": self.minute_bin,
+            "counts": self.counts.astype(int).tolist(),
+            "cf_mean": np.round(self.cf_mean, 1).tolist(),
+            "db_mean": np.round(np.nan_to_num(self.db_mean, nan=0.0), 1).tolist(),
+        }
+
+
+class OccupancyCube:
+    """Sparse (day, class, minute) aggregate with a watermark for incremental updates."""
+
+    def __init__(self, root: Path, utc_offset_h: float = 0.0):
+        self.root = Path(root)
+        self.utc_offset_h = utc_offset_h
+        self.watermark = 0.0
+        self.gen = 0
+        current = self.root / "CURRENT"
+        if current.exists():
+            name = current.read_text().strip()
+            self.gen = int(name.split("-")[1])
+            gen_dir = self.root / name
+        else:
+            gen_dir = self.root                 # cubes saved before generations: files in the root
+        meta = gen_dir / "meta.json"
+        if meta.exists():
+            m = json.loads(meta.read_text())
+            if m["utc_offset_h"] != utc_offset_h:
+                raise ValueError(f"{self.root} was built with utc offset {m['utc_offset_h']}, not {utc_offset_h}")
+            self.watermark = m["watermark"]
+            self.cols = {c: np.load(gen_dir / f"{c}.npy", mmap_mode="r") for c in COLUMNS}
+        else:
+            self.cols = {c: np.empty(0, dt) for c, dt in zip(COLUMNS, DTYPES)}
+
+    @classmethod
+    def for_source(cls, source_key: str, utc_offset_h: float = 0.0, cache_root: Path = CACHE_ROOT):
+        """The cube of one source location (a source's .key), so another log never reuses it."""
+        return cls(cache_root / f"{source_key}_utc{utc_offset_h:+g}", utc_offset_h)
+
+    def __len__(self) -> int:
+        return int(self.cols["day"].size)
+
+    # ---------- writes ---------------------------------------------------- #
+    def update(self, ts: np.ndarray, idx: np.ndarray, cf: np.ndarray, db: np.ndarray,
+               from_day: int | None = None) -> int:
+        """Fold raw rows into the cube. Returns the number of rows added.
+
+        With *from_day* (local days since the epoch) the rows are all there is
+        from that day on: those days are rebuilt from them instead of added to.
+        """
+        local = ts + self.utc_offset_h * 3600
+        day = np.floor_divide(local, DAY_SEC).astype(np.int64)
+        ok = (idx >= 0) & (idx < NUM_CLASSES)
+        if from_day is not None:
+            ok &= day >= from_day
+        ts, idx, cf, db, local, day = ts[ok], idx[ok], cf[ok], db[ok], local[ok], day[ok]
+        if ts.size == 0 and from_day is None:
+            return 0
+        minute = (np.mod(local, DAY_SEC) // 60).astype(np.int64)
+        key = day * CELLS + idx.astype(np.int64) * MINUTES + minute
+
+        # re-aggregate only the tail of the cube that the new rows can touch
+        lo = int(np.searchsorted(self.cols["day"], day.min() if from_day is None else from_day, side="left"))
+        if from_day is None:
+            old = {c: np.asarray(a[lo:]) for c, a in self.cols.items()}
+        else:
+            old = {c: np.empty(0, dt) for c, dt in zip(COLUMNS, DTYPES)}
+        old_key = old["day"].astype(np.int64) * CELLS + old["cell"]
+        all_key = np.concatenate((old_key, key))
+        uniq, inv = np.unique(all_key, return_inverse=True)
+        n = uniq.size
+        tail = {
+            "day":    (uniq // CELLS).astype(np.int32),
+            "cell":   (uniq % CELLS).astype(np.int32),
+            "count":  np.bincount(inv, np.concatenate((old["count"], np.ones(key.size))), n).astype(np.uint32),
+            "cf_sum": np.bincount(inv, np.concatenate((old["cf_sum"], cf)), n).astype(np.float32),
+            "db_sum": np.bincount(inv, np.concatenate((old["db_sum"], db)), n).astype(np.float32),
+        }
+        self.cols = {c: np.concatenate((np.asarray(self.cols[c][:lo]), tail[c])) for c in COLUMNS}
+        if ts.size:
+            self.watermark = max(self.watermark, float(ts.max()))
+        return int(ts.size)
+
+    def update_from(self, source, settle_sec: float = SETTLE_SEC, rescan_days: int = RESCAN_DAYS) -> int:
+        """Rebuild from *rescan_days* complete days before the watermark's day up to now - settle_sec, and save.
+
+        Returns the number of rows read (rows already counted in a rebuilt day are read again).
+        """
+        until = time.time() - settle_sec
+        if until <= self.watermark:
+            return 0
+        offset = self.utc_offset_h * 3600
+        from_day = None
+        start = self.watermark
+        if self.watermark > 0:
+            from_day = int((self.watermark + offset) // DAY_SEC) - rescan_days
+            start = from_day * DAY_SEC - offset
+        ts, idx, cf, db = source.records(start, until)
+        added = self.update(ts, idx, cf, db, from_day=from_day)
+        self.watermark = until
+        self.save()
+        return added
+
+    def save(self) -> None:
+        """Write a new generation and switch CURRENT to it; readers see the old or the new cube, never a mix."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.gen += 1
+        gen_dir = self.root / f"gen-{self.gen:06d}"
+        shutil.rmtree(gen_dir, ignore_errors=True)      # left over from a save that crashed before the switch
+        gen_dir.mkdir()
+        for c in COLUMNS:
+            np.save(gen_dir / f"{c}.npy", np.ascontiguousarray(self.cols[c]))
+        meta = {"watermark": self.watermark, "utc_offset_h": self.utc_offset_h, "cells": len(self)}
+        (gen_dir / "meta.json").write_text(json.dumps(meta))
+        tmp = self.root / ".CURRENT.tmp"
+        tmp.write_text(gen_dir.name)
+        os.replace(tmp, self.root / "CURRENT")           # the commit point
+        # older generations (open memmaps keep their pages until closed) and the pre-generation layout
+        for old in self.root.glob("gen-*"):
+            if old != gen_dir:
+                shutil.rmtree(old, ignore_errors=True)
+        for name in [f"{c}.npy" for c in COLUMNS] + ["meta.json"]:
+            (self.root / name).unlink(missing_ok=True)
+
+    # ---------- reads ----------------------------------------------------- #
+    def query(self, start: date | None = None, end: date | None = None,
+              classes: list[int] | None = None, groups: dict[str, list[int]] | None = None,
+              minute_bin: int = 1, names: list[str] | None = None) -> CubeSlice:
+        """
+        Sum the cube over local days start..end (inclusive; None = open) into
+        (groups, day-of-week, minute bins). Pass either *classes* (one group per
+        class) or *groups* (label → class indices); default is every class.
+        """
+        if MINUTES % minute_bin:
+            raise ValueError(f"minute_bin {minute_bin} must divide {MINUTES}")
+        if groups is None:
+            classes = list(range(NUM_CLASSES)) if classes is None else list(classes)
+            labels = [names[c] if names else str(c) for c in classes]
+            members = [[c] for c in classes]
+        else:
+            labels, members = list(groups), list(groups.values())
+
+        lut = np.full(NUM_CLASSES, -1, dtype=np.int64)
+        for g, cls in enumerate(members):
+            lut[np.asarray(cls, dtype=np.int64)] = g
+
+        epoch = date(1970, 1, 1)
+        d0 = (start - epoch).days if start else np.iinfo(np.int32).min
+        d1 = (end - epoch).days + 1 if end else np.iinfo(np.int32).max
+        day = self.cols["day"]
+        lo, hi = np.searchsorted(day, [d0, d1], side="left")
+        day, cell = day[lo:hi], self.cols["cell"][lo:hi]
+
+        grp = lut[cell // MINUTES]
+        keep = grp >= 0
+        n_bins = MINUTES // minute_bin
+        dow = (day[keep].astype(np.int64) + EPOCH_DOW) % 7
+        flat = (grp[keep] * 7 + dow) * n_bins + (cell[keep] % MINUTES) // minute_bin
+        size = len(labels) * 7 * n_bins
+        shape = (len(labels), 7, n_bins)
+
+        def total(col):
+            return np.bincount(flat, np.asarray(self.cols[col][lo:hi])[keep], size).reshape(shape)
+
+        return CubeSlice(labels, minute_bin,
+                         total("count"), total("cf_sum").astype(np.float32), total("db_sum").astype(np.float32))
+
+
+# ---------- main ------------------------------------------------------------ #
+def main(argv: list[str] | None = None) -> None:
+    p = argparse.ArgumentParser(description="Maintain / query the class × weekday × minute occupancy cube.")
+    p.add_argument("command", choices=("update", "query"))
+    p.add_argument("--source", choices=("csv", "db"), default="csv")
+    p.add_argument("--csv", type=Path, default=LOG_CSV)
+    p.add_argument("--dbconfig", type=Path, default=PROJECT_ROOT / "dbconfig.json")
+    p.add_argument("--utc-offset", type=float, default=0.0, help="Hours added to UTC for local day/minute.")
+    p.add_argument("--start", type=date.fromisoformat)
+    p.add_argument("--end", type=date.fromisoformat)
+    p.add_argument("--class", dest="classes", action="append", default=[],
+                   help="Display name to include (repeat). Queried together as one group.")
+    p.add_argument("--minute-bin", type=int, default=15)
+    p.add_argument("--json", type=Path, help="Write the query result here.")
+    args = p.parse_args(argv)
+
+    if args.source == "csv":
+        key = location_key("csv", args.csv.resolve())
+    else:
+        dbcfg = json.loads(args.dbconfig.read_text())
+        key = location_key("db", db_location(dbcfg))
+    cube = OccupancyCube.for_source(key, args.utc_offset)
+
+    if args.command == "update":
+        source = CsvSource(args.csv) if args.source == "csv" else DbSource(dbcfg)
+        t0 = time.perf_counter()
+        added = cube.update_from(source)
+        print(f"[DEBUG] {added} rows read → {len(cube):,} cells in {time.perf_counter() - t0:.2f}s "
+              f"(watermark {cube.watermark:.0f})")
+        return
+
+    names = load_class_names()
+    t0 = time.perf_counter()
+    if args.classes:
+        unknown = [n for n in args.classes if n not in names]
+        for n in unknown:
+            close = difflib.get_close_matches(n, names, n=3)
+            print(f"[ERROR] unknown class {n!r}" + (f"; did you mean {', '.join(map(repr, close))}?" if close else ""))
+        if unknown:
+            raise SystemExit(1)
+        wanted = [names.index(n) for n in args.classes]
+        res = cube.query(args.start, args.end, groups={" + ".join(args.classes): wanted},
+                         minute_bin=args.minute_bin)
+    else:
+        res = cube.query(args.start, args.end, minute_bin=args.minute_bin, names=names)
+    print(f"[DEBUG] query over {len(cube):,} cells in {(time.perf_counter() - t0) * 1000:.1f} ms")
+
+    days = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+    busiest = np.argsort(-res.counts.sum(axis=(1, 2)))[:10]
+    for g in busiest:
+        c = res.counts[g]
+        if not c.any():
+            continue
+        d, m = np.unravel_index(np.argmax(c), c.shape)
+        mins = m * res.minute_bin
+        print(f"{res.labels[g][:32]:<32} {int(c.sum()):>7} events, peak {days[d]} "
+              f"{mins // 60:02d}:{mins % 60:02d} ({int(c[d, m])})")
+
+    if args.json:
+        args.json.parent.mkdir(parents=True, exist_ok=True)
+        args.json.write_text(json.dumps(res.to_json()))
+        print(f"Wrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
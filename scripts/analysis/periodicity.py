@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+periodicity.py
+Find rhythms in the classification log: which of the 521 YAMNet classes recur
+on a daily / weekly / any other period, and how sharply.
+
+Pipeline
+--------
+1. Per-day binning: every UTC (or --utc-offset shifted) day is turned into a
+   (521, bins_per_day) event-count matrix and cached as
+   output/cache/periodicity/<source key>_bin<W>_utc<H>/<YYYY-MM-DD>.npz
+   (the key hashes the CSV path / database, see sources.py). Days older than
+   RESCAN_DAYS are not re-binned, so a rerun over a year only touches the
+   recent ones; the last RESCAN_DAYS are re-binned every run so late rows
+   (publisher backlog, a sensor that was offline) are still counted, and
+   days without any event are never cached, since rows for them may still
+   arrive (e.g. before the log started, or during an outage).
+2. The cached days are stacked into one (521, n_bins) matrix and every
+   analysis runs on all classes at once as NumPy matrix operations:
+     • autocorrelation          – FFT based, all rows in one rfft/irfft
+     • FFT periodogram          – |rfft|² of the de-meaned counts
+     • Lomb-Scargle periodogram – over the observed (non-empty) bins only,
+                                  so outages don't masquerade as silence
+     • phase-folded histograms  – counts per phase bin for a given period
+     • Rayleigh concentration   – how tightly events cluster at one phase
+3. Classes are ranked by periodic strength.
+
+Usage
+-----
+python scripts/analysis/periodicity.py --source csv --bin 300 --period 86400
+python scripts/analysis/periodicity.py --source db --start 2025-05-01 --utc-offset -4
+
+Dependencies: numpy, pandas (csv source), psycopg2 (postgres source)
+"""
+from __future__ import annotations
+
+import argparse
+import json
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+
+import numpy as np
+
+from sources import NUM_CLASSES, PROJECT_ROOT, LOG_CSV, CsvSource, DbSource, load_class_names
+
+DAY_SEC       = 86_400
+RESCAN_DAYS   = 2             # days before today re-binned on every run, for rows that arrive late
+CACHE_ROOT    = PROJECT_ROOT / "output" / "cache" / "periodicity"
+
+
+# ---------- per-day binning + cache ----------------------------------------- #
+def bin_day(ts: np.ndarray, idx: np.ndarray, day_start: float, bin_sec: int) -> np.ndarray:
+    """(NUM_CLASSES, bins_per_day) uint16 counts for events within one day."""
+    n_bins = DAY_SEC // bin_sec
+    b = ((ts - day_start) // bin_sec).astype(np.int64)
+    ok = (b >= 0) & (b < n_bins) & (idx >= 0) & (idx < NUM_CLASSES)
+    flat = np.bincount(idx[ok] * n_bins + b[ok], minlength=NUM_CLASSES * n_bins)
+    return np.minimum(flat, np.iinfo(np.uint16).max).astype(np.uint16).reshape(NUM_CLASSES, n_bins)
+
+
+def build_counts(source, first: date, last: date, bin_sec: int, utc_offset_h: float = 0.0,
+                 cache_root: Path = CACHE_ROOT, rescan_days: int = RESCAN_DAYS,
+                 verbose: bool = True) -> tuple[np.ndarray, float]:
+    """
+    Stack cached per-day count matrices from *first* to *last* (inclusive) into
+    one (NUM_CLASSES, n_days * bins_per_day) float32 matrix. Missing days, the
+    last *rescan_days* before today and today itself are binned from *source*;
+    days before today that saw events are cached.
+    Returns (counts, t0) where t0 is the epoch second of bin 0.
+    """
+    if DAY_SEC % bin_sec:
+        raise ValueError(f"bin width {bin_sec}s must divide a day evenly")
+    offset_s  = utc_offset_h * 3600
+    cache_dir = cache_root / f"{source.key}_bin{bin_sec}_utc{utc_offset_h:+g}"
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    today = (datetime.now(timezone.utc) + timedelta(seconds=offset_s)).date()
+    settled = today - timedelta(days=rescan_days)     # days before this are final once they have rows
+
+    n_days = (last - first).days + 1
+    n_bins = DAY_SEC // bin_sec
+    counts = np.zeros((NUM_CLASSES, n_days * n_bins), dtype=np.float32)
+    n_new = 0
+    for d in range(n_days):
+        day = first + timedelta(days=d)
+        # local midnight of *day* as a UTC epoch
+        day_start = datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp() - offset_s
+        path = cache_dir / f"{day.isoformat()}.npz"
+        if path.exists() and day < settled:
+            mat = np.load(path)["counts"]
+        else:
+            ts, idx, _, _ = source.records(day_start, day_start + DAY_SEC)
+            mat = bin_day(ts, idx, day_start, bin_sec)
+            if day < today and ts.size:
+                np.savez_compressed(path, counts=mat)
+            else:
+                path.unlink(missing_ok=True)
+            n_new += 1
+        counts[:, d * n_bins:(d + 1) * n_bins] = mat
+
+    if verbose:
+        print(f"[DEBUG] {n_days} days, {n_new} binned from {source.name}, {n_days - n_new} from cache")
+    t0 = datetime(first.year, first.month, first.day, tzinfo=timezone.utc).timestamp() - offset_s
+    return counts, t0
+
+
+# ---------- analyses (all classes at once) ---------------------------------- #
+def autocorrelation(x: np.ndarray, max_lag: int | None = None) -> np.ndarray:
+    """Normalised autocorrelation of every row of *x* (C, N) → (C, max_lag + 1)."""
+    n = x.shape[1]
+    max_lag = n - 1 if max_lag is None else min(max_lag, n - 1)
+    xc = x - x.mean(axis=1, keepdims=True)
+    nfft = 1 << int(np.ceil(np.log2(2 * n - 1)))   # zero-pad: linear, not circular
+    f = np.fft.rfft(xc, n=nfft, axis=1)
+    ac = np.fft.irfft(f.real ** 2 + f.imag ** 2, n=nfft, axis=1)[:, :max_lag + 1]
+    lag0 = ac[:, :1]
+    return np.divide(ac, lag0, out=np.zeros_like(ac), where=lag0 > 0)
+
+
+def fft_periodogram(x: np.ndarray, bin_sec: int) -> tuple[np.ndarray, np.ndarray]:
+    """Power spectrum of every row; returns (periods_sec, power) without the DC term."""
+    n = x.shape[1]
+    xc = x - x.mean(axis=1, keepdims=True)
+    f = np.fft.rfft(xc, axis=1)
+    power = (f.real ** 2 + f.imag ** 2) / n
+    freqs = np.fft.rfftfreq(n, d=bin_sec)[1:]
+    return 1.0 / freqs, power[:, 1:]
+
+
+def lomb_scargle(x: np.ndarray, t: np.ndarray, periods_sec: np.ndarray,
+                 chunk: int = 64) -> np.ndarray:
+    """
+    Classic (normalised by variance) Lomb-Scargle power of every row of *x*
+    sampled at times *t* (N,), for each period in *periods_sec* → (C, F).
+    The tau shift depends only on t and ω, so it is shared by all classes and
+    each frequency chunk is two (C, N) @ (N, chunk) products.
+    """
+    y = x - x.mean(axis=1, keepdims=True)
+    var = y.var(axis=1)
+    omega = 2 * np.pi / np.asarray(periods_sec, dtype=np.float64)
+    out = np.empty((x.shape[0], omega.size), dtype=np.float64)
+    for s in range(0, omega.size, chunk):
+        w = omega[s:s + chunk]
+        wt = np.outer(t, w)                                            # (N, c)
+        tau = np.arctan2(np.sin(2 * wt).sum(0), np.cos(2 * wt).sum(0)) / (2 * w)
+        arg = wt - w * tau                                             # (N, c)
+        c, sn = np.cos(arg), np.sin(arg)
+        yc, ys = y @ c, y @ sn                                         # (C, c)
+        out[:, s:s + chunk] = 0.5 * (yc ** 2 / (c ** 2).sum(0) + ys ** 2 / (sn ** 2).sum(0))
+    return np.divide(out, var[:, None], out=np.zeros_like(out), where=var[:, None] > 0)
+
+
+def phase_fold(x: np.ndarray, bin_sec: int, period_sec: int) -> np.ndarray:
+    """
+    Fold every row onto *period_sec* → (C, period_sec // bin_sec) counts.
+    Phase 0 is bin 0, i.e. local midnight for counts from build_counts().
+    """
+    if period_sec % bin_sec:
+        raise ValueError(f"period {period_sec}s must be a multiple of the bin width {bin_sec}s")
+    m = period_sec // bin_sec
+    n = x.shape[1]
+    k = -(-n // m)                                                     # ceil
+    if k * m != n:
+        x = np.pad(x, ((0, 0), (0, k * m - n)))
+    return x.reshape(x.shape[0], k, m).sum(axis=1)
+
+
+def rayleigh(x: np.ndarray, bin_sec: int, period_sec: float) -> np.ndarray:
+    """Mean resultant length (0 = uniform, 1 = one phase) of events folded on period_sec."""
+    phase = 2 * np.pi * ((np.arange(x.shape[1]) + 0.5) * bin_sec / period_sec)
+    z = x @ np.exp(1j * phase)
+    tot = x.sum(axis=1)
+    return np.divide(np.abs(z), tot, out=np.zeros_like(tot), where=tot > 0)
+
+
+# ---------- ranking --------------------------------------------------------- #
+@dataclass
+class Ranking:
+    class_idx:   np.ndarray   # (K,) class indices, strongest first
+    score:       np.ndarray   # (K,) periodic strength used for ordering
+    best_period: np.ndarray   # (K,) Lomb-Scargle peak period in seconds
+    acf:         np.ndarray   # (K,) autocorrelation at the target period
+    concentration: np.ndarray  # (K,) Rayleigh mean resultant length at the target period
+    events:      np.ndarray   # (K,) total events
+
+
+def rank_classes(counts: np.ndarray, bin_sec: int, period_sec: int = DAY_SEC,
+                 min_events: int = 20, n_periods: int = 400) -> Ranking:
+    """
+    Rank classes with at least *min_events* by periodic strength at *period_sec*:
+    score = autocorrelation at that lag × Rayleigh concentration, so a class
+    must both recur every period and recur at the same phase to score high.
+    """
+    events = counts.sum(axis=1)
+    keep = np.flatnonzero(events >= min_events)
+    x = counts[keep]
+    lag = int(round(period_sec / bin_sec))
+    if x.shape[1] <= lag:
+        raise ValueError(f"need more than {period_sec}s of data to test that period")
+
+    acf = autocorrelation(x, max_lag=lag)[:, lag]
+    conc = rayleigh(x, bin_sec, period_sec)
+
+    # Lomb-Scargle on observed bins only (any class active = sensor was up)
+    observed = np.flatnonzero(counts.sum(axis=0) > 0)
+    t = (observed + 0.5) * bin_sec
+    span = max(float(t[-1] - t[0]), 2.0 * bin_sec) if t.size else 2.0 * bin_sec
+    periods = np.geomspace(4 * bin_sec, span / 2, n_periods)
+    ls = lomb_scargle(x[:, observed], t, periods)
+    best = periods[np.argmax(ls, axis=1)]
+
+    score = np.clip(acf, 0, None) * conc
+    order = np.argsort(-score, kind="stable")
+    return Ranking(keep[order], score[order], best[order], acf[order], conc[order], events[keep][order])
+
+
+# ---------- main ------------------------------------------------------------ #
+def main(argv: list[str] | None = None) -> None:
+    p = argparse.ArgumentParser(description="Rank YAMNet classes by periodicity.")
+    p.add_argument("--source", choices=("csv", "db"), default="csv",
+                   help="Local classifications.csv or the configured storage backend.")
+    p.add_argument("--csv", type=Path, default=LOG_CSV)
+    p.add_argument("--dbconfig", type=Path, default=PROJECT_ROOT / "dbconfig.json")
+    p.add_argument("--start", type=date.fromisoformat, help="First day (YYYY-MM-DD). Default: 30 days ago.")
+    p.add_argument("--end", type=date.fromisoformat, help="Last day (YYYY-MM-DD). Default: today.")
+    p.add_argument("--bin", type=int, default=300, help="Bin width in seconds (must divide a day).")
+    p.add_argument("--period", type=int, default=DAY_SEC, help="Period to fold/test, in seconds.")
+    p.add_argument("--utc-offset", type=float, default=0.0, help="Hours added to UTC for day boundaries.")
+    p.add_argument("--min-events", type=int, default=20)
+    p.add_argument("--top", type=int, default=20)
+    p.add_argument("--json", type=Path, help="Also write the ranking + folded profiles here.")
+    args = p.parse_args(argv)
+
+    today = (datetime.now(timezone.utc) + timedelta(hours=args.utc_offset)).date()
+    last  = args.end or today
+    first = args.start or last - timedelta(days=29)
+
+    if args.source == "csv":
+        source = CsvSource(args.csv)
+    else:
+        source = DbSource(json.loads(args.dbconfig.read_text()))
+
+    counts, t0 = build_counts(source, first, last, args.bin, args.utc_offset)
+    names = load_class_names()
+    rk = rank_classes(counts, args.bin, args.period, args.min_events)
+
+    print(f"\nTop {args.top} classes by periodicity at {args.period / 3600:g} h "
+          f"({first} → {last}, {args.bin}s bins)")
+    print(f"{'class':<32} {'events':>7} {'score':>6} {'acf':>6} {'R':>6} {'LS peak':>9}")
+    for i in range(min(args.top, rk.class_idx.size)):
+        print(f"{names[rk.class_idx[i]][:32]:<32} {int(rk.events[i]):>7} {rk.score[i]:6.3f} "
+              f"{rk.acf[i]:6.3f} {rk.concentration[i]:6.3f} {rk.best_period[i] / 3600:8.2f}h")
+
+    if args.json:
+        folded = phase_fold(counts[rk.class_idx[:args.top]], args.bin, args.period)
+        out = {
+            "start": first.isoformat(), "end": last.isoformat(), "t0": t0,
+            "bin_sec": args.bin, "period_sec": args.period,
+            "classes": [
+                {"idx": int(c), "name": names[c], "events": int(rk.events[i]),
+                 "score": float(rk.score[i]), "acf": float(rk.acf[i]),
+                 "concentration": float(rk.concentration[i]),
+                 "best_period_sec": float(rk.best_period[i]),
+                 "folded": folded[i].astype(int).tolist()}
+                for i, c in enumerate(rk.class_idx[:args.top])
+            ],
+        }
+        args.json.parent.mkdir(parents=True, exist_ok=True)
+        args.json.write_text(json.dumps(out))
+        print(f"Wrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
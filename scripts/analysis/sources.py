@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+sources.py
+Event sources shared by the analysis scripts.
+
+Both sources answer records(start_ts, end_ts) with four aligned arrays for
+the top-1 class of every logged YAMNet window with start_ts <= ts < end_ts
+(rows of a --second-model are skipped, they would count those windows twice),
+sorted by ts:
+
+    ts  (float64 epoch s)   idx (int64 class)   cf (float32 %)   db (float32 dBFS)
+
+  • CsvSource – the classifier's local output/classifications.csv, plus the
+                classifications.<stamp>.csv files EventSink moved aside when
+                the columns changed
+  • DbSource  – audio_logs through scripts/database/storage.py (postgres or sqlite)
+
+DbSource also reads audio_logs_summary, where sensors running classify.py
+--summarize keep one row per class and interval instead of one per window.
+Each such row comes back as its n windows, spread evenly over the interval
+with the max confidence and the mean dB. Counts per class and bin are exact
+for bins that are multiples of the summary interval.
+
+Each source also has a `key` – its name plus a short hash of where it reads
+from (the CSV path, or the database without credentials) – which the
+caches in periodicity.py and occupancy.py are filed under, so two logs
+never share a cache.
+"""
+from __future__ import annotations
+
+import csv
+import hashlib
+import sys
+from pathlib import Path
+from urllib.parse import urlparse
+
+import numpy as np
+
+SCRIPT_DIR   = Path(__file__).resolve().parent
+PROJECT_ROOT = SCRIPT_DIR.parents[1]
+sys.path.insert(0, str(SCRIPT_DIR.parent))  # scripts/
+
+NUM_CLASSES   = 521
+SUMMARY_LOOKBACK = 3600       # longest --summarize interval: one that started earlier can still reach into a range
+LOG_CSV       = PROJECT_ROOT / "output" / "classifications.csv"
+CLASS_MAP_CSV = PROJECT_ROOT / "scripts" / "models" / "yamnet" / "yamnet_class_map.csv"
+
+_EMPTY = (np.empty(0), np.empty(0, np.int64), np.empty(0, np.float32), np.empty(0, np.float32))
+
+
+def load_class_names(path: Path = CLASS_MAP_CSV) -> list[str]:
+    with open(path, newline="") as f:
+        return [r["display_name"] for r in csv.DictReader(f)]
+
+
+def location_key(name: str, location) -> str:
+    """Cache key for a source: its kind plus a short hash of its location."""
+    return f"{name}-{hashlib.sha1(str(location).encode()).hexdigest()[:10]}"
+
+
+def db_location(cfg: dict) -> str:
+    """Where a dbconfig points, without the password: sqlite file or postgres host/port/database."""
+    from database.storage import DEFAULT_SQLITE_PATH
+
+    if cfg.get("storage", "postgres") == "sqlite":
+        path = Path(cfg.get("sqlite_path", DEFAULT_SQLITE_PATH))
+        return f"sqlite:{path if path.is_absolute() else PROJECT_ROOT / path}"
+    url = urlparse(cfg.get("postgres_url") or "")
+    return f"postgres:{url.hostname}:{url.port}{url.path}"
+
+
+class CsvSource:
+    """The classifier's local CSV log and its rotated parts. Read once (ts, db, c1_idx, c1_cf only), sliced by range."""
+
+    name = "csv"
+
+    def __init__(self, path: Path = LOG_CSV):
+        self.path = Path(path)
+        self.key = location_key(self.name, self.path.resolve())
+        self._cols = None
+
+    def _load(self) -> None:
+        import pandas as pd
+
+        parts = []
+        # columns are picked by name, so parts written with older headers line up
+        for path in sorted(self.path.parent.glob(f"{self.path.stem}.*{self.path.suffix}")) + [self.path]:
+            if not path.exists():
+                continue
+            df = pd.read_csv(path, usecols=lambda c: c in ("ts", "db", "c1_idx", "c1_cf", "model"))
+            if "model" in df:                       # logs from before --second-model have no such column
+                df = df[df["model"].isna() | (df["model"] == "yamnet")]
+            parts.append(df.drop(columns="model", errors="ignore"))
+        if not parts:
+            raise FileNotFoundError(self.path)
+        df = pd.concat(parts, ignore_index=True).dropna(subset=["ts", "c1_idx"])
+        order = np.argsort(df["ts"].to_numpy(), kind="stable")
+        self._cols = (
+            df["ts"].to_numpy(np.float64)[order],
+            df["c1_idx"].to_numpy(np.int64)[order],
+            df["c1_cf"].to_numpy(np.float32)[order],
+            df["db"].to_numpy(np.float32)[order],
+        )
+
+    def records(self, start_ts: float, end_ts: float):
+        if self._cols is None:
+            self._load()
+        ts = self._cols[0]
+        lo, hi = np.searchsorted(ts, [start_ts, end_ts], side="left")
+        return tuple(c[lo:hi] for c in self._cols)
+
+
+class DbSource:
+    """audio_logs through the configured storage backend, one range query per call."""
+
+    name = "db"
+
+    def __init__(self, cfg: dict):
+        from database.storage import open_backend
+
+        self.store = open_backend(cfg)
+        self.key = location_key(self.name, db_location(cfg))
+
+    def records(self, start_ts: float, end_ts: float):
+        # fetch_range is inclusive on both ends; nudge the end to keep ranges half-open
+        rows = self.store.fetch_range(start_ts, end_ts - 1e-6, model="yamnet")
+        # RANGE_COLUMNS: id, ts, db, c1_idx, c1_cf, ...  (missing cf/db count as 0)
+        recs = [(r[1], r[3], r[4] or 0.0, r[2] or 0.0) for r in rows if r[3] is not None]
+        # SUMMARY_COLUMNS: id, bin_start, bin_sec, c1_idx, n, cf_max, ts_max, db_at_max, db_mean, ...
+        for r in self.store.fetch_summary_range(start_ts - SUMMARY_LOOKBACK, end_ts - 1e-6):
+            step = r[2] / r[4]
+            recs.extend((t, r[3], r[5] or 0.0, r[8] or 0.0) for t in r[1] + step * (np.arange(r[4]) + 0.5)
+                        if start_ts <= t < end_ts)
+        if not recs:
+            return _EMPTY
+        arr = np.asarray(recs, dtype=np.float64)
+        arr = arr[np.argsort(arr[:, 0], kind="stable")]
+        return arr[:, 0], arr[:, 1].astype(np.int64), arr[:, 2].astype(np.float32), arr[:, 3].astype(np.float32)
@@ -5,54 +5,56 @@ detect any non-linear timestamps, log them, and plot:
  1) Timestamp vs. row ID
  2) Δ seconds between consecutive timestamps vs. row ID
 
-Dependencies: psycopg2, pandas, matplotlib
+Works against either storage backend (see scripts/database/storage.py):
+the Postgres server named by --db-url / postgres_url, or the embedded sqlite
+file when dbconfig.json sets "storage": "sqlite".
+
+Dependencies: psycopg2 (postgres only), pandas, matplotlib
 """
 
 import argparse
 import json
+import sys
 from pathlib import Path
 
-import psycopg2
 import pandas as pd
 import matplotlib.pyplot as plt
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))  # scripts/
+from database.storage import open_backend
 
-def get_db_url(args):
-    # 1) From --db-url
-    if args.db_url:
-        return args.db_url
 
-    # 2) Else try reading dbconfig.json
+def get_config(args):
+    # 1) Try reading dbconfig.json
+    cfg = {}
     cfg_path = Path(args.dbconfig)
     if cfg_path.exists():
         cfg = json.loads(cfg_path.read_text())
-        url = cfg.get("postgres_url")
-        if url:
-            return url
 
-    raise RuntimeError(
-        "No database URL provided. "
-        "Give --db-url or place your postgres_url in dbconfig.json."
-    )
+    # 2) --db-url always means postgres
+    if args.db_url:
+        cfg["storage"] = "postgres"
+        cfg["postgres_url"] = args.db_url
+
+    if cfg.get("storage", "postgres") == "postgres" and not cfg.get("postgres_url"):
+        raise RuntimeError(
+            "No database URL provided. "
+            "Give --db-url or place your postgres_url in dbconfig.json."
+        )
+    return cfg
 
 
-def fetch_data(db_url):
+def fetch_data(cfg):
     # Connect and pull id, ts ordered by id
-    conn = psycopg2.connect(dsn=db_url)
+    store = open_backend(cfg)
     try:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT id, ts
-                  FROM audio_logs
-                 ORDER BY id ASC
-            """)
-            rows = cur.fetchall()
+        rows = store.fetch_id_ts()
     finally:
-        conn.close()
+        store.close()
 
     # Build DataFrame
     df = pd.DataFrame(rows, columns=["id", "ts"])
-    df["ts"] = pd.to_datetime(df["ts"])
+    df["ts"] = pd.to_datetime(df["ts"], unit="s", utc=True)
     return df
 
 
@@ -114,12 +116,12 @@ def main():
     p.add_argument(
         "--dbconfig",
         default="dbconfig.json",
-        help="Path to JSON config containing your postgres_url key"
+        help="Path to JSON config containing your postgres_url (or storage/sqlite_path) keys"
     )
     args = p.parse_args()
 
-    db_url = get_db_url(args)
-    df = fetch_data(db_url)
+    cfg = get_config(args)
+    df = fetch_data(cfg)
 
     if df.empty:
         print("No records found in audio_logs.")
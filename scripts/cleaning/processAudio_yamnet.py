@@ -4,29 +4,79 @@ yamnet_prepare.py
 Convert a directory of arbitrary audio files to 16 kHz mono WAV suitable for YAMNet.
 Also renames the originals to their creation time in seconds since the Unix epoch.
 
+Files are converted in parallel (one process per core by default), and each
+one is streamed block by block – decode → mono → resample → PCM-16 write – so
+memory stays flat even for multi-hour recordings:
+
+  • decode:    soundfile, BLOCK_SEC of source audio at a time (WAV/FLAC/OGG/AIFF
+               and, with libsndfile >= 1.1, MP3). Anything soundfile can't
+               open (m4a, …) is piped through ffmpeg, which then also does
+               the resampling.
+  • resample:  "soxr" (python-soxr's streaming resampler, if installed) or
+               "poly" (scipy polyphase, chunked with overlap so the result
+               equals one resample_poly over the whole file). --resampler auto
+               (default) times both on a short synthetic signal and uses the
+               faster one.
+  • write:     to "<ts>.wav.part", renamed into place once complete.
+
+Re-runs skip files whose output is up to date: <output>/prepare_manifest.json
+records each source's size, mtime and sha256. An unchanged size+mtime is
+trusted outright; otherwise the source is re-hashed and only reconverted if
+its content really changed.
+
 Usage
 -----
 python yamnet_prepare.py   \
        --input  /path/to/raw_audio   \
        --output /path/to/converted   \
        --recursive                  # optional
+python yamnet_prepare.py -i raw -o converted --workers 4 --resampler soxr
+python yamnet_prepare.py --benchmark    # time the resampler backends and exit
 
 Dependencies
 ------------
-pip install soundfile librosa tqdm  # and ffmpeg installed on the system for non-WAV input
+pip install soundfile scipy tqdm  # and ffmpeg installed on the system for formats libsndfile can't read
+pip install soxr                  # optional, usually the fastest resampler
 """
 from __future__ import annotations
-import argparse, os, sys, shutil, stat, time
+import argparse, hashlib, json, os, re, subprocess, sys, shutil, stat, time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from math import gcd
 from pathlib import Path
+from typing import Iterator
+import numpy as np
 import soundfile as sf
-import librosa
+from scipy.signal import resample_poly
 from tqdm import tqdm
 
+try:
+    import soxr
+    HAVE_SOXR = True
+except ImportError:
+    HAVE_SOXR = False
+
 # ---------- helpers --------------------------------------------------------- #
 AUDIO_EXTS = {".wav", ".mp3", ".flac", ".ogg", ".m4a", ".aiff", ".aif", ".aifc"}
+TARGET_SR  = 16_000
+BLOCK_SEC  = 30                     # source seconds decoded + resampled per step
+HASH_CHUNK = 1 << 20
+MANIFEST   = "prepare_manifest.json"
+EPOCH_MIN  = 946_684_800            # 2000-01-01: smaller all-digit stems are not our epoch names
+DATE_STEM  = re.compile(r"(\d{8})(?:[_-]?(\d{6}))?")    # 20250430, 20250430_153000 (local time)
 
 def file_timestamp(p: Path) -> int:
     """Return creation-time in seconds. Fallback to mtime on Unix where ctime≈mtime."""
+    # already renamed by an earlier run: on Linux ctime moves with every rename
+    if p.stem.isdigit() and len(p.stem) == 10 and EPOCH_MIN <= int(p.stem) <= time.time() + 86_400:
+        return int(p.stem)
+    # recorder-style date names
+    m = DATE_STEM.fullmatch(p.stem)
+    if m:
+        try:
+            return int(datetime.strptime(m[1] + (m[2] or "000000"), "%Y%m%d%H%M%S").timestamp())
+        except ValueError:
+            pass                    # digits, but not a date
     if hasattr(os, "stat"):
         st = p.stat()
         # On macOS/Linux st.st_birthtime is creation time when available
@@ -36,20 +86,174 @@ def file_timestamp(p: Path) -> int:
         return int(st.st_ctime)
     return int(time.time())
 
-def convert_to_yamnet(src: Path, dst: Path, sr: int = 16_000) -> None:
-    """Load *src* with librosa, resample/mono-ize, write WAV 16 kHz PCM 16-bit to *dst*."""
-    y, _ = librosa.load(src, sr=sr, mono=True)          # ensures 16 kHz + mono
+def file_sha256(p: Path) -> str:
+    h = hashlib.sha256()
+    with open(p, "rb") as f:
+        for block in iter(lambda: f.read(HASH_CHUNK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+# ---------- resamplers ------------------------------------------------------ #
+class PolyStream:
+    """
+    Streaming scipy polyphase resampler. Input is resampled in steps that are
+    a multiple of *down*, each with `margin` real neighbouring samples on both
+    sides (zeros past the ends), so the concatenated output equals
+    resample_poly over the whole signal.
+    """
+    def __init__(self, sr_in: int, sr_out: int, step_sec: float = BLOCK_SEC):
+        g = gcd(sr_in, sr_out)
+        self.up, self.down = sr_out // g, sr_in // g
+        # resample_poly's filter spans ~10 * max(up, down) taps at the upsampled rate
+        self.margin = self.down * -(-max(256, 20 * max(self.up, self.down) // self.up) // self.down)
+        self.step = self.down * max(1, int(step_sec * sr_in) // self.down)
+        self.buf = np.zeros(self.margin, dtype=np.float32)   # leading zeros = resample_poly's edge
+        self.pos = self.margin                               # next unresampled sample in buf
+
+    def _run(self, n: int) -> np.ndarray:
+        seg = self.buf[self.pos - self.margin:self.pos + self.step + self.margin]
+        if seg.size < self.step + 2 * self.margin:
+            seg = np.pad(seg, (0, self.step + 2 * self.margin - seg.size))
+        y = resample_poly(seg, self.up, self.down)
+        lo = self.margin * self.up // self.down
+        self.pos += n
+        return y[lo:lo + -(-n * self.up // self.down)]
+
+    def resample_chunk(self, x: np.ndarray, last: bool = False) -> np.ndarray:
+        self.buf = np.concatenate((self.buf, x))
+        out = []
+        while self.buf.size - self.pos >= self.step + self.margin:
+            out.append(self._run(self.step))
+        while last and self.buf.size > self.pos:
+            out.append(self._run(min(self.step, self.buf.size - self.pos)))
+        self.buf = self.buf[self.pos - self.margin:]
+        self.pos = self.margin
+        return np.concatenate(out).astype(np.float32, copy=False) if out else np.zeros(0, np.float32)
+
+def make_resampler(backend: str, sr_in: int, sr_out: int = TARGET_SR):
+    """Object with resample_chunk(x, last=False) → float32, or None when no resampling is needed."""
+    if sr_in == sr_out:
+        return None
+    if backend == "soxr":
+        return soxr.ResampleStream(sr_in, sr_out, 1, dtype="float32", quality="HQ")
+    return PolyStream(sr_in, sr_out)
+
+def available_backends() -> list[str]:
+    return (["soxr"] if HAVE_SOXR else []) + ["poly"]
+
+def bench_resamplers(sr_in: int = 48_000, seconds: float = 120.0) -> dict[str, float]:
+    """× realtime of each backend streaming *seconds* of noise at *sr_in* → 16 kHz."""
+    x = np.random.default_rng(0).standard_normal(int(sr_in * seconds)).astype(np.float32) * 0.1
+    block = sr_in * BLOCK_SEC
+    speed = {}
+    for name in available_backends():
+        rs = make_resampler(name, sr_in)
+        t0 = time.perf_counter()
+        for a in range(0, x.size, block):
+            rs.resample_chunk(x[a:a + block], last=a + block >= x.size)
+        speed[name] = seconds / (time.perf_counter() - t0)
+    return speed
+
+# ---------- conversion ------------------------------------------------------ #
+def decode_blocks(src: Path) -> tuple[int, Iterator[np.ndarray]]:
+    """(sample rate, iterator of mono float32 blocks). ffmpeg fallback already delivers TARGET_SR."""
+    try:
+        f = sf.SoundFile(src)
+    except (RuntimeError, sf.LibsndfileError):
+        if shutil.which("ffmpeg") is None:
+            raise RuntimeError(f"soundfile can't read {src.suffix} and ffmpeg isn't installed")
+        return TARGET_SR, _ffmpeg_blocks(src)
+
+    def blocks():
+        with f:
+            frames = f.samplerate * BLOCK_SEC
+            while True:
+                x = f.read(frames, dtype="float32", always_2d=True)
+                if not len(x):
+                    break
+                yield x.mean(axis=1) if x.shape[1] > 1 else x[:, 0]
+    return f.samplerate, blocks()
+
+def _ffmpeg_blocks(src: Path) -> Iterator[np.ndarray]:
+    cmd = ["ffmpeg", "-v", "error", "-i", str(src), "-ac", "1", "-ar", str(TARGET_SR), "-f", "f32le", "-"]
+    nbytes = TARGET_SR * BLOCK_SEC * 4
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE) as proc:
+        while True:
+            raw = proc.stdout.read(nbytes)
+            if not raw:
+                break
+            yield np.frombuffer(raw[:len(raw) // 4 * 4], dtype="<f4")
+        proc.wait()
+        if proc.returncode:
+            raise RuntimeError(f"ffmpeg failed on {src}: {proc.stderr.read().decode(errors='replace').strip()}")
+
+def convert_to_yamnet(src: Path, dst: Path, backend: str = "poly", sr: int = TARGET_SR) -> float:
+    """Stream *src* → mono → *sr* → WAV PCM 16-bit at *dst*. Returns seconds of audio written."""
+    sr_in, blocks = decode_blocks(src)
+    rs = make_resampler(backend, sr_in, sr)
     dst.parent.mkdir(parents=True, exist_ok=True)
-    sf.write(dst, y, sr, subtype="PCM_16")              # WAV, 16-bit PCM
+    tmp = dst.with_name(dst.name + ".part")
+    n = 0
+    with sf.SoundFile(tmp, "w", samplerate=sr, channels=1, subtype="PCM_16", format="WAV") as out:
+        def write(y):
+            nonlocal n
+            if y.size:
+                out.write(np.clip(y, -1.0, 1.0))
+                n += y.size
+        for x in blocks:
+            write(x if rs is None else rs.resample_chunk(x))
+        if rs is not None:
+            write(rs.resample_chunk(np.zeros(0, np.float32), last=True))
+    os.replace(tmp, dst)
+    return n / sr
+
+def prepare_one(src: Path, dst: Path, backend: str, known_sha: str | None) -> dict:
+    """Worker: convert unless the content hash shows the source is unchanged. Returns its manifest entry."""
+    st = src.stat()
+    sha = file_sha256(src)
+    entry = {"src": str(src), "size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": sha}
+    if known_sha == sha and dst.exists():      # touched, not modified
+        entry["converted"] = 0.0
+        return entry
+    entry["converted"] = convert_to_yamnet(src, dst, backend)
+    return entry
+
+def load_manifest(path: Path) -> dict:
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(path: Path, manifest: dict) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(manifest, indent=1))
+    os.replace(tmp, path)
 
 # ---------- main ------------------------------------------------------------ #
 def main(argv: list[str] | None = None) -> None:
     parser = argparse.ArgumentParser(description="Prepare audio for YAMNet (16 kHz mono WAV).")
-    parser.add_argument("--input",  "-i", type=Path, required=True, help="Directory containing raw audio.")
-    parser.add_argument("--output", "-o", type=Path, required=True, help="Directory for converted WAVs.")
+    parser.add_argument("--input",  "-i", type=Path, help="Directory containing raw audio.")
+    parser.add_argument("--output", "-o", type=Path, help="Directory for converted WAVs.")
     parser.add_argument("--recursive", "-r", action="store_true", help="Recurse into sub-directories.")
+    parser.add_argument("--workers", "-j", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--resampler", choices=["auto", "soxr", "poly"], default="auto")
+    parser.add_argument("--force", action="store_true", help="Reconvert everything.")
+    parser.add_argument("--benchmark", action="store_true", help="Time the resampler backends and exit.")
     args = parser.parse_args(argv)
 
+    backend = args.resampler
+    if args.benchmark or backend == "auto":
+        speed = bench_resamplers(seconds=120.0 if args.benchmark else 20.0)
+        for name, x in speed.items():
+            print(f"[DEBUG] resampler {name}: {x:,.0f}× realtime (48 kHz → 16 kHz)")
+        if args.benchmark:
+            return
+        backend = max(speed, key=speed.get)
+    elif backend == "soxr" and not HAVE_SOXR:
+        sys.exit("--resampler soxr needs `pip install soxr`")
+
+    if args.input is None or args.output is None:
+        parser.error("--input and --output are required")
     if not args.input.is_dir():
         sys.exit(f"Input {args.input} is not a directory")
 
@@ -59,25 +263,78 @@ def main(argv: list[str] | None = None) -> None:
     if not audio_files:
         sys.exit("No audio files found!")
 
-    for src in tqdm(audio_files, desc="Processing", unit="file"):
+    args.output.mkdir(parents=True, exist_ok=True)
+    manifest_path = args.output / MANIFEST
+    manifest = {} if args.force else load_manifest(manifest_path)
+
+    # renaming stays sequential (cheap, and two workers must never race on a name)
+    named: list[tuple[int, Path]] = []
+    for src in audio_files:
         ts = file_timestamp(src)
         new_name = f"{ts}{src.suffix.lower()}"
         new_path = src.with_name(new_name)
 
-        # rename original if it hasn't already been renamed
+        # rename original if it hasn't already been renamed (and the name isn't another source's)
         if src.name != new_name:
-            try:
-                src.rename(new_path)
-                src = new_path  # update reference for conversion
-            except OSError as e:
-                tqdm.write(f"⚠️  Could not rename {src}: {e}")
-
-        # destination file gets .wav regardless of original extension
-        dst_path = args.output / f"{ts}.wav"
+            if new_path.exists():
+                tqdm.write(f"⚠️  Not renaming {src}: {new_name} already exists")
+            else:
+                try:
+                    src.rename(new_path)
+                    src = new_path  # update reference for conversion
+                except OSError as e:
+                    tqdm.write(f"⚠️  Could not rename {src}: {e}")
+        named.append((ts, src))
+
+    jobs: dict[str, tuple[Path, Path, str | None]] = {}
+    claimed: dict[str, Path] = {}       # output name → source
+    skipped = 0
+    # sorted, so sources sharing a start second get the same suffix on every run
+    for ts, src in sorted(named, key=lambda t: (t[0], str(t[1]))):
+        # destination file gets .wav regardless of original extension; later sources that
+        # start in the same second get <ts>.001.wav, … (still a valid timestamp stem)
+        stem, k = str(ts), 0
+        while f"{stem}.wav" in claimed:
+            k += 1
+            stem = f"{ts}.{k:03d}"
+        if k:
+            tqdm.write(f"⚠️  {src} starts in the same second as {claimed[f'{ts}.wav']}; writing {stem}.wav")
+        dst_path = args.output / f"{stem}.wav"
+        claimed[dst_path.name] = src
+        entry = manifest.get(dst_path.name)
+        st = src.stat()
+        if (entry is not None and entry["src"] == str(src) and dst_path.exists()
+                and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns):
+            skipped += 1
+            continue
+        same_src = entry is not None and entry["src"] == str(src)
+        jobs[dst_path.name] = (src, dst_path, entry["sha256"] if same_src else None)
+
+    print(f"[DEBUG] {len(audio_files)} files, {skipped} up to date; converting {len(jobs)} "
+          f"with {args.workers} workers, resampler={backend}")
+
+    t0 = time.perf_counter()
+    audio_sec = 0.0
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = {pool.submit(prepare_one, src, dst, backend, sha): name
+                   for name, (src, dst, sha) in jobs.items()}
         try:
-            convert_to_yamnet(src, dst_path)
-        except Exception as e:
-            tqdm.write(f"❌  Failed on {src}: {e}")
+            for fut in tqdm(as_completed(futures), total=len(futures), desc="Processing", unit="file"):
+                name = futures[fut]
+                try:
+                    entry = fut.result()
+                except Exception as e:
+                    tqdm.write(f"❌  Failed on {jobs[name][0]}: {e}")
+                    continue
+                audio_sec += entry.pop("converted")
+                manifest[name] = entry
+        finally:
+            save_manifest(manifest_path, manifest)
+
+    wall = time.perf_counter() - t0
+    if jobs:
+        print(f"[DEBUG] {audio_sec / 3600:.2f} h of audio in {wall:.1f}s "
+              f"({audio_sec / max(wall, 1e-9):,.0f}× realtime)")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+latency.py
+End-to-end latency of classify.py records: capture → inference → MQTT → database commit.
+
+classify.py stamps each payload with
+    ts               capture time of the window's first sample (audio clock)
+    lat_capture_ms   window fully captured → inference start (queueing, chunking)
+    lat_infer_ms     inference itself
+    t_pub            wall time just before mqtt publish
+The publishers add "t_recv" on arrival (mark_received), so raw_json keeps
+every stage. After each committed batch they feed LatencyStats, which prints
+per-stage percentiles every STATS_SEC. The MQTT stage compares the Pi's clock
+with the publisher's, so it is only as good as their NTP sync.
+
+fetch_latencies() pulls the same numbers back out of storage (commit time =
+created_at) for a proper distribution over a longer run.
+
+Usage
+-----
+python scripts/database/latency.py --since-hours 24 [--device rpi-01]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from mqtt_link import add_local_overrides, apply_local_overrides, load_config
+from storage import open_backend
+
+STAGES     = ("capture", "infer", "mqtt", "commit", "total")
+WINDOW_SEC = 0.975      # classify.py FRAME_LEN / TARGET_SR: ts + this = window fully captured
+STATS_SEC  = 60.0
+
+
+def mark_received(obj: dict) -> dict:
+    """Stamp a decoded payload with its arrival time at the publisher."""
+    obj["t_recv"] = time.time()
+    return obj
+
+
+def stages(obj: dict, t_commit: float) -> dict | None:
+    """Per-stage latencies (seconds) of one payload; None for payloads from before latency tracing."""
+    if "t_pub" not in obj or "t_recv" not in obj:
+        return None
+    return {"capture": obj.get("lat_capture_ms", 0.0) / 1e3,
+            "infer":   obj.get("lat_infer_ms", 0.0) / 1e3,
+            "mqtt":    obj["t_recv"] - obj["t_pub"],
+            "commit":  t_commit - obj["t_recv"],
+            "total":   t_commit - (obj["ts"] + WINDOW_SEC)}
+
+
+class LatencyStats:
+    """Collects stage latencies of committed payloads and prints percentiles now and then."""
+
+    def __init__(self, label: str = "", every: float = STATS_SEC):
+        self.label, self.every = label, every
+        self.samples: dict[str, list[float]] = {s: [] for s in STAGES}
+        self.last = time.monotonic()
+
+    def committed(self, payloads: list[dict], t_commit: float | None = None) -> None:
+        t_commit = time.time() if t_commit is None else t_commit
+        for obj in payloads:
+            st = stages(obj, t_commit)
+            if st is not None:
+                for k, v in st.items():
+                    self.samples[k].append(v)
+        if time.monotonic() - self.last >= self.every:
+            self.report()
+
+    def report(self) -> None:
+        self.last = time.monotonic()
+        if not self.samples["total"]:
+            return
+        parts = [f"{k} {np.percentile(v, 50) * 1e3:.0f}/{np.percentile(v, 95) * 1e3:.0f}"
+                 for k, v in self.samples.items()]
+        print(f"[DEBUG] {self.label}latency ms p50/p95 over {len(self.samples['total'])} rows: " + ", ".join(parts))
+        for v in self.samples.values():
+            v.clear()
+
+
+def fetch_latencies(store, start_ts: float, end_ts: float, device_id: str | None = None) -> dict[str, np.ndarray]:
+    """Stage latencies (seconds) of stored rows in [start_ts, end_ts]; commit time is created_at."""
+    out: dict[str, list[float]] = {s: [] for s in STAGES}
+    for raw, created in store.fetch_raw_range(start_ts, end_ts, device_id):
+        obj = json.loads(raw) if isinstance(raw, str) else raw
+        st = stages(obj, created)
+        if st is not None:
+            for k, v in st.items():
+                out[k].append(v)
+    return {k: np.asarray(v) for k, v in out.items()}
+
+
+def main(argv: list[str] | None = None) -> None:
+    p = argparse.ArgumentParser(description="Per-stage latency distribution of stored classifications.")
+    p.add_argument("--since-hours", type=float, default=24.0)
+    p.add_argument("--device", default=None)
+    add_local_overrides(p)
+    args = p.parse_args(argv)
+    cfg = apply_local_overrides(load_config(args.dbconfig), args)
+
+    store = open_backend(cfg)
+    now = time.time()
+    lat = fetch_latencies(store, now - args.since_hours * 3600, now, args.device)
+    store.close()
+    if not len(lat["total"]):
+        print("[DEBUG] no rows with latency tracing in that range")
+        return
+    print(f"{'stage':<8}{'n':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for k, v in lat.items():
+        p50, p95, p99 = np.percentile(v, [50, 95, 99]) * 1e3
+        print(f"{k:<8}{len(v):>8}{p50:>10.1f}{p95:>10.1f}{p99:>10.1f}{v.max() * 1e3:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+materialize.py
+Precompute the dashboard's /api/audio_logs responses as static, pre-compressed JSON.
+
+Every page load of the web clock asks for "last 24 h, binSeconds=30" (plus a
+pg_class estimate), which the API used to answer with a window-function query
+over the raw table. This job does that work once per interval instead:
+
+  1. Hour buckets (the rollup): for each bin size, the top-confidence row per
+     (c1_idx, ts bin) is computed one hour at a time and written as
+        output/materialized/bin<B>/<bucket_start>.json (+ .json.gz, .json.br)
+     A bucket is final once it is older than --settle seconds; final buckets
+     are loaded from disk and never queried again, so each run only re-reads
+     the newest (still-filling) bucket from the database.
+  2. Windows: for each --window HOURS:OFFSET the API's exact response body
+     ({windowStart, windowEnd, total, data}) is stitched together from the
+     buckets and written as window_h<H>_off<O>.json (+ .gz, .br). The two
+     bins the window edges cut through are re-ranked from the database over
+     their in-window part only, as the API's query does.
+  3. bin<B>/index.json lists buckets and windows with their ETags, the row
+     estimate, and when it was generated. src/server/server.js reads it and
+     serves the matching pre-compressed file (or stitches buckets) without
+     touching the database.
+
+The server must be able to read the output directory, i.e. run this next to
+the API (on the home Pi, or with --out pointing at the API's disk).
+
+Usage
+-----
+python scripts/database/materialize.py                       # loop forever, every 60 s
+python scripts/database/materialize.py --once --bin 30 --bin 300 --window 24:4 --window 24:0
+
+Dependencies: brotli (optional – without it only .gz is written)
+"""
+from __future__ import annotations
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+from storage import open_backend, summary_as_range_rows
+
+try:
+    import brotli
+    HAVE_BROTLI = True
+except ImportError:
+    HAVE_BROTLI = False
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+CONFIG_PATH  = PROJECT_ROOT / "dbconfig.json"
+OUT_DIR      = PROJECT_ROOT / "output" / "materialized"
+BUCKET_SEC   = 3600
+KEEP_BUCKETS = 72          # hours of buckets kept on disk
+
+
+# ---------- files ----------------------------------------------------------- #
+def etag_of(body: bytes) -> str:
+    return '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+
+
+def _atomic_write(path: Path, data: bytes) -> None:
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def write_precompressed(path: Path, obj) -> str:
+    """Write path (.json) plus .gz/.br siblings; compressed first so .json marks completion."""
+    body = json.dumps(obj, separators=(",", ":")).encode()
+    _atomic_write(path.with_name(path.name + ".gz"), gzip.compress(body, compresslevel=9, mtime=0))
+    if HAVE_BROTLI:
+        _atomic_write(path.with_name(path.name + ".br"), brotli.compress(body, quality=11))
+    _atomic_write(path, body)
+    return etag_of(body)
+
+
+# ---------- rollup ---------------------------------------------------------- #
+def bin_bucket(rows: list[tuple], bin_sec: int) -> list[dict]:
+    """Top row per (c1_idx, floor(ts / bin)) – the API's ROW_NUMBER() ... rn = 1 – ordered by c1_idx, bin."""
+    best: dict[tuple, tuple] = {}
+    for r in rows:   # RANGE_COLUMNS: id, ts, db, c1_idx, c1_cf, ...
+        if r[3] is None:
+            continue
+        key = (int(r[3]), int(r[1] // bin_sec))
+        cur = best.get(key)
+        if cur is None or (r[4] or 0, r[1]) > (cur[4] or 0, cur[1]):
+            best[key] = r
+    return [
+        {"id": r[0], "ts": round(r[1], 3), "db": r[2], "c1_idx": int(r[3]), "c1_cf": r[4], "bin": k[1]}
+        for k, r in sorted(best.items())
+    ]
+
+
+class Materializer:
+    def __init__(self, store, out_dir: Path, bin_sec: int, windows: list[tuple[float, float]],
+                 settle_sec: float):
+        if BUCKET_SEC % bin_sec:
+            raise ValueError(f"bin {bin_sec}s must divide the {BUCKET_SEC}s bucket")
+        self.store = store
+        self.dir = out_dir / f"bin{bin_sec}"
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.bin_sec = bin_sec
+        self.windows = windows
+        self.settle_sec = settle_sec
+        self.buckets: dict[int, dict] = {}     # start → {"rows", "etag", "final"}
+        self._load_final_buckets()
+
+    def _load_final_buckets(self) -> None:
+        idx_path = self.dir / "index.json"
+        if not idx_path.exists():
+            return
+        for b in json.loads(idx_path.read_text())["buckets"]:
+            path = self.dir / f"{b['start']}.json"
+            if b["final"] and path.exists():
+                self.buckets[b["start"]] = {"rows": json.loads(path.read_text()), "etag": b["etag"], "final": True}
+
+    def _edge_rows(self, start: float, end: float) -> list[dict]:
+        """Top rows of the bins holding *start* and *end*, ranked over start..end only (the API filters first)."""
+        rows = []
+        for b in sorted({int(start // self.bin_sec), int(end // self.bin_sec)}):
+            lo = max(start, b * self.bin_sec)
+            hi = min(end, (b + 1) * self.bin_sec - 1e-6)
+            summary = [r for r in summary_as_range_rows(self.store.fetch_summary_range(lo - BUCKET_SEC, hi))
+                       if lo <= r[1] <= hi]
+            rows += bin_bucket(self.store.fetch_range(lo, hi, model="yamnet") + summary, self.bin_sec)
+        return rows
+
+    def run_once(self, now: float | None = None) -> dict:
+        now = time.time() if now is None else now
+        t0 = time.perf_counter()
+        # buckets needed by the widest window, oldest first
+        span = max(h + off for h, off in self.windows) * 3600
+        first = int((now - span) // BUCKET_SEC) * BUCKET_SEC
+        newest = int(now // BUCKET_SEC) * BUCKET_SEC
+        queried = 0
+        for start in range(first, newest + BUCKET_SEC, BUCKET_SEC):
+            b = self.buckets.get(start)
+            if b is not None and b["final"]:
+                continue
+            end = start + BUCKET_SEC - 1e-6
+            # sensors on --summarize only have summary rows; their best window per class and interval competes
+            # with raw rows (bins shorter than the summary interval get one row per interval)
+            rows = bin_bucket(self.store.fetch_range(start, end, model="yamnet")
+                              + summary_as_range_rows(self.store.fetch_summary_range(start, end)), self.bin_sec)
+            final = now >= start + BUCKET_SEC + self.settle_sec
+            etag = write_precompressed(self.dir / f"{start}.json", rows)
+            self.buckets[start] = {"rows": rows, "etag": etag, "final": final}
+            queried += 1
+
+        # prune
+        for start in [s for s in self.buckets if s < newest - KEEP_BUCKETS * BUCKET_SEC]:
+            del self.buckets[start]
+            for suffix in (".json", ".json.gz", ".json.br"):
+                (self.dir / f"{start}{suffix}").unlink(missing_ok=True)
+
+        total = self.store.estimate_count()
+        windows = {}
+        for hours, off in self.windows:
+            end = now - off * 3600
+            start = end - hours * 3600
+            # a bucket's best row of an edge bin may lie outside the window; those bins come from _edge_rows
+            edges = {int(start // self.bin_sec), int(end // self.bin_sec)}
+            data = [r for s in sorted(self.buckets) if start - BUCKET_SEC < s <= end
+                    for r in self.buckets[s]["rows"] if start <= r["ts"] <= end and r["bin"] not in edges]
+            data += self._edge_rows(start, end)
+            data.sort(key=lambda r: (r["c1_idx"], r["bin"]))
+            name = f"window_h{hours:g}_off{off:g}.json"
+            body = {"windowStart": start, "windowEnd": end, "total": total, "data": data}
+            windows[f"h{hours:g}_off{off:g}"] = {
+                "file": name, "etag": write_precompressed(self.dir / name, body),
+                "windowStart": start, "windowEnd": end, "rows": len(data),
+            }
+
+        index = {
+            "generated_at": now,
+            "bin_seconds": self.bin_sec,
+            "bucket_seconds": BUCKET_SEC,
+            "total": total,
+            "brotli": HAVE_BROTLI,
+            "buckets": [{"start": s, "end": s + BUCKET_SEC, "rows": len(b["rows"]),
+                         "etag": b["etag"], "final": b["final"]} for s, b in sorted(self.buckets.items())],
+            "windows": windows,
+        }
+        _atomic_write(self.dir / "index.json", json.dumps(index, indent=1).encode())
+        print(f"[DEBUG] bin{self.bin_sec}: {queried} bucket(s) queried, {len(self.buckets)} held, "
+              f"{len(windows)} window(s) in {time.perf_counter() - t0:.2f}s")
+        return index
+
+
+# ---------- main ------------------------------------------------------------ #
+def parse_window(s: str) -> tuple[float, float]:
+    hours, _, off = s.partition(":")
+    return float(hours), float(off or 0)
+
+
+def main(argv: list[str] | None = None) -> None:
+    p = argparse.ArgumentParser(description="Materialize common /api/audio_logs responses to static files.")
+    p.add_argument("--dbconfig", type=Path, default=CONFIG_PATH)
+    p.add_argument("--out", type=Path, default=OUT_DIR)
+    p.add_argument("--bin", dest="bins", type=int, action="append",
+                   help="binSeconds to materialize (repeat). Default: 30, the web clock's.")
+    p.add_argument("--window", dest="windows", type=parse_window, action="append",
+                   help="HOURS:OFFSET_HOURS window (repeat). Default: 24:4, the web clock's page load.")
+    p.add_argument("--interval", type=float, default=60.0, help="Seconds between runs.")
+    p.add_argument("--settle", type=float, default=600.0,
+                   help="Seconds after a bucket closes before it is considered final.")
+    p.add_argument("--once", action="store_true")
+    args = p.parse_args(argv)
+
+    store = open_backend(json.loads(args.dbconfig.read_text()))
+    jobs = [Materializer(store, args.out, b, args.windows or [(24.0, 4.0)], args.settle)
+            for b in (args.bins or [30])]
+    if not HAVE_BROTLI:
+        print("[DEBUG] brotli not installed: writing .gz only")
+
+    while True:
+        started = time.monotonic()
+        for job in jobs:
+            try:
+                job.run_once()
+            except Exception as e:
+                print(f"[ERROR] materialize bin{job.bin_sec} failed: {e}")
+        if args.once:
+            break
+        time.sleep(max(0.0, args.interval - (time.monotonic() - started)))
+
+
+if __name__ == "__main__":
+    main()
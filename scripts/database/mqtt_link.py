@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+mqtt_link.py
+Shared MQTT/config plumbing for the multi-process publisher and the load generator.
+
+dbconfig.json keys used here:
+    hiveMQ_broker, hiveMQ_port, hiveMQ_username, hiveMQ_password, topic
+    hiveMQ_tls      (optional, default true – set false for a local mosquitto)
+
+add_local_overrides() adds --broker/--port/--no-tls/--postgres-url/--sqlite-path
+so the same scripts can be pointed at a local broker and database.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import ssl
+from pathlib import Path
+
+import paho.mqtt.client as mqtt
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+CONFIG_PATH  = PROJECT_ROOT / "dbconfig.json"
+
+
+def load_config(path: Path = CONFIG_PATH) -> dict:
+    return json.loads(Path(path).read_text()) if Path(path).exists() else {}
+
+
+def add_local_overrides(p: argparse.ArgumentParser) -> None:
+    p.add_argument("--dbconfig", type=Path, default=CONFIG_PATH)
+    p.add_argument("--broker", help="Override hiveMQ_broker (e.g. localhost).")
+    p.add_argument("--port", type=int, help="Override hiveMQ_port (e.g. 1883).")
+    p.add_argument("--no-tls", action="store_true", help="Plain TCP, no credentials (local mosquitto).")
+    p.add_argument("--topic", help="Override the base topic.")
+    p.add_argument("--postgres-url", help="Use this Postgres instead of the configured storage.")
+    p.add_argument("--sqlite-path", help="Use this sqlite file instead of the configured storage.")
+
+
+def apply_local_overrides(cfg: dict, args: argparse.Namespace) -> dict:
+    cfg = dict(cfg)
+    if args.broker:
+        cfg["hiveMQ_broker"] = args.broker
+    if args.port:
+        cfg["hiveMQ_port"] = args.port
+    if args.no_tls:
+        cfg["hiveMQ_tls"] = False
+        cfg.pop("hiveMQ_username", None)
+    if args.topic:
+        cfg["topic"] = args.topic
+    if args.postgres_url:
+        cfg["storage"], cfg["postgres_url"] = "postgres", args.postgres_url
+    if args.sqlite_path:
+        cfg["storage"], cfg["sqlite_path"] = "sqlite", args.sqlite_path
+    cfg.setdefault("hiveMQ_port", 1883)
+    cfg.setdefault("topic", "rhythmanalysis")
+    return cfg
+
+
+def make_client(cfg: dict, client_id: str = "") -> mqtt.Client:
+    """Unconnected paho client with credentials / TLS as configured."""
+    client = mqtt.Client(client_id=client_id)
+    if cfg.get("hiveMQ_username"):
+        client.username_pw_set(cfg["hiveMQ_username"], cfg.get("hiveMQ_password"))
+    if cfg.get("hiveMQ_tls", True):
+        client.tls_set(tls_version=ssl.PROTOCOL_TLSv1_2)
+    return client
+
+
+def device_from_topic(msg_topic: str, base_topic: str) -> str | None:
+    """'<base>/<device>' → device; the bare base topic (pre-multi-sensor Pis) → None."""
+    if msg_topic == base_topic:
+        return None
+    return msg_topic.rsplit("/", 1)[-1]
@@ -1,108 +1,72 @@
-import os
+import argparse
+import signal
+import sys
+import threading
 import time
-import ssl
 import json
-from datetime import datetime
-from urllib.parse import urlparse
-from pathlib import Path
 
-import paho.mqtt.client as mqtt
-import psycopg2
-import psycopg2.extras
-from psycopg2.extras import execute_values
+from mqtt_link import add_local_overrides, apply_local_overrides, device_from_topic, load_config, make_client
+from storage import open_backend
+from latency import LatencyStats, mark_received
 
+BATCH     = 20
+FLUSH_SEC = 5.0
 
-# paths
-SCRIPT_DIR   = Path(__file__).resolve().parent
-PROJECT_ROOT = SCRIPT_DIR.parents[1]
-config_path = PROJECT_ROOT / "dbconfig.json"
-# csv_path    = PROJECT_ROOT / "output" / "classifications.csv"
-
-# load config
-with open(config_path, "r") as f:
-    cfg = json.load(f)
+# config: dbconfig.json, optionally pointed at a local broker / database (bench_publisher.py does)
+parser = argparse.ArgumentParser(description="MQTT → storage publisher.")
+parser.add_argument("--batch", type=int, default=BATCH, help="Rows per insert.")
+parser.add_argument("--flush-sec", type=float, default=FLUSH_SEC, help="Max age of a partial batch.")
+parser.add_argument("--quiet", action="store_true", help="Don't print every message.")
+add_local_overrides(parser)
+args = parser.parse_args()
+cfg = apply_local_overrides(load_config(args.dbconfig), args)
 
 # MQTT settings
 broker   = cfg["hiveMQ_broker"]
 port     = cfg["hiveMQ_port"]
-username = cfg["hiveMQ_username"]
-password = cfg["hiveMQ_password"]
 topic    = cfg["topic"]
-interval = cfg["interval_seconds"]
-
-# Postgres via render
-db_url = cfg["postgres_url"]
 
-# load postgres
+# storage: Postgres via render (default) or embedded sqlite ("storage": "sqlite")
 try:
-    result = urlparse(db_url)
-    conn = psycopg2.connect(
-    dbname   = result.path.lstrip("/"),
-    user     = result.username,
-    password = result.password,
-    host     = result.hostname,
-    port     = result.port,
-    )
-    conn.autocommit = True
-    cur = conn.cursor()
-    print("[DEBUG] PostgreSQL connected OK")
+    store = open_backend(cfg)
+    store.ensure_schema()
+    print(f"[DEBUG] {store.name} storage connected OK")
 except Exception as e:
-    print("[ERROR] Could not connect to Postgres:", e)
+    print(f"[ERROR] Could not open {cfg.get('storage', 'postgres')} storage:", e)
     raise
 
-
-# Ensure table exists
-cur.execute("""
-CREATE TABLE IF NOT EXISTS audio_logs (
-  id          SERIAL PRIMARY KEY,
-  ts          TIMESTAMPTZ    NOT NULL,
-  db          DOUBLE PRECISION,
-  c1_idx      DOUBLE PRECISION,
-  c1_cf       DOUBLE PRECISION,
-  c2_idx      DOUBLE PRECISION,
-  c2_cf       DOUBLE PRECISION,
-  c3_idx      DOUBLE PRECISION,
-  c3_cf       DOUBLE PRECISION,
-  raw_json    JSONB          NOT NULL,
-  created_at  TIMESTAMPTZ    DEFAULT NOW()
-);
-""")
-
-# Prepare INSERT
-insert_sql = """
-INSERT INTO audio_logs 
-  (ts, db, c1_idx, c1_cf, c2_idx, c2_cf, c3_idx, c3_cf, raw_json)
-VALUES %s;
-"""
-
 buffer = []
 last_flush = time.time()
+buffer_lock = threading.Lock()      # paho's network thread appends, the main thread flushes on age
+latency = LatencyStats()
+
+def flush():
+    """Insert the buffered rows (call with buffer_lock held)."""
+    global last_flush
+    if buffer:
+        store.insert_payloads(buffer)
+        latency.committed(buffer)
+        buffer.clear()
+    last_flush = time.time()
 
 def on_message(client, userdata, msg):
-    global buffer, last_flush
-    print(f"[DEBUG] Got MQTT → topic={msg.topic}, payload={msg.payload[:80]}…")
-    obj = json.loads(msg.payload.decode("utf-8")) 
-    buffer.append(obj)
-
-    # flush on size or timeout
-    if len(buffer) >= 20 or time.time() - last_flush >= 5.0:
-        args = [(
-            datetime.fromtimestamp(o["ts"]),
-            o["db"], o["c1_idx"], o["c1_cf"],
-            o["c2_idx"], o["c2_cf"],
-            o["c3_idx"], o["c3_cf"],
-            json.dumps(o)
-        ) for o in buffer]
-        psycopg2.extras.execute_values(cur, insert_sql, args)
-        execute_values(cur, insert_sql, args, template=None, page_size=20)
-        conn.commit()
-        buffer.clear()
-        last_flush = time.time()
+    if not args.quiet:
+        print(f"[DEBUG] Got MQTT → topic={msg.topic}, payload={msg.payload[:80]}…")
+    obj = mark_received(json.loads(msg.payload.decode("utf-8")))
+    # older sensors publish straight to <topic>; newer ones to <topic>/<device_id>
+    if "device_id" not in obj:
+        obj["device_id"] = device_from_topic(msg.topic, topic)
+    with buffer_lock:
+        buffer.append(obj)
+        # flush on size here; on age in the main loop below, so the last partial batch isn't stranded
+        if len(buffer) >= args.batch:
+            flush()
 
 def on_connect(client, userdata, flags, rc):
     if rc == 0:
         print("[DEBUG] MQTT connected, subscribing…")
-        client.subscribe(topic, qos=1)
+        # "<topic>/#" matches <topic> itself plus every per-device sub-topic
+        client.subscribe(f"{topic}/#", qos=1)
     else:
         print("[ERROR] MQTT failed to connect, rc=", rc)
 
@@ -112,16 +76,27 @@ def on_disconnect(client, userdata, rc):
         client.reconnect()
 
 # Initialize MQTT client
-client = mqtt.Client()
-client.username_pw_set(username, password)
-client.tls_set(tls_version=ssl.PROTOCOL_TLSv1_2)
+client = make_client(cfg)
 client.enable_logger()
 client.on_connect = on_connect
 client.on_message = on_message
 client.on_disconnect = on_disconnect 
 client.connect(broker, port)
 
+client.loop_start()
+signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))    # pm2 / bench_publisher stop: flush on the way out
+
 try:
-    client.loop_forever()
+    while True:
+        time.sleep(min(1.0, args.flush_sec / 2))
+        with buffer_lock:
+            if buffer and time.time() - last_flush >= args.flush_sec:
+                flush()
+except KeyboardInterrupt:
+    pass
 except Exception as e:
-    print(f"[ERROR] MQTT loop failed: {e}")
\ No newline at end of file
+    print(f"[ERROR] publisher loop failed: {e}")
+finally:
+    client.loop_stop()
+    with buffer_lock:
+        flush()
\ No newline at end of file
@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+storage.py
+Storage backends for the audio_logs table.
+
+Two interchangeable backends share the same schema and the same small API so
+publish.py and the cleaning scripts don't care where rows end up:
+
+  • PostgresBackend – the Render (or any) PostgreSQL server, as before
+  • SQLiteBackend   – an embedded file database in WAL mode, so a single Pi can
+                      classify, ingest and query without running a server
+
+Pick one in dbconfig.json:
+
+    "storage":     "postgres" | "sqlite"      (default: postgres)
+    "sqlite_path": "output/audio_logs.sqlite" (relative to the project root)
+
+Every backend exposes
+    ensure_schema()                 create tables + indexes (and device_id/model on old tables)
+    insert_payloads(payloads)       batched insert of classifier payload dicts
+                                    (summary payloads go to <table>_summary)
+    fetch_range(start_ts, end_ts)   rows with start_ts <= ts <= end_ts, ordered by ts
+                                    (optionally for one device_id and/or model)
+    fetch_id_ts()                   (id, ts) pairs ordered by id
+    fetch_raw_range(start_ts, end_ts)
+                                    (raw_json, created_at) pairs, for latency.py
+    fetch_summary_range(start_ts, end_ts)
+                                    SUMMARY_COLUMNS rows with start_ts <= bin_start <= end_ts
+    count(device_like=None)         row count, optionally WHERE device_id LIKE ...
+    estimate_count()                cheap approximate row count (no table scan)
+    close()
+
+Payloads may carry a "device_id" (see classify.py); rows from before multi-
+sensor support have NULL there. Likewise "model" names the classifier that
+produced the row ("yamnet", or the --second-model); NULL means YAMNet.
+Second-model rows reuse YAMNet's class indices, so anything that counts
+events should pass model="yamnet" to fetch_range() (NULL rows included) or
+it sees every window the second model ran on twice.
+
+A sensor running classify.py --summarize publishes one {"kind": "summary"}
+payload per interval instead of rows (rpi/summary.py). It is stored already
+rolled up in <table>_summary: one row per (device, model, interval, class)
+with the window count, max confidence (and when / how loud), and the dB
+mean/min/max. The (device_id, model, bin_start, c1_idx) key makes a
+redelivered summary a no-op. summary_as_range_rows() turns those rows into
+fetch_range()-shaped rows for the views that only need the top row per class
+and bin.
+
+Timestamps are always handed back as Unix epoch seconds (float).
+"""
+from __future__ import annotations
+
+import json
+import sqlite3
+from pathlib import Path
+from urllib.parse import urlparse
+
+# payload keys stored in their own columns (raw_json keeps the full payload)
+PAYLOAD_COLUMNS = ("ts", "db", "c1_idx", "c1_cf", "c2_idx", "c2_cf", "c3_idx", "c3_cf")
+# column order returned by fetch_range()
+RANGE_COLUMNS = ("id",) + PAYLOAD_COLUMNS + ("device_id",)
+# column order returned by fetch_summary_range(); windows = all windows the sensor classified in the interval
+SUMMARY_COLUMNS = ("id", "bin_start", "bin_sec", "c1_idx", "n", "cf_max", "ts_max", "db_at_max",
+                   "db_mean", "db_min", "db_max", "windows", "device_id")
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+DEFAULT_SQLITE_PATH = "output/audio_logs.sqlite"
+
+
+# ---------- summaries ------------------------------------------------------- #
+def split_summaries(payloads: list[dict]) -> tuple[list[dict], list[tuple]]:
+    """(row payloads, summary rows) – each summary payload flattened to one tuple per class:
+    bin_start, bin_sec, c1_idx, n, cf_max, ts_max, db_at_max, db_mean, db_min, db_max, windows, device_id, model."""
+    rows, summ = [], []
+    for o in payloads:
+        if o.get("kind") != "summary":
+            rows.append(o)
+            continue
+        start = float(o["start"])
+        for idx, n, cf_max, dt_max, db_at_max, db_mean, db_min, db_max in o["classes"]:
+            summ.append((start, o["sec"], idx, n, cf_max, start + dt_max, db_at_max, db_mean, db_min, db_max,
+                         o["windows"], o.get("device_id"), o.get("model")))
+    return rows, summ
+
+
+def summary_as_range_rows(rows: list[tuple]) -> list[tuple]:
+    """fetch_summary_range() rows as fetch_range() rows: each class's best window of the interval.
+    Ids are negated so they can't collide with audio_logs ids."""
+    return [(-r[0], r[6], r[7], r[3], r[5], None, None, None, None, r[12]) for r in rows]
+
+
+# ---------- postgres -------------------------------------------------------- #
+class PostgresBackend:
+    """audio_logs on a PostgreSQL server (Render or a local instance)."""
+
+    name = "postgres"
+
+    def __init__(self, db_url: str, table: str = "audio_logs", page_size: int = 100):
+        import psycopg2  # only needed when this backend is actually used
+
+        result = urlparse(db_url)
+        self.conn = psycopg2.connect(
+            dbname   = result.path.lstrip("/"),
+            user     = result.username,
+            password = result.password,
+            host     = result.hostname,
+            port     = result.port,
+        )
+        self.conn.autocommit = True
+        self.cur = self.conn.cursor()
+        self.table = table
+        self.page_size = page_size
+
+    def ensure_schema(self) -> None:
+        self.cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {self.table} (
+          id          SERIAL PRIMARY KEY,
+          ts          TIMESTAMPTZ    NOT NULL,
+          db          DOUBLE PRECISION,
+          c1_idx      DOUBLE PRECISION,
+          c1_cf       DOUBLE PRECISION,
+          c2_idx      DOUBLE PRECISION,
+          c2_cf       DOUBLE PRECISION,
+          c3_idx      DOUBLE PRECISION,
+          c3_cf       DOUBLE PRECISION,
+          raw_json    JSONB          NOT NULL,
+          created_at  TIMESTAMPTZ    DEFAULT NOW(),
+          device_id   TEXT,
+          model       TEXT
+        );
+        """)
+        # tables created before multi-sensor / multi-model support
+        self.cur.execute(f"ALTER TABLE {self.table} ADD COLUMN IF NOT EXISTS device_id TEXT;")
+        self.cur.execute(f"ALTER TABLE {self.table} ADD COLUMN IF NOT EXISTS model TEXT;")
+        self.cur.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_ts_idx ON {self.table} (ts);")
+        self.cur.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_device_ts_idx ON {self.table} (device_id, ts);")
+        self.cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {self.table}_summary (
+          id          SERIAL PRIMARY KEY,
+          bin_start   TIMESTAMPTZ    NOT NULL,
+          bin_sec     INTEGER        NOT NULL,
+          c1_idx      INTEGER        NOT NULL,
+          n           INTEGER        NOT NULL,
+          cf_max      DOUBLE PRECISION,
+          ts_max      TIMESTAMPTZ,
+          db_at_max   DOUBLE PRECISION,
+          db_mean     DOUBLE PRECISION,
+          db_min      DOUBLE PRECISION,
+          db_max      DOUBLE PRECISION,
+          windows     INTEGER,
+          created_at  TIMESTAMPTZ    DEFAULT NOW(),
+          device_id   TEXT,
+          model       TEXT,
+          UNIQUE (device_id, model, bin_start, c1_idx)
+        );
+        """)
+        self.cur.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_summary_start_idx "
+                         f"ON {self.table}_summary (bin_start);")
+
+    def insert_payloads(self, payloads: list[dict]) -> int:
+        from psycopg2.extras import execute_values
+
+        payloads, summ = split_summaries(payloads)
+        if summ:
+            execute_values(
+                self.cur,
+                f"INSERT INTO {self.table}_summary (bin_start, bin_sec, c1_idx, n, cf_max, ts_max, db_at_max, "
+                "db_mean, db_min, db_max, windows, device_id, model) VALUES %s ON CONFLICT DO NOTHING;",
+                summ,
+                template="(to_timestamp(%s), %s, %s, %s, %s, to_timestamp(%s), %s, %s, %s, %s, %s, %s, %s)",
+                page_size=self.page_size,
+            )
+        if not payloads:
+            return len(summ)
+        args = [(
+            o["ts"],
+            o["db"], o["c1_idx"], o["c1_cf"],
+            o["c2_idx"], o["c2_cf"],
+            o["c3_idx"], o["c3_cf"],
+            json.dumps(o), o.get("device_id"), o.get("model")
+        ) for o in payloads]
+        # multi-row VALUES, page_size rows per statement (autocommit per statement)
+        execute_values(
+            self.cur,
+            f"INSERT INTO {self.table} "
+            "(ts, db, c1_idx, c1_cf, c2_idx, c2_cf, c3_idx, c3_cf, raw_json, device_id, model) VALUES %s;",
+            args,
+            # epoch → timestamptz in the server, independent of this host's and the session's time zone
+            template="(to_timestamp(%s), %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)",
+            page_size=self.page_size,
+        )
+        return len(args) + len(summ)
+
+    def fetch_range(self, start_ts: float, end_ts: float, device_id: str | None = None,
+                    model: str | None = None) -> list[tuple]:
+        self.cur.execute(f"""
+            SELECT id, EXTRACT(EPOCH FROM ts)::float8, db,
+                   c1_idx, c1_cf, c2_idx, c2_cf, c3_idx, c3_cf, device_id
+              FROM {self.table}
+             WHERE ts BETWEEN to_timestamp(%s) AND to_timestamp(%s)
+               AND (%s IS NULL OR device_id = %s)
+               AND (%s IS NULL OR COALESCE(model, 'yamnet') = %s)
+             ORDER BY ts
+        """, (start_ts, end_ts, device_id, device_id, model, model))
+        return self.cur.fetchall()
+
+    def fetch_id_ts(self) -> list[tuple]:
+        self.cur.execute(f"SELECT id, EXTRACT(EPOCH FROM ts)::float8 FROM {self.table} ORDER BY id ASC")
+        return self.cur.fetchall()
+
+    def fetch_raw_range(self, start_ts: float, end_ts: float, device_id: str | None = None) -> list[tuple]:
+        self.cur.execute(f"""
+            SELECT raw_json, EXTRACT(EPOCH FROM created_at)::float8
+              FROM {self.table}
+             WHERE ts BETWEEN to_timestamp(%s) AND to_timestamp(%s)
+               AND (%s IS NULL OR device_id = %s)
+             ORDER BY ts
+        """, (start_ts, end_ts, device_id, device_id))
+        return self.cur.fetchall()
+
+    def fetch_summary_range(self, start_ts: float, end_ts: float, device_id: str | None = None) -> list[tuple]:
+        self.cur.execute(f"""
+            SELECT id, EXTRACT(EPOCH FROM bin_start)::float8, bin_sec, c1_idx, n, cf_max,
+                   EXTRACT(EPOCH FROM ts_max)::float8, db_at_max, db_mean, db_min, db_max, windows, device_id
+              FROM {self.table}_summary
+             WHERE bin_start BETWEEN to_timestamp(%s) AND to_timestamp(%s)
+               AND (%s IS NULL OR device_id = %s)
+             ORDER BY bin_start, c1_idx
+        """, (start_ts, end_ts, device_id, device_id))
+        return self.cur.fetchall()
+
+    def count(self, device_like: str | None = None) -> int:
+        self.cur.execute(f"SELECT COUNT(*) FROM {self.table} WHERE (%s IS NULL OR device_id LIKE %s)",
+                         (device_like, device_like))
+        return self.cur.fetchone()[0]
+
+    def estimate_count(self) -> int:
+        # planner statistics, same as the API's total
+        self.cur.execute("SELECT reltuples FROM pg_class WHERE relname = %s", (self.table,))
+        row = self.cur.fetchone()
+        return max(int(row[0]), 0) if row else 0
+
+    def drop(self) -> None:
+        self.cur.execute(f"DROP TABLE IF EXISTS {self.table};")
+        self.cur.execute(f"DROP TABLE IF EXISTS {self.table}_summary;")
+
+    def close(self) -> None:
+        self.cur.close()
+        self.conn.close()
+
+
+# ---------- sqlite ---------------------------------------------------------- #
+class SQLiteBackend:
+    """audio_logs in an embedded SQLite file (WAL mode, ts stored as epoch seconds)."""
+
+    name = "sqlite"
+
+    def __init__(self, path: str | Path, table: str = "audio_logs"):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # the publisher's paho callback thread is the only writer; readers open their own handle
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL;")     # readers never block the writer
+        self.conn.execute("PRAGMA synchronous=NORMAL;")   # fsync at checkpoints, not every commit
+        self.conn.execute("PRAGMA temp_store=MEMORY;")
+        self.table = table
+
+    def ensure_schema(self) -> None:
+        with self.conn:
+            self.conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {self.table} (
+              id          INTEGER PRIMARY KEY,
+              ts          REAL           NOT NULL,
+              db          REAL,
+              c1_idx      REAL,
+              c1_cf       REAL,
+              c2_idx      REAL,
+              c2_cf       REAL,
+              c3_idx      REAL,
+              c3_cf       REAL,
+              raw_json    TEXT           NOT NULL,
+              created_at  REAL           DEFAULT ((julianday('now') - 2440587.5) * 86400.0),   -- epoch, sub-second
+              device_id   TEXT,
+              model       TEXT
+            );
+            """)
+            # tables created before multi-sensor / multi-model support (sqlite has no ADD COLUMN IF NOT EXISTS)
+            cols = {r[1] for r in self.conn.execute(f"PRAGMA table_info({self.table});")}
+            for col in ("device_id", "model"):
+                if col not in cols:
+                    self.conn.execute(f"ALTER TABLE {self.table} ADD COLUMN {col} TEXT;")
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_ts_idx ON {self.table} (ts);")
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_device_ts_idx ON {self.table} (device_id, ts);")
+            self.conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {self.table}_summary (
+              id          INTEGER PRIMARY KEY,
+              bin_start   REAL           NOT NULL,
+              bin_sec     INTEGER        NOT NULL,
+              c1_idx      INTEGER        NOT NULL,
+              n           INTEGER        NOT NULL,
+              cf_max      REAL,
+              ts_max      REAL,
+              db_at_max   REAL,
+              db_mean     REAL,
+              db_min      REAL,
+              db_max      REAL,
+              windows     INTEGER,
+              created_at  REAL           DEFAULT ((julianday('now') - 2440587.5) * 86400.0),
+              device_id   TEXT,
+              model       TEXT,
+              UNIQUE (device_id, model, bin_start, c1_idx)
+            );
+            """)
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_summary_start_idx "
+                              f"ON {self.table}_summary (bin_start);")
+
+    def insert_payloads(self, payloads: list[dict]) -> int:
+        payloads, summ = split_summaries(payloads)
+        if summ:
+            with self.conn:
+                self.conn.executemany(
+                    f"INSERT OR IGNORE INTO {self.table}_summary (bin_start, bin_sec, c1_idx, n, cf_max, ts_max, "
+                    "db_at_max, db_mean, db_min, db_max, windows, device_id, model) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);",
+                    summ,
+                )
+        if not payloads:
+            return len(summ)
+        args = [(
+            float(o["ts"]),
+            o["db"], o["c1_idx"], o["c1_cf"],
+            o["c2_idx"], o["c2_cf"],
+            o["c3_idx"], o["c3_cf"],
+            json.dumps(o), o.get("device_id"), o.get("model")
+        ) for o in payloads]
+        with self.conn:  # single transaction per batch
+            self.conn.executemany(
+                f"INSERT INTO {self.table} "
+                "(ts, db, c1_idx, c1_cf, c2_idx, c2_cf, c3_idx, c3_cf, raw_json, device_id, model) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);",
+                args,
+            )
+        return len(args) + len(summ)
+
+    def fetch_range(self, start_ts: float, end_ts: float, device_id: str | None = None,
+                    model: str | None = None) -> list[tuple]:
+        return self.conn.execute(f"""
+            SELECT id, ts, db, c1_idx, c1_cf, c2_idx, c2_cf, c3_idx, c3_cf, device_id
+              FROM {self.table}
+             WHERE ts BETWEEN ? AND ?
+               AND (? IS NULL OR device_id = ?)
+               AND (? IS NULL OR COALESCE(model, 'yamnet') = ?)
+             ORDER BY ts
+        """, (start_ts, end_ts, device_id, device_id, model, model)).fetchall()
+
+    def fetch_id_ts(self) -> list[tuple]:
+        return self.conn.execute(f"SELECT id, ts FROM {self.table} ORDER BY id ASC").fetchall()
+
+    def fetch_raw_range(self, start_ts: float, end_ts: float, device_id: str | None = None) -> list[tuple]:
+        return self.conn.execute(f"""
+            SELECT raw_json, created_at
+              FROM {self.table}
+             WHERE ts BETWEEN ? AND ?
+               AND (? IS NULL OR device_id = ?)
+             ORDER BY ts
+        """, (start_ts, end_ts, device_id, device_id)).fetchall()
+
+    def fetch_summary_range(self, start_ts: float, end_ts: float, device_id: str | None = None) -> list[tuple]:
+        return self.conn.execute(f"""
+            SELECT id, bin_start, bin_sec, c1_idx, n, cf_max, ts_max, db_at_max, db_mean, db_min, db_max,
+                   windows, device_id
+              FROM {self.table}_summary
+             WHERE bin_start BETWEEN ? AND ?
+               AND (? IS NULL OR device_id = ?)
+             ORDER BY bin_start, c1_idx
+        """, (start_ts, end_ts, device_id, device_id)).fetchall()
+
+    def count(self, device_like: str | None = None) -> int:
+        return self.conn.execute(f"SELECT COUNT(*) FROM {self.table} WHERE (? IS NULL OR device_id LIKE ?)",
+                                 (device_like, device_like)).fetchone()[0]
+
+    def estimate_count(self) -> int:
+        # rows are never deleted, so the rowid high-water mark is close enough
+        return self.conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {self.table}").fetchone()[0]
+
+    def drop(self) -> None:
+        with self.conn:
+            self.conn.execute(f"DROP TABLE IF EXISTS {self.table};")
+            self.conn.execute(f"DROP TABLE IF EXISTS {self.table}_summary;")
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+# ---------- factory --------------------------------------------------------- #
+def open_backend(cfg: dict, db_url: str | None = None, table: str = "audio_logs"):
+    """Open the backend named by cfg["storage"]. *db_url* overrides cfg["postgres_url"]."""
+    kind = cfg.get("storage", "postgres")
+    if kind == "sqlite":
+        path = Path(cfg.get("sqlite_path", DEFAULT_SQLITE_PATH))
+        if not path.is_absolute():
+            path = PROJECT_ROOT / path
+        return SQLiteBackend(path, table=table)
+    if kind == "postgres":
+        url = db_url or cfg.get("postgres_url")
+        if not url:
+            raise RuntimeError("storage is 'postgres' but no postgres_url was given")
+        return PostgresBackend(url, table=table)
+    raise ValueError(f"Unknown storage backend {kind!r} (expected 'postgres' or 'sqlite')")
@@ -1,13 +1,14 @@
 import asyncio
 import time
-import os
-import json
 
 import numpy as np
 import sounddevice as sd
 from scipy.signal import resample
 from panns_inference import AudioTagging
 
+from event_sink import EventSink
+from frontend import FrontEnd
+
 # — audio in —
 devices = sd.query_devices()
 input_device_name = "MacBook Pro Microphone"  # adjust as needed
@@ -37,8 +38,10 @@ FRAME_LEN = int(NATIVE_FS * FRAME_SEC)
 HOP_SEC = 0.5
 HOP_LEN = int(NATIVE_FS * HOP_SEC)
 buffer = np.zeros(FRAME_LEN, dtype='float32')
+FRONTEND = True  # hard-knee compressor on each new block, as before (False = raw audio)
 
-OUTPUT_JSON = "scripts/output/classifications_cnn14.json"
+OUTPUT_JSON = "scripts/output/classifications_cnn14.ndjson"  # one event per line, appended in batches
+sink = EventSink(OUTPUT_JSON)
 
 async def producer(q):
     loop = asyncio.get_event_loop()
@@ -55,28 +58,20 @@ async def producer(q):
 
 async def consumer(q):
     buffer = np.zeros(FRAME_LEN, dtype='float32')
-
-    def apply_compressor(audio, threshold=0.1, ratio=4.0):
-        compressed = np.copy(audio)
-        above = np.abs(audio) > threshold
-        compressed[above] = (
-            np.sign(audio[above]) *
-            (threshold + (np.abs(audio[above]) - threshold) / ratio)
-        )
-        return compressed
+    fe = FrontEnd(NATIVE_FS, hp_fc=None, knee=0, enabled=FRONTEND)   # no high-pass, like the old apply_compressor
 
     while True:
         chunk = await q.get()
-        buffer = np.roll(buffer, -len(chunk))
-        buffer[-len(chunk):] = chunk
-
-        compressed_buffer = apply_compressor(buffer)
+        # condition only the new block, shift in place
+        n = len(chunk)
+        buffer[:-n] = buffer[n:]
+        buffer[-n:] = fe.process(chunk)
 
         # resample down to 16 kHz for PANNs
         if NATIVE_FS != 16000:
-            wf = resample(compressed_buffer, 16000).astype(np.float32)
+            wf = resample(buffer, 16000).astype(np.float32)
         else:
-            wf = compressed_buffer
+            wf = buffer
 
         # run PANNs CNN14
         clipwise_output, _ = tagger.inference(wf)
@@ -91,17 +86,7 @@ async def consumer(q):
             }
             print(f"{cl['ts']:.2f}s → {cl['cl']} ({cl['cf']}%)")
 
-            # append to JSON
-            os.makedirs(os.path.dirname(OUTPUT_JSON), exist_ok=True)
-            if os.path.exists(OUTPUT_JSON):
-                with open(OUTPUT_JSON, "r+") as f:
-                    data = json.load(f)
-                    data.append(cl)
-                    f.seek(0)
-                    json.dump(data, f, indent=4)
-            else:
-                with open(OUTPUT_JSON, "w") as f:
-                    json.dump([cl], f, indent=4)
+            sink.write(cl)
 
 async def main():
     print("Starting main event loop...")
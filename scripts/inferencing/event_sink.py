@@ -0,0 +1,196 @@
+"""
+event_sink.py
+Append-only, batched event log shared by the realtime classifiers.
+
+Each event costs one list append under a lock. A background writer thread
+(or the caller, with background=False) turns the pending batch into bytes
+and appends it to the file once FLUSH_SEC has passed or MAX_EVENTS are
+waiting, then fsyncs. Nothing is ever re-read or rewritten, unlike the old
+"json.load the whole file, append one entry, json.dump indent=4" pattern.
+
+Formats
+-------
+ndjson   one compact JSON object per line (events are dicts)
+csv      one row per event (events are sequences); `header` written once for a new file.
+         An existing log with a different header is renamed to
+         <stem>.<YYYYmmdd-HHMMSS><suffix> and a fresh one started (nothing is lost:
+         analysis/sources.py CsvSource reads the rotated parts by column name).
+binary   fixed-width records of a numpy structured dtype (events are dicts or
+         tuples in field order). The dtype is stored next to the log as
+         <path>.dtype.json, so read_binary() can np.memmap the log later.
+
+Usage
+-----
+sink = EventSink("output/classifications_yamnet.ndjson")
+sink.write({"ts": time.time(), "cl": "Speech", "cf": 61.2})
+...
+sink.close()        # or `with EventSink(...) as sink:`
+"""
+from __future__ import annotations
+
+import atexit
+import csv
+import io
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+FLUSH_SEC  = 5.0
+MAX_EVENTS = 256
+FORMATS    = ("ndjson", "csv", "binary")
+
+
+class EventSink:
+    def __init__(self, path: str | Path, fmt: str = "ndjson", *, header: list[str] | None = None,
+                 dtype: np.dtype | list | None = None, flush_sec: float = FLUSH_SEC,
+                 max_events: int = MAX_EVENTS, background: bool = True, fsync: bool = True):
+        if fmt not in FORMATS:
+            raise ValueError(f"fmt must be one of {FORMATS}, not {fmt!r}")
+        if fmt == "binary" and dtype is None:
+            raise ValueError("binary sinks need a structured dtype")
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.fmt = fmt
+        self.dtype = np.dtype(dtype) if dtype is not None else None
+        self.flush_sec, self.max_events, self.fsync = flush_sec, max_events, fsync
+        self.written = 0
+
+        if fmt == "csv" and header:
+            self._check_header(header)
+        if fmt == "binary":
+            self._check_dtype()
+
+        self._pending: list = []
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()          # one writer at a time (thread vs. explicit flush)
+        self._last_flush = time.monotonic()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = None
+        if background:
+            self._thread = threading.Thread(target=self._run, name=f"sink:{self.path.name}", daemon=True)
+            self._thread.start()
+        atexit.register(self.close)
+
+    # ---------- producer side ------------------------------------------------ #
+    def write(self, event) -> None:
+        """Queue one event; constant time (the flush itself happens in batches)."""
+        with self._lock:
+            self._pending.append(event)
+            n = len(self._pending)
+        if n >= self.max_events:
+            if self._thread is not None:
+                self._wake.set()
+            else:
+                self.flush()
+        elif self._thread is None and time.monotonic() - self._last_flush >= self.flush_sec:
+            self.flush()
+
+    def write_many(self, events) -> None:
+        for e in events:
+            self.write(e)
+
+    # ---------- writer side -------------------------------------------------- #
+    def _run(self) -> None:
+        while not self._closed:
+            self._wake.wait(self.flush_sec)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:             # disk errors keep the batch for the next flush
+                print(f"[ERROR] event sink {self.path}: {e}")
+
+    def flush(self) -> int:
+        """Append everything pending to the file now. Returns the number of events written."""
+        with self._io_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            self._last_flush = time.monotonic()
+            if not batch:
+                return 0
+            data = self._encode(batch)             # a malformed event fails here and its batch is dropped
+            try:
+                with open(self.path, "ab") as f:
+                    f.write(data)
+                    f.flush()
+                    if self.fsync:
+                        os.fsync(f.fileno())
+            except OSError:
+                with self._lock:                   # put it back in front, order preserved
+                    self._pending[:0] = batch
+                raise
+            self.written += len(batch)
+            return len(batch)
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is not None:
+            self._wake.set()
+            self._thread.join(timeout=max(1.0, self.flush_sec))
+        self.flush()
+        atexit.unregister(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ---------- encoding ----------------------------------------------------- #
+    def _encode(self, batch: list) -> bytes:
+        if self.fmt == "ndjson":
+            return "".join(json.dumps(e, separators=(",", ":")) + "\n" for e in batch).encode()
+        if self.fmt == "csv":
+            buf = io.StringIO()
+            csv.writer(buf).writerows(batch)
+            return buf.getvalue().encode()
+        names = self.dtype.names
+        rows = [tuple(e[n] for n in names) if isinstance(e, dict) else tuple(e) for e in batch]
+        return np.array(rows, dtype=self.dtype).tobytes()
+
+    def _check_header(self, header: list[str]) -> None:
+        """Start a new CSV with *header*, rotating an old one whose columns differ."""
+        if self.path.exists() and self.path.stat().st_size:
+            with open(self.path, newline="") as f:
+                old = next(csv.reader(f), None)
+            if old == list(header):
+                return
+            stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.path.stat().st_mtime))
+            rotated = self.path.with_name(f"{self.path.stem}.{stamp}{self.path.suffix}")
+            os.replace(self.path, rotated)
+            print(f"[DEBUG] {self.path} had different columns, moved to {rotated.name}")
+        with open(self.path, "w", newline="") as f:
+            csv.writer(f).writerow(header)
+
+    def _check_dtype(self) -> None:
+        """Record the dtype next to a new log; refuse to append a different layout to an old one."""
+        side = self.path.with_name(self.path.name + ".dtype.json")
+        descr = json.loads(json.dumps(self.dtype.descr))
+        if side.exists():
+            if json.loads(side.read_text()) != descr:
+                raise ValueError(f"{self.path} was written with a different dtype ({side})")
+        else:
+            side.write_text(json.dumps(descr))
+
+
+def read_binary(path: str | Path) -> np.ndarray:
+    """Memory-map a binary sink's log as a structured array."""
+    path = Path(path)
+    descr = json.loads(path.with_name(path.name + ".dtype.json").read_text())
+    dtype = np.dtype([tuple(d) for d in descr])
+    n = path.stat().st_size // dtype.itemsize if path.exists() else 0
+    return np.memmap(path, dtype=dtype, mode="r", shape=(n,)) if n else np.zeros(0, dtype)
+
+
+def read_ndjson(path: str | Path):
+    """Iterate a ndjson sink's events."""
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
@@ -0,0 +1,230 @@
+"""
+frontend.py
+Stateful DSP front end shared by the realtime classifiers.
+
+Every new audio block goes through the front end exactly once, before it is
+written into the rolling window. Filter state carries from block to block, so
+the result matches one pass over the whole recording. The old scripts
+instead re-ran a per-sample Python high-pass and a mask-based compressor over
+the whole window on every hop, and restarted the filter each time.
+
+  FrontEnd   high-pass (one-pole, via lfilter) or band-pass (Butterworth SOS),
+             then a soft-knee compressor – both vectorized and reusing buffers.
+             `enabled = False` turns it into a pass-through.
+  Meter      RMS / peak dBFS of the latest block, plus LUFS-style momentary
+             (400 ms) and short-term (3 s) loudness through a K-weighting filter.
+
+Usage
+-----
+fe    = FrontEnd(fs=48_000, hp_fc=100)
+meter = Meter(fs=48_000)
+for block in stream:
+    meter.update(block)            # meter the raw signal ...
+    y = fe.process(block)          # ... classify the conditioned one
+    print(meter.rms_db, meter.lufs_m)
+
+python scripts/inferencing/frontend.py --benchmark     # per-block cost on this machine
+"""
+from __future__ import annotations
+
+import argparse
+import math
+import platform
+import time
+from collections import deque
+
+import numpy as np
+from scipy.signal import butter, lfilter, sosfilt, sosfilt_zi
+
+HP_FC      = 100.0     # Hz, removes traffic rumble / wind
+COMP_THR   = 0.1       # linear amplitude where compression starts
+COMP_RATIO = 4.0
+COMP_KNEE  = 0.04      # knee width (linear amplitude) centred on COMP_THR; 0 = hard knee
+
+
+class FrontEnd:
+    def __init__(self, fs: int, hp_fc: float | None = HP_FC, band: tuple[float, float] | None = None,
+                 thr: float = COMP_THR, ratio: float = COMP_RATIO, knee: float = COMP_KNEE,
+                 compress: bool = True, enabled: bool = True):
+        self.fs, self.enabled, self.compress = fs, enabled, compress
+        self.thr, self.knee = thr, knee
+        self.slope = 1.0 - 1.0 / ratio           # gain reduction per unit above the knee
+        self.band = band
+        if band is not None:
+            self.sos = butter(2, band, btype="bandpass", fs=fs, output="sos").astype(np.float32)
+            self.zi  = (sosfilt_zi(self.sos) * 0).astype(np.float32)
+        elif hp_fc:
+            # y[n] = α·y[n-1] + x[n] - x[n-1] – the old hipass(), as a recursive filter
+            alpha  = math.exp(-2.0 * math.pi * hp_fc / fs)
+            self.b = np.array([1.0, -1.0], dtype=np.float32)
+            self.a = np.array([1.0, -alpha], dtype=np.float32)
+            self.zi = np.zeros(1, dtype=np.float32)
+        else:
+            self.b = None
+            self.zi = None                          # compressor only: nothing to reset
+        self._mag = self._red = np.zeros(0, dtype=np.float32)
+
+    def reset(self) -> None:
+        """Forget the filter state (e.g. after a gap in the stream)."""
+        if self.zi is not None:
+            self.zi[:] = 0
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        """Filter + compress one new block; state carries to the next call.
+
+        Returns a new array, or *block* itself when the front end is disabled (no copy on that path).
+        """
+        if not self.enabled:
+            return block
+        x = np.asarray(block, dtype=np.float32)
+        if self.band is not None:
+            y, self.zi = sosfilt(self.sos, x, zi=self.zi)
+        elif self.b is not None:
+            y, self.zi = lfilter(self.b, self.a, x, zi=self.zi)
+        else:
+            y = x.copy()
+        if self.compress:
+            self._compress(y)
+        return y
+
+    def _compress(self, y: np.ndarray) -> None:
+        """Soft-knee compressor, in place.
+
+        Below thr - knee/2 nothing changes; above thr + knee/2 it is the old
+        thr + (|x| - thr) / ratio; in between the gain reduction grows
+        quadratically so the curve and its slope are continuous.
+        """
+        n = len(y)
+        if len(self._mag) < n:
+            self._mag = np.empty(n, dtype=np.float32)
+            self._red = np.empty(n, dtype=np.float32)
+        mag, red = self._mag[:n], self._red[:n]
+        np.abs(y, out=mag)
+        k = self.knee
+        if k > 0:
+            np.subtract(mag, self.thr - k / 2, out=red)
+            np.clip(red, 0.0, k, out=red)
+            np.square(red, out=red)
+            red *= self.slope / (2 * k)
+            np.subtract(mag, self.thr + k / 2, out=mag)
+            np.maximum(mag, 0.0, out=mag)
+            mag *= self.slope
+            red += mag                              # total reduction
+        else:
+            np.subtract(mag, self.thr, out=red)
+            np.maximum(red, 0.0, out=red)
+            red *= self.slope
+        np.copysign(red, y, out=red)
+        y -= red
+
+
+# ---------- metering ---------------------------------------------------------- #
+def k_weighting(fs: int) -> np.ndarray:
+    """BS.1770 K-weighting (high shelf + RLB high-pass) as two SOS sections for any fs."""
+    def shelf(fc=1500.0, gain_db=4.0, q=1 / math.sqrt(2)):
+        A, w0 = 10 ** (gain_db / 40), 2 * math.pi * fc / fs
+        c, sa = math.cos(w0), 2 * math.sqrt(A) * math.sin(w0) / (2 * q)
+        b = [A * ((A + 1) + (A - 1) * c + sa), -2 * A * ((A - 1) + (A + 1) * c), A * ((A + 1) + (A - 1) * c - sa)]
+        a = [(A + 1) - (A - 1) * c + sa, 2 * ((A - 1) - (A + 1) * c), (A + 1) - (A - 1) * c - sa]
+        return [v / a[0] for v in b] + [v / a[0] for v in a]
+
+    def highpass(fc=38.0, q=0.5):
+        w0 = 2 * math.pi * fc / fs
+        al, c = math.sin(w0) / (2 * q), math.cos(w0)
+        b = [(1 + c) / 2, -(1 + c), (1 + c) / 2]
+        a = [1 + al, -2 * c, 1 - al]
+        return [v / a[0] for v in b] + [v / a[0] for v in a]
+
+    return np.array([shelf(), highpass()])
+
+
+class Meter:
+    """Levels of the most recent block; loudness over the last 400 ms / 3 s of blocks."""
+
+    def __init__(self, fs: int, momentary_sec: float = 0.4, short_sec: float = 3.0):
+        self.fs = fs
+        self.sos = k_weighting(fs)
+        self.zi  = sosfilt_zi(self.sos) * 0
+        self.momentary_sec, self.short_sec = momentary_sec, short_sec
+        self.hist: deque = deque()          # (n_samples, sum of K-weighted squares) per block
+        self.rms_db = self.peak_db = self.lufs_m = self.lufs_s = -120.0
+
+    def update(self, block: np.ndarray) -> float:
+        """Meter one new block; returns its RMS level in dBFS."""
+        x = np.asarray(block, dtype=np.float64)
+        ms = float(np.dot(x, x)) / max(len(x), 1)
+        self.rms_db  = 10.0 * math.log10(ms + 1e-24)
+        self.peak_db = 20.0 * math.log10(float(np.max(np.abs(x), initial=0.0)) + 1e-12)
+        kw, self.zi = sosfilt(self.sos, x, zi=self.zi)
+        self.hist.append((len(x), float(np.dot(kw, kw))))
+        while sum(n for n, _ in self.hist) - self.hist[0][0] >= self.short_sec * self.fs:
+            self.hist.popleft()
+        self.lufs_s = self._loudness(self.short_sec)
+        self.lufs_m = self._loudness(self.momentary_sec)
+        return self.rms_db
+
+    def _loudness(self, sec: float) -> float:
+        """-0.691 + 10·log10(mean square) over the newest blocks covering at least *sec*."""
+        n = s = 0
+        for bn, bs in reversed(self.hist):
+            n, s = n + bn, s + bs
+            if n >= sec * self.fs:
+                break
+        return -0.691 + 10.0 * math.log10(s / max(n, 1) + 1e-24)
+
+
+# ---------- benchmark --------------------------------------------------------- #
+def _old_hipass(x, fs, fc=HP_FC):
+    alpha = np.exp(-2.0 * np.pi * fc / fs)
+    y = np.empty_like(x)
+    y[0] = x[0]
+    for n in range(1, len(x)):
+        y[n] = alpha * y[n-1] + x[n] - x[n-1]
+    return y
+
+
+def _old_compressor(audio, thr=COMP_THR, ratio=COMP_RATIO):
+    a = np.copy(audio)
+    mask = np.abs(a) > thr
+    a[mask] = np.sign(a[mask]) * (thr + (np.abs(a[mask]) - thr) / ratio)
+    return a
+
+
+def _time(fn, reps: int) -> float:
+    fn()
+    t0 = time.perf_counter()
+    for _ in range(reps):
+        fn()
+    return (time.perf_counter() - t0) / reps * 1e3
+
+
+def benchmark(hop_sec: float = 0.5, frame_sec: float = 1.0, reps: int = 50) -> None:
+    print(f"[DEBUG] {platform.machine()} / {platform.python_version()} / numpy {np.__version__}")
+    print(f"{'fs':>6}  {'stage':<34}{'ms/block':>9}{'x realtime':>12}")
+    rng = np.random.default_rng(0)
+    for fs in (16_000, 44_100, 48_000):
+        hop, frame = int(hop_sec * fs), int(frame_sec * fs)
+        block = (0.2 * rng.standard_normal(hop)).astype(np.float32)
+        window = (0.2 * rng.standard_normal(frame)).astype(np.float32)
+        fe, band, meter = FrontEnd(fs), FrontEnd(fs, band=(100.0, 7_000.0)), Meter(fs)
+        rows = [
+            ("old: compressor over window",           lambda: _old_compressor(window), reps),
+            ("old: compressor + hipass over window",  lambda: _old_hipass(_old_compressor(window), fs), 3),
+            ("new: high-pass + compressor, block",    lambda: fe.process(block), reps),
+            ("new: band-pass + compressor, block",    lambda: band.process(block), reps),
+            ("new: meter (rms/peak/LUFS), block",     lambda: meter.update(block), reps),
+        ]
+        for name, fn, n in rows:
+            ms = _time(fn, n)
+            print(f"{fs:>6}  {name:<34}{ms:>9.3f}{hop_sec * 1e3 / ms:>11.0f}x")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--benchmark", action="store_true", help="time old vs. new per-block cost")
+    ap.add_argument("--hop", type=float, default=0.5, help="block length in seconds")
+    args = ap.parse_args()
+    if args.benchmark:
+        benchmark(args.hop)
+    else:
+        ap.print_help()
@@ -1,47 +1,336 @@
+"""
+yamnet_posthoc.py
+Classify a directory of field recordings (<unix-start-time>.wav) with YAMNet.
+
+Each file is resampled to 16 kHz (polyphase) and scored by YAMNet in a few
+large calls – BLOCK_PATCHES patches per call, aligned to YAMNet's own 0.48 s
+patch grid – instead of one tiny call per 0.5 s frame. The per-frame events
+(FRAME_SEC window every HOP_SEC, mean of two consecutive patches, top class
+>= THRESHOLD) are then derived from the patch scores with array indexing.
+Frames pick the nearest patch pair, so a frame's patches start at most
+0.24 s from where the old frame-by-frame loop placed them.
+
+Memory stays flat however long the recording is:
+  • the WAV is memory-mapped and resampled RESAMPLE_SEC at a time, with
+    enough input overlap on each side that the chunks join seamlessly
+  • 16 kHz audio is handed to the model one block at a time, carrying the
+    patch overlap over to the next block
+  • patch scores go straight into a memory-mapped .npy, and events are
+    derived from it in slices and written one JSON object per line to
+    <output>/<stem>.ndjson
+  • merged_classifications.(ndjson|json) is a streaming k-way merge of the
+    per-file logs by timestamp
+
+Re-runs only do the work that changed:
+  • <output>/cache/scores/<key>.npy holds each file's patch-score matrix
+    (float16), keyed by the WAV's sha256 + the model fingerprint + the patch
+    geometry. It doesn't depend on threshold/frame/hop, so changing those
+    re-derives events from the cache without loading the model.
+  • <output>/manifest.json records, per WAV, its size/mtime/sha256, score
+    key and the event config its .ndjson was made with. Files whose
+    size+mtime and event config are unchanged are skipped without even
+    being hashed. The manifest is saved as files finish, and every output
+    is written to a temp name and renamed, so an interrupted run resumes
+    where it stopped. --force ignores both.
+
+Files are spread over a process pool; a worker loads the model the first
+time it meets a file that isn't cached.
+
+Usage
+-----
+python scripts/inferencing/yamnet_posthoc.py --input /path/to/wavs --output /path/to/out --workers 4
+python scripts/inferencing/yamnet_posthoc.py --threshold 0.5     # re-derives events from cached scores
+python scripts/inferencing/yamnet_posthoc.py --format json       # merged file as a JSON array
+"""
 import os
+import sys
 import json
 import csv
+import heapq
+import hashlib
+import argparse
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from math import gcd
+from pathlib import Path
+
 import numpy as np
-import tensorflow as tf
-import tensorflow_hub as hub
-from scipy.signal import resample
 from scipy.io import wavfile
 import time
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))  # scripts/
+from cleaning.processAudio_yamnet import PolyStream
+
 # — USER CONFIG —
 MODEL_PATH = "/Users/matthewheaton/Documents/GitHub/natural-synthetic/models/mjh/model"
-if os.path.exists(MODEL_PATH):
-    yamnet = tf.saved_model.load(MODEL_PATH)  # Use tf.saved_model.load for SavedModel format
-    # print(f"YAMNet model loaded locally in {time.time() - start_time:.2f} seconds.")
-else:
-    print("Local model not found. Downloading from TensorFlow Hub...")
-    yamnet = hub.load('https://tfhub.dev/google/yamnet/1')
-    tf.saved_model.save(yamnet, MODEL_PATH)  # Save in SavedModel format
-    # print(f"YAMNet model downloaded and saved locally in {time.time() - start_time:.2f} seconds.")
 INPUT_DIR = "/Users/matthewheaton/Documents/GitHub/natural-synthetic/samples/zoom_20250430"
-OUTPUT_DIR = "/Users/matthewheaton/Documents/GitHub/natural-synthetic/output/classifications_zoom_20250430.json"
+OUTPUT_DIR = "/Users/matthewheaton/Documents/GitHub/natural-synthetic/output/classifications_zoom_20250430"
 THRESHOLD = 0.333
 FRAME_SEC = 1.0
 HOP_SEC   = 0.5
+WORKERS   = max(1, (os.cpu_count() or 2) // 2)
+
+# — YAMNet geometry (16 kHz) —
+SR            = 16_000
+PATCH_HOP     = 7_680      # 0.48 s
+PATCH_LEN     = 15_600     # 0.96 s patch + STFT window - hop = 0.975 s
+BLOCK_PATCHES = 1_024      # patches per model call (~8 min of audio)
+RESAMPLE_SEC  = 10         # source audio resampled per step
+EVENT_FRAMES  = 65_536     # frames averaged per slice when deriving events
+
+# — cache —
+SCORES_VERSION = 1         # bump when resampling/scoring changes what ends up in the matrix
+SCORE_DTYPE    = np.float16
+HASH_CHUNK     = 1 << 20
+MANIFEST_SAVE_SEC = 10
+
+# — per-worker state —
+yamnet = None
+class_names = None
+threads = 1
+
+
+def load_model():
+    """Load the SavedModel (downloading + caching it from TF Hub the first time)."""
+    import tensorflow as tf
+
+    if os.path.exists(MODEL_PATH):
+        return tf.saved_model.load(MODEL_PATH)  # Use tf.saved_model.load for SavedModel format
+    import tensorflow_hub as hub
+
+    print("Local model not found. Downloading from TensorFlow Hub...")
+    model = hub.load('https://tfhub.dev/google/yamnet/1')
+    tf.saved_model.save(model, MODEL_PATH)  # Save in SavedModel format
+    return model
+
+
+def model_fingerprint():
+    """Identifies the weights: hash of saved_model.pb + variables index, or the Hub handle if not saved yet."""
+    h = hashlib.sha256()
+    for rel in ("saved_model.pb", os.path.join("variables", "variables.index")):
+        path = os.path.join(MODEL_PATH, rel)
+        if os.path.exists(path):
+            h.update(file_sha256(path).encode())
+    return h.hexdigest()[:16] if os.path.exists(MODEL_PATH) else "hub-yamnet-1"
+
+
+def init_worker(threads_per_worker):
+    """Pool initializer: the model itself is only loaded once a file needs scoring."""
+    global threads
+    threads = threads_per_worker
+
+
+def ensure_model():
+    global yamnet
+    if yamnet is None:
+        import tensorflow as tf
+
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+        yamnet = load_model()
+
+
+def load_class_names(cache_dir, model_fp):
+    """Class display names, cached per model so cache-only runs never touch TensorFlow."""
+    global class_names
+    if class_names is not None:
+        return class_names
+    path = os.path.join(cache_dir, f"class_names_{model_fp}.json")
+    if os.path.exists(path):
+        with open(path) as f:
+            class_names = json.load(f)
+        return class_names
+    import tensorflow as tf
+
+    ensure_model()
+    class_map_path = yamnet.class_map_path().numpy().decode("utf-8")
+    with tf.io.gfile.GFile(class_map_path) as f:
+        class_names = [r["display_name"] for r in csv.DictReader(f)]
+    atomic_write_json(path, class_names)
+    return class_names
+
+
+# ---------- cache + manifest ------------------------------------------------- #
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_CHUNK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def scores_key(sha, model_fp):
+    geom = f"v{SCORES_VERSION}|sr{SR}|hop{PATCH_HOP}|len{PATCH_LEN}|{np.dtype(SCORE_DTYPE).name}"
+    return hashlib.sha256(f"{sha}|{model_fp}|{geom}".encode()).hexdigest()[:24]
+
+
+def event_config(threshold):
+    """Everything besides the scores that decides a file's events."""
+    return {"threshold": threshold, "frame_sec": FRAME_SEC, "hop_sec": HOP_SEC}
+
+
+def atomic_write_json(path, obj, **kw):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(obj, f, **kw)
+    os.replace(tmp, path)
+
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)["files"]
+    except (ValueError, KeyError) as e:
+        print(f"[ERROR] unreadable manifest {path} ({e}), starting fresh")
+        return {}
+
+
+def is_current(entry, st, model_fp, ev_cfg, out_dir):
+    """True if a manifest entry still describes this file + config and its log exists."""
+    return (entry is not None
+            and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns
+            and entry["model"] == model_fp and entry["events"] == ev_cfg
+            and os.path.exists(os.path.join(out_dir, entry["log"])))
 
-# — LOAD MODEL & CLASS MAP —
-yamnet = tf.saved_model.load(MODEL_PATH)
-class_map_path = yamnet.class_map_path().numpy().decode("utf-8")
-with tf.io.gfile.GFile(class_map_path) as f:
-    class_names = [r["display_name"] for r in csv.DictReader(f)]
-
-def process_file(wav_path):
-    """Classify one WAV file and return list of events."""
-    sr, audio = wavfile.read(wav_path)  # audio may be int16 or float32
-    # normalize to float32 in [-1,1]
-    if audio.dtype.kind == "i":
-        audio = audio.astype(np.float32) / np.iinfo(audio.dtype).max
-    elif audio.dtype.kind == "u":  # unlikely for WAV
-        audio = (audio.astype(np.float32) - 32768) / 32768
-    audio = audio.flatten()
-
-    frame_len = int(sr * FRAME_SEC)
-    hop_len   = int(sr * HOP_SEC)
+
+# ---------- streaming audio -------------------------------------------------- #
+def open_wav(wav_path):
+    """(sr, samples) with samples memory-mapped when the format allows it."""
+    try:
+        return wavfile.read(wav_path, mmap=True)
+    except ValueError:  # e.g. 24-bit PCM can't be mapped
+        return wavfile.read(wav_path)
+
+
+def to_float(x):
+    """Slice of raw WAV samples → mono float32 in [-1, 1]."""
+    if x.dtype.kind == "i":
+        x = x.astype(np.float32) / np.iinfo(x.dtype).max
+    elif x.dtype.kind == "u":  # unlikely for WAV
+        x = (x.astype(np.float32) - 32768) / 32768
+    if x.ndim > 1:
+        x = x.mean(axis=1)
+    return x.astype(np.float32, copy=False)
+
+
+def iter_16k(samples, sr):
+    """
+    Yield consecutive 16 kHz chunks of the whole file, RESAMPLE_SEC of input
+    at a time. Resampling is processAudio_yamnet's PolyStream, so the
+    concatenation equals one resample_poly over the full file.
+    """
+    n_in = samples.shape[0]
+    step = RESAMPLE_SEC * sr
+    if sr == SR:
+        for a in range(0, n_in, step):
+            yield to_float(samples[a:a + step])
+        return
+    rs = PolyStream(sr, SR, step_sec=RESAMPLE_SEC)
+    for a in range(0, n_in, step):
+        y = rs.resample_chunk(to_float(samples[a:a + step]), last=a + step >= n_in)
+        if y.size:
+            yield y
+
+
+def n_16k(n_in, sr):
+    g = gcd(sr, SR)
+    return -(-n_in * (SR // g) // (sr // g))
+
+
+def iter_patch_blocks(samples, sr):
+    """Yield (first_patch, scores) per model call, carrying the patch overlap between blocks."""
+    import tensorflow as tf
+
+    total = n_16k(samples.shape[0], sr)
+    # YAMNet zero-pads the tail to a whole patch, so count the partial one too
+    n_patches = 1 + -(-max(0, total - PATCH_LEN) // PATCH_HOP)
+    buf = np.zeros(0, dtype=np.float32)
+    chunks = iter_16k(samples, sr)
+    for p0 in range(0, n_patches, BLOCK_PATCHES):
+        n = min(BLOCK_PATCHES, n_patches - p0)
+        need = (n - 1) * PATCH_HOP + PATCH_LEN
+        while buf.size < need:
+            nxt = next(chunks, None)
+            if nxt is None:
+                break
+            buf = np.concatenate((buf, nxt))
+        scores, _, _ = yamnet(tf.constant(buf[:need]))
+        yield p0, scores.numpy()[:n]
+        buf = buf[n * PATCH_HOP:]           # next block starts n patches later
+
+
+def frame_index(n_samples_16k, n_patches):
+    """
+    Frame starts (16 kHz samples) and the nearest patch pair (j0, j1) for every
+    FRAME_SEC frame every HOP_SEC – like the two patches YAMNet produced for
+    each padded 1 s frame before.
+    """
+    frame_len = int(SR * FRAME_SEC)
+    hop_len   = int(SR * HOP_SEC)
+    n_frames = 1 + (n_samples_16k - frame_len) // hop_len if n_samples_16k >= frame_len else 0
+    starts = np.arange(n_frames) * hop_len
+    last = n_patches - 1
+    j0 = np.minimum(np.rint(starts / PATCH_HOP).astype(np.int64), last)
+    j1 = np.minimum(j0 + 1, last)
+    return starts, j0, j1
+
+
+def events_from_scores(starts, avg, start_time, threshold=THRESHOLD):
+    """Thresholded top-1 events; ts is the frame centre."""
+    idx = np.argmax(avg, axis=1)
+    conf = avg[np.arange(avg.shape[0]), idx]
+    keep = np.flatnonzero(conf >= threshold)
+    centre = start_time + starts[keep] / SR + FRAME_SEC / 2
+    return [
+        {"ts": round(float(ts), 3), "cl": class_names[i], "cf": round(float(c * 100), 1)}
+        for ts, i, c in zip(centre, idx[keep], conf[keep])
+    ]
+
+
+def score_to_cache(wav_path, npy_path):
+    """Run YAMNet over a WAV, writing patch scores block by block into a memory-mapped .npy."""
+    ensure_model()
+    sr, samples = open_wav(wav_path)
+    total = n_16k(samples.shape[0], sr)
+    n_patches = 1 + -(-max(0, total - PATCH_LEN) // PATCH_HOP)
+    # per-process name: workers or runs scoring identical WAVs (same key) must not share one
+    tmp_path = f"{npy_path}.{os.getpid()}.part"
+    mm = None
+    try:
+        for p0, sc in iter_patch_blocks(samples, sr):
+            if mm is None:
+                mm = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=SCORE_DTYPE,
+                                               shape=(n_patches, sc.shape[1]))
+            mm[p0:p0 + sc.shape[0]] = sc
+        mm.flush()
+        del mm
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    # sidecar first: a .npy without one is never trusted
+    atomic_write_json(npy_path[:-4] + ".json", {"n_samples_16k": int(total), "source_sr": int(sr)})
+    os.replace(tmp_path, npy_path)
+
+
+def iter_events(scores, n_samples_16k, start_time, threshold):
+    """Events for one file from its (memory-mapped) score matrix, EVENT_FRAMES frames at a time."""
+    starts, j0, j1 = frame_index(n_samples_16k, scores.shape[0])
+    for a in range(0, starts.size, EVENT_FRAMES):
+        sl = slice(a, a + EVENT_FRAMES)
+        lo, hi = int(j0[sl][0]), int(j1[sl][-1]) + 1
+        rows = np.asarray(scores[lo:hi], dtype=np.float32)
+        avg = 0.5 * (rows[j0[sl] - lo] + rows[j1[sl] - lo])
+        yield from events_from_scores(starts[sl], avg, start_time, threshold)
+
+
+def process_file(wav_path, out_dir, cache_dir, model_fp, threshold, sha=None, rescore=False):
+    """
+    Bring one WAV's <stem>.ndjson up to date, scoring it only if its score
+    matrix isn't cached (or *rescore*). Returns its manifest entry.
+    """
     # parse filename as UNIX time (seconds)
     basename = os.path.splitext(os.path.basename(wav_path))[0]
     try:
@@ -49,56 +338,144 @@ def process_file(wav_path):
     except ValueError:
         raise ValueError(f"Filename {basename} is not a valid Unix timestamp")
 
-    events = []
-    # slide over with hop
-    for i in range(0, len(audio) - frame_len + 1, hop_len):
-        frame = audio[i : i + frame_len]
-        # compressor if desired (reuse your apply_compressor here)
-        # ----- optional compressor -----
-        # frame = apply_compressor(frame)
-
-        # resample to 16 kHz
-        if sr != 16000:
-            wf = resample(frame, int(16000 * FRAME_SEC)).astype(np.float32)
-        else:
-            wf = frame.astype(np.float32)
-
-        # run YAMNet
-        scores, _, _ = yamnet(tf.constant(wf))
-        avg = tf.reduce_mean(scores, axis=0).numpy()
-        idx = np.argmax(avg)
-        confidence = avg[idx]
-        if confidence >= THRESHOLD:
-            # center of this frame in seconds
-            frame_center = (i / sr) + (FRAME_SEC / 2)
-            ts = start_time + frame_center
-            events.append({
-                "ts": round(ts, 3),
-                "cl": class_names[idx],
-                "cf": round(float(confidence * 100), 1)
-            })
-
-    return events
+    st = os.stat(wav_path)
+    sha = sha or file_sha256(wav_path)
+    key = scores_key(sha, model_fp)
+    npy_path = os.path.join(cache_dir, "scores", f"{key}.npy")
+    meta_path = npy_path[:-4] + ".json"
+    scored = rescore or not (os.path.exists(npy_path) and os.path.exists(meta_path))
+    if scored:
+        score_to_cache(wav_path, npy_path)
+    with open(meta_path) as f:
+        n_samples_16k = json.load(f)["n_samples_16k"]
+
+    load_class_names(cache_dir, model_fp)
+    scores = np.load(npy_path, mmap_mode="r")
+    log = f"{basename}.ndjson"
+    out_path = os.path.join(out_dir, log)
+    tmp_path = f"{out_path}.{os.getpid()}.part"    # never leave a truncated log behind
+    n = 0
+    try:
+        with open(tmp_path, "w") as out_f:
+            for ev in iter_events(scores, n_samples_16k, start_time, threshold):
+                out_f.write(json.dumps(ev, separators=(",", ":")) + "\n")
+                n += 1
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, out_path)
+    return {
+        "size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": sha,
+        "model": model_fp, "scores": key, "events": event_config(threshold),
+        "log": log, "n_events": n, "scored": scored,
+    }
+
+
+# ---------- merge ------------------------------------------------------------ #
+def read_ndjson(path):
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def merge_logs(paths, merged_path, fmt="ndjson"):
+    """k-way merge of per-file (already time-ordered) logs by ts, one event in memory per file."""
+    streams = [read_ndjson(p) for p in paths]
+    n = 0
+    with open(merged_path, "w") as m:
+        if fmt == "json":
+            m.write("[")
+        for ev in heapq.merge(*streams, key=lambda e: e["ts"]):
+            line = json.dumps(ev, separators=(",", ":"))
+            if fmt == "json":
+                m.write(("," if n else "") + "\n" + line)
+            else:
+                m.write(line + "\n")
+            n += 1
+        if fmt == "json":
+            m.write("\n]\n")
+    return n
+
 
 def main():
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
-    all_events = []
-    for fname in os.listdir(INPUT_DIR):
-        if not fname.lower().endswith(".wav"):
+    parser = argparse.ArgumentParser(description="Batch YAMNet classification of timestamped WAVs.")
+    parser.add_argument("--input", default=INPUT_DIR)
+    parser.add_argument("--output", default=OUTPUT_DIR, help="Output directory (per-file logs + merged).")
+    parser.add_argument("--cache", help="Score cache directory (default: <output>/cache).")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    parser.add_argument("--format", choices=("ndjson", "json"), default="ndjson",
+                        help="Format of the merged file (per-file logs are always NDJSON).")
+    parser.add_argument("--force", action="store_true", help="Ignore the manifest and score cache.")
+    args = parser.parse_args()
+
+    cache_dir = args.cache or os.path.join(args.output, "cache")
+    os.makedirs(os.path.join(cache_dir, "scores"), exist_ok=True)
+    manifest_path = os.path.join(args.output, "manifest.json")
+    manifest = {} if args.force else load_manifest(manifest_path)
+    model_fp = model_fingerprint()
+    ev_cfg = event_config(args.threshold)
+
+    wavs = sorted(f for f in os.listdir(args.input) if f.lower().endswith(".wav"))
+    todo = {}                                  # fname → known sha256 (None: hash in the worker)
+    for f in wavs:
+        st = os.stat(os.path.join(args.input, f))
+        entry = manifest.get(f)
+        if is_current(entry, st, model_fp, ev_cfg, args.output):
             continue
-        wav_path = os.path.join(INPUT_DIR, fname)
-        print(f"Processing {fname} …")
-        ev = process_file(wav_path)
-        out_path = os.path.join(OUTPUT_DIR, fname.replace(".wav", ".json"))
-        with open(out_path, "w") as out_f:
-            json.dump(ev, out_f, indent=2)
-        all_events.extend(ev)
-
-    # Optionally write a merged file:
-    merged_path = os.path.join(OUTPUT_DIR, "merged_classifications.json")
-    with open(merged_path, "w") as m:
-        json.dump(all_events, m, indent=2)
-    print("Done!")
+        unchanged = (entry is not None and entry["size"] == st.st_size
+                     and entry["mtime_ns"] == st.st_mtime_ns)
+        todo[f] = entry["sha256"] if unchanged else None
+
+    threads = max(1, (os.cpu_count() or 1) // max(1, args.workers))
+    print(f"{len(wavs)} files, {len(wavs) - len(todo)} up to date; "
+          f"processing {len(todo)} with {args.workers} workers × {threads} threads …")
+
+    def save_manifest():
+        atomic_write_json(manifest_path, {"model": model_fp, "files": manifest}, indent=1)
+
+    t0 = time.time()
+    last_save = time.monotonic()
+    n_scored = n_derived = 0
+    if todo:
+        # spawn: TensorFlow doesn't survive fork
+        with ProcessPoolExecutor(max_workers=args.workers, mp_context=mp.get_context("spawn"),
+                                 initializer=init_worker, initargs=(threads,)) as pool:
+            futures = {pool.submit(process_file, os.path.join(args.input, f), args.output, cache_dir,
+                                   model_fp, args.threshold, sha, args.force): f
+                       for f, sha in todo.items()}
+            try:
+                for fut in as_completed(futures):
+                    fname = futures[fut]
+                    try:
+                        entry = fut.result()
+                    except Exception as e:
+                        print(f"❌  Failed on {fname}: {e}")
+                        manifest.pop(fname, None)
+                        continue
+                    if entry.pop("scored"):
+                        n_scored += 1
+                    else:
+                        n_derived += 1
+                    manifest[fname] = entry
+                    print(f"{fname}: {entry['n_events']} events")
+                    if time.monotonic() - last_save >= MANIFEST_SAVE_SEC:
+                        save_manifest()
+                        last_save = time.monotonic()
+            finally:
+                save_manifest()                # keep what finished, even on Ctrl-C
+
+    present = set(wavs)
+    for f in [f for f in manifest if f not in present]:
+        del manifest[f]
+    save_manifest()
+
+    logs = sorted(os.path.join(args.output, manifest[f]["log"]) for f in wavs if f in manifest)
+    merged_path = os.path.join(args.output, f"merged_classifications.{args.format}")
+    total = merge_logs(logs, merged_path, args.format)
+    print(f"Done! {n_scored} file(s) scored, {n_derived} re-derived from cache; "
+          f"{total} events in {time.time() - t0:.1f}s → {merged_path}")
 
 if __name__ == "__main__":
     main()
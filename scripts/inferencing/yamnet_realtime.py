@@ -5,9 +5,11 @@ import sounddevice as sd
 import tensorflow as tf
 import tensorflow_hub as hub
 import csv
-import json
 import os
 
+from event_sink import EventSink
+from frontend import FrontEnd
+
 # print("Initializing script...")
 
 # — audio in —
@@ -56,10 +58,12 @@ FRAME_LEN = int(NATIVE_FS * FRAME_SEC)
 HOP_SEC = 0.5
 HOP_LEN = int(NATIVE_FS * HOP_SEC)
 buffer = np.zeros(FRAME_LEN, dtype='float32')
+FRONTEND = True  # hard-knee compressor on each new block, as before (False = raw audio)
 # print("Audio buffering parameters configured.")
 
-OUTPUT_JSON = "scripts/output/classifications_yamnet.json" 
+OUTPUT_JSON = "scripts/output/classifications_yamnet.ndjson"  # one event per line, appended in batches
 # print(f"Output JSON file: {OUTPUT_JSON}")
+sink = EventSink(OUTPUT_JSON)
 
 async def producer(q):
     # print("Starting audio producer...")
@@ -79,41 +83,23 @@ async def consumer(q):
     # print("Starting audio consumer...")
     from scipy.signal import resample
 
-    # realtime buffer
+    # realtime buffer (already conditioned samples)
     buffer = np.zeros(FRAME_LEN, dtype='float32')
-
-    def apply_compressor(audio, threshold=0.1, ratio=4.0):
-        """
-        Apply a simple dynamic range compressor to the audio signal.
-        Args:
-            audio (np.ndarray): Input audio signal.
-            threshold (float): Threshold above which compression is applied.
-            ratio (float): Compression ratio.
-        Returns:
-            np.ndarray: Compressed audio signal.
-        """
-        compressed = np.copy(audio)
-        above_threshold = np.abs(audio) > threshold
-        compressed[above_threshold] = (
-            np.sign(audio[above_threshold]) *
-            (threshold + (np.abs(audio[above_threshold]) - threshold) / ratio)
-        )
-        return compressed
+    fe = FrontEnd(NATIVE_FS, hp_fc=None, knee=0, enabled=FRONTEND)   # no high-pass, like the old apply_compressor
 
     while True:
         chunk = await q.get()
-        # shift old samples left, append new ones
-        buffer = np.roll(buffer, -len(chunk))
-        buffer[-len(chunk):] = chunk
-
-        # Apply compressor to the buffer
-        compressed_buffer = apply_compressor(buffer)
+        # condition only the new samples (filter state carries over), then
+        # shift old samples left in place and append them
+        n = len(chunk)
+        buffer[:-n] = buffer[n:]
+        buffer[-n:] = fe.process(chunk)
 
         # resample for yamnet
         if NATIVE_FS != 16000:
-            wf = resample(compressed_buffer, 16000).astype(np.float32)
+            wf = resample(buffer, 16000).astype(np.float32)
         else:
-            wf = compressed_buffer
+            wf = buffer
 
         # run YAMNet
         scores, _, _ = yamnet(tf.constant(wf))
@@ -127,16 +113,7 @@ async def consumer(q):
             }
             print(f"{cl['ts']:.2f}s → {cl['cl']} ({cl['cf']}%)")
 
-            # Append cl to JSON file
-            if os.path.exists(OUTPUT_JSON):
-                with open(OUTPUT_JSON, "r+") as f:
-                    data = json.load(f)
-                    data.append(cl)
-                    f.seek(0)
-                    json.dump(data, f, indent=4)
-            else:
-                with open(OUTPUT_JSON, "w") as f:
-                    json.dump([cl], f, indent=4)
+            sink.write(cl)
 
 async def main():
     print("Starting main event loop...")
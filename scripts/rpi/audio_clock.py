@@ -0,0 +1,74 @@
+"""
+audio_clock.py
+Timestamps from the sound card's clock instead of the time a window happens to be processed.
+
+classify.py used to stamp each window with datetime.now() after inference.
+When the queue backs up, those stamps lag the sound by seconds, then bunch
+together as the backlog drains. That shows up as the non-linear timestamps
+in cleaning/plotTimestamps.py and smears any periodicity analysis.
+
+adc_epoch() turns the callback's time_info.inputBufferAdcTime (PortAudio
+stream clock) into Unix time. AudioClock then maps every 16 kHz sample
+index to the moment it was captured. Normally a block's time is predicted
+from the previous one by counting samples. A new anchor is taken only when
+the ADC time disagrees by more than TOLERANCE_SEC: a dropped block, an
+overrun, or slow clock drift. So jitter in callback scheduling never leaks
+into the timestamps.
+
+Usage
+-----
+clock = AudioClock(16_000)
+i0 = clock.push(len(block_16k), adc_t)      # absolute index of block[0]
+ts = clock.time_of(i0 + offset)             # epoch seconds that sample was captured
+"""
+from __future__ import annotations
+
+import time
+from bisect import bisect_right
+from collections import deque
+
+TOLERANCE_SEC = 0.02     # re-anchor when a block's ADC time is off by more than this
+MAX_ANCHORS   = 256
+
+
+def adc_epoch(time_info, frames: int, sr: int) -> float:
+    """Unix time of the first sample of a callback block (call inside the callback)."""
+    now = time.time()
+    adc = getattr(time_info, "inputBufferAdcTime", 0.0)
+    cur = getattr(time_info, "currentTime", 0.0)
+    if adc and cur:
+        return now - (cur - adc)            # age of the buffer on the stream clock, applied to wall time
+    return now - frames / sr                # some ALSA setups report 0: assume the block just completed
+
+
+class AudioClock:
+    def __init__(self, sr: int, tolerance: float = TOLERANCE_SEC):
+        self.sr, self.tolerance = sr, tolerance
+        self.samples = 0                            # samples pushed so far
+        self._idx: deque[int] = deque(maxlen=MAX_ANCHORS)
+        self._t: deque[float] = deque(maxlen=MAX_ANCHORS)
+        self.gaps: deque[tuple[float, float]] = deque(maxlen=MAX_ANCHORS)   # (start, seconds) of recent gaps
+
+    def push(self, n: int, t_first: float) -> int:
+        """Register a block of *n* samples whose first sample was captured at *t_first*; returns its index."""
+        i0 = self.samples
+        if not self._idx:
+            self._anchor(i0, t_first)
+        else:
+            err = t_first - self.time_of(i0)
+            if abs(err) > self.tolerance:
+                if err > 0.5 * n / self.sr:         # more than half a block missing: a real gap
+                    self.gaps.append((self.time_of(i0), err))
+                    print(f"[AUDIO DROPPED] {err:.3f}s gap in the audio clock")
+                self._anchor(i0, t_first)
+        self.samples += n
+        return i0
+
+    def _anchor(self, idx: int, t: float) -> None:
+        self._idx.append(idx)
+        self._t.append(t)
+
+    def time_of(self, idx: int) -> float:
+        """Capture time of sample *idx* (extrapolated from the nearest anchor at or before it)."""
+        k = max(bisect_right(self._idx, idx) - 1, 0)
+        return self._t[k] + (idx - self._idx[k]) / self.sr
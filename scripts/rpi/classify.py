@@ -1,11 +1,13 @@
 #!/usr/bin/env python3
 import argparse
+import math
+import threading
 import time
 import queue
-import csv
 import json
-import os
+import socket
 import ssl
+import sys
 from pathlib import Path
 from datetime import datetime
 import pytz
@@ -22,8 +24,21 @@ except ImportError:
 from scipy.signal import resample_poly
 import paho.mqtt.client as mqtt
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))  # scripts/
+from inferencing.event_sink import EventSink
+from inferencing.frontend import FrontEnd
+from model_scheduler import BudgetScheduler, SECOND_MODELS
+from logmel import LogMelStream, PATCH_FRAMES, STFT_HOP
+from inference_pool import AudioRing, InterpreterPool
+from duty_cycle import DutyCycle, read_thermal
+from audio_clock import AudioClock, adc_epoch
+from memprofile import MemoryProfile
+from stream_supervisor import StreamSupervisor
+from summary import ClassSummary, SUMMARY_SEC
+
 # === config ================================================─
 YAMNET_MODEL      = 'scripts/models/yamnet/tfLite/tflite/1/1.tflite'
+FEATURES_MODEL    = 'scripts/models/yamnet/yamnet_features.tflite'   # export_yamnet_features.py
 CLASS_MAP_CSV     = 'scripts/models/yamnet/yamnet_class_map.csv'
 THRESHOLD         = 0.33
 NUM_THREADS       = 2
@@ -35,16 +50,96 @@ CHUNK_SAMPLES     = int(CHUNK_SEC * TARGET_SR)
 HOP_SEC           = 0.5
 HOP_SAMPLES       = int(HOP_SEC * TARGET_SR)
 
+RING_SEC          = 10.0      # --workers: shared audio ring length
+
 TOP_K             = 1
 FLUSH_SEC         = 30
+REPLAY_SEC        = 3600      # --replay: loop the recording until this much audio went through
 OUTPUT_CSV        = "output/classifications.csv"
 
+# second stage (--sonyc): int8 SONYC-UST head on YAMNet's 1024-d embedding
+SONYC_HEAD        = 'scripts/models/sonyc/sonyc_head_v3_int8.tflite'
+SONYC_THRESHOLD   = 0.5
+SONYC_CSV         = "output/sonyc_tags.csv"
+# fine taxonomy, in 1_extractHeaders_SONYC-UST.py FINE_COLS order (the "X" other/unknown tags dropped)
+SONYC_TAGS = [
+    "small-sounding-engine", "medium-sounding-engine", "large-sounding-engine",
+    "rock-drill", "jackhammer", "hoe-ram", "pile-driver",
+    "non-machinery-impact",
+    "chainsaw", "small-medium-rotating-saw", "large-rotating-saw",
+    "car-horn", "car-alarm", "siren", "reverse-beeper",
+    "stationary-music", "mobile-music", "ice-cream-truck",
+    "person-or-small-group-talking", "person-or-small-group-shouting", "large-crowd", "amplified-speech",
+    "dog-barking-whining",
+]
+
+# heavier second model (--second-model), run only when BudgetScheduler allows it
+SECOND_BUDGET     = 0.35      # share of each hop's wall time it may spend
+SECOND_EVERY      = 10        # run at least every Nth window (5 s) budget permitting
+SECOND_STATS_SEC  = 60
+
+EXCLUDED_CLASSES = [
+    "Inside, small room",
+    "Inside, large room or hall",
+    "Inside, public space",
+    "Outside, urban or manmade",
+    "Outside, rural or natural"
+]
+
+# === parse args from config =========================================================
+parser = argparse.ArgumentParser()
+parser.add_argument('--list-devices', action='store_true')
+parser.add_argument('-d','--device', default=None)
+parser.add_argument('--sonyc', action='store_true', help='Also run the SONYC-UST head on every window')
+parser.add_argument('--frontend', action='store_true',
+                    help='High-pass + soft-knee compress the audio before the models (dB stays on the raw signal)')
+parser.add_argument('--features-model', nargs='?', const=FEATURES_MODEL, default=None,
+                    help='Compute log-mel incrementally in NumPy and run the features → scores model')
+parser.add_argument('--second-model', choices=sorted(SECOND_MODELS), default=None,
+                    help='Heavier model run on a latency budget next to YAMNet')
+parser.add_argument('--second-budget', type=float, default=SECOND_BUDGET)
+parser.add_argument('--second-every', type=int, default=SECOND_EVERY)
+parser.add_argument('--workers', type=int, default=0,
+                    help='Run YAMNet in N worker processes fed from a shared-memory ring (0 = in this process)')
+parser.add_argument('--hop', type=float, default=HOP_SEC, help='Window hop in seconds')
+parser.add_argument('--duty-cycle', action='store_true',
+                    help='Trade hop, threads, second stage and an activity gate for headroom when hot or lagging')
+parser.add_argument('--sys-root', default='/', help='Where --duty-cycle reads /sys from (stand-in directory for tests)')
+parser.add_argument('--replay', metavar='WAV', default=None,
+                    help='Classify a recording (looped, as fast as possible) instead of the microphone')
+parser.add_argument('--replay-sec', type=float, default=REPLAY_SEC)
+parser.add_argument('--profile-memory', action='store_true',
+                    help='Sample RSS and tracemalloc top allocators every minute of audio (see memprofile.py)')
+parser.add_argument('--no-publish', action='store_true', help="Don't connect to MQTT; CSV only")
+parser.add_argument('--summarize', type=int, nargs='?', const=SUMMARY_SEC, default=None, metavar='SEC',
+                    help=f'Publish one class histogram per SEC (default {SUMMARY_SEC}) instead of every row; rows stay in the CSV')
+parser.add_argument('--quiet', action='store_true', help="Don't echo classifications to the console")
+args = parser.parse_args()
+if args.list_devices:
+    for i, d in enumerate(sd.query_devices()):
+        if d['max_input_channels']>0:
+            print(f"[DEV] [{i}] {d['name']} @ {d['default_samplerate']}")
+    exit(0)
+
+HOP_SEC     = args.hop
+HOP_SAMPLES = int(HOP_SEC * TARGET_SR)
+
+# === interpreter pool (--workers) ====================================================
+# forked now, before the sinks, MQTT, audio and our own model exist: spawn would
+# re-run this flat script in every worker
+ring = pool = None
+if args.workers:
+    if args.sonyc or args.features_model or args.frontend or args.duty_cycle:
+        raise SystemExit("[ERROR] --workers does not support --sonyc, --features-model, --frontend or --duty-cycle yet")
+    ring = AudioRing(int(RING_SEC * TARGET_SR))
+    pool = InterpreterPool(YAMNET_MODEL, ring, workers=args.workers, threads=1, start_method="fork")
+    print(f"[DEBUG] {args.workers} inference workers ready, ring {RING_SEC:.0f} s")
+
 # === prep output csv ===================================================─
-Path(OUTPUT_CSV).parent.mkdir(parents=True, exist_ok=True)
-if not Path(OUTPUT_CSV).exists():
-    with open(OUTPUT_CSV, "w", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow(["ts", "db", "c1_idx", "c1_cf", "c1_name", "c2_idx", "c2_cf", "c2_name", "c3_idx", "c3_cf", "c3_name"])
+# rows are appended in batches every FLUSH_SEC by the sink's background thread
+log_sink = EventSink(OUTPUT_CSV, "csv", flush_sec=FLUSH_SEC, header=[
+    "ts", "db", "c1_idx", "c1_cf", "c1_name", "c2_idx", "c2_cf", "c2_name", "c3_idx", "c3_cf", "c3_name", "model",
+    "lat_capture_ms", "lat_infer_ms"])
 
 # === mqtt config ===================================================
 SCRIPT_DIR   = Path(__file__).resolve().parent
@@ -60,6 +155,11 @@ username = cfg["hiveMQ_username"]
 password = cfg["hiveMQ_password"]
 topic    = cfg["topic"]
 
+# each sensor publishes under its own sub-topic: <topic>/<device_id>
+DEVICE_ID = cfg.get("device_id") or socket.gethostname()
+pub_topic = f"{topic}/{DEVICE_ID}"
+print(f"[DEBUG] Device '{DEVICE_ID}' publishing to {pub_topic}")
+
 # === init + connect mqtt ===================================================─
 mqtt_client = mqtt.Client()
 
@@ -82,8 +182,9 @@ mqtt_client.on_disconnect = on_disconnect
 
 mqtt_client.username_pw_set(username, password)
 mqtt_client.tls_set(tls_version=ssl.PROTOCOL_TLSv1_2)
-mqtt_client.connect(broker, port)
-mqtt_client.loop_start()
+if not args.no_publish:     # an unconnected client would queue every qos=1 message in memory
+    mqtt_client.connect(broker, port)
+    mqtt_client.loop_start()
 
 # === load model + labels =============================================
 print(f"[DEBUG] Loading labels from {CLASS_MAP_CSV}")
@@ -91,39 +192,222 @@ class_map = pd.read_csv(CLASS_MAP_CSV)
 labels    = class_map['display_name'].to_numpy()
 print(f"[DEBUG] {len(labels)} labels loaded")
 
-print(f"[DEBUG] Loading TFLite model from {YAMNET_MODEL} with {NUM_THREADS} threads")
-if HAS_NUM_THREADS_ARG:
-    yam = Interpreter(model_path=YAMNET_MODEL, num_threads=NUM_THREADS)
-else:
-    yam = Interpreter(model_path=YAMNET_MODEL)
-inp_detail = yam.get_input_details()[0]
-print(f"[DEBUG] Original input shape: {inp_detail['shape']}")
-yam.resize_tensor_input(inp_detail['index'], [FRAME_LEN], strict=True)
-yam.allocate_tensors()
-
-# === warm up model brrr =====================================================================
-print("[DEBUG] Warming up interpreter with a dummy frame…")
 dummy = np.zeros((FRAME_LEN,), dtype=np.float32)
-yam.set_tensor(inp_detail['index'], dummy)
-t0 = time.monotonic()
-yam.invoke()
-t1 = time.monotonic()
-print(f"[DEBUG]  → warm-up invoke: {t1-t0:.3f}s")
-
 
-scores_idx = yam.get_output_details()[0]['index']
-print(f"[DEBUG] Model ready with fixed input length {FRAME_LEN}")
-
-# === parse args from config =========================================================
-parser = argparse.ArgumentParser()
-parser.add_argument('--list-devices', action='store_true')
-parser.add_argument('-d','--device', default=None)
-args = parser.parse_args()
-if args.list_devices:
-    for i, d in enumerate(sd.query_devices()):
-        if d['max_input_channels']>0:
-            print(f"[DEV] [{i}] {d['name']} @ {d['default_samplerate']}")
-    exit(0)
+def load_yamnet(threads):
+    """Load, size and warm up YAMNet; called again by --duty-cycle to change the thread count."""
+    # --features-model: log-mel patches from LogMelStream instead of waveforms
+    model_path = args.features_model or YAMNET_MODEL
+    print(f"[DEBUG] Loading TFLite model from {model_path} with {threads} threads")
+    if HAS_NUM_THREADS_ARG:
+        net = Interpreter(model_path=model_path, num_threads=threads)
+    else:
+        net = Interpreter(model_path=model_path)
+    inp = net.get_input_details()[0]
+    print(f"[DEBUG] Original input shape: {inp['shape']}")
+    if not args.features_model:
+        net.resize_tensor_input(inp['index'], [FRAME_LEN], strict=True)
+    net.allocate_tensors()
+
+    # === warm up model brrr =====================================================================
+    print("[DEBUG] Warming up interpreter with a dummy frame…")
+    net.set_tensor(inp['index'], np.zeros(inp['shape'], dtype=np.float32) if args.features_model else dummy)
+    t0 = time.monotonic()
+    net.invoke()
+    t1 = time.monotonic()
+    print(f"[DEBUG]  → warm-up invoke: {t1-t0:.3f}s")
+
+    scores_i = next(d['index'] for d in net.get_output_details() if d['shape'][-1] == len(labels))
+    # the same invoke also produces the 1024-d embedding the SONYC head consumes
+    embed_i  = next(d['index'] for d in net.get_output_details() if d['shape'][-1] == 1024)
+    print(f"[DEBUG] Model ready with fixed input length {FRAME_LEN}")
+    return net, inp, scores_i, embed_i
+
+if pool is None:    # with --workers every worker has its own interpreter instead
+    yam, inp_detail, scores_idx, embed_idx = load_yamnet(NUM_THREADS)
+
+mel = None
+if args.features_model:
+    if HOP_SAMPLES % STFT_HOP or CHUNK_SAMPLES % STFT_HOP:
+        raise SystemExit(f"[ERROR] --features-model needs HOP/CHUNK sizes that are multiples of {STFT_HOP} samples")
+    # a whole chunk of frames plus one patch of look-back
+    mel = LogMelStream(keep_frames=CHUNK_SAMPLES // STFT_HOP + PATCH_FRAMES)
+
+# === load SONYC head (optional) ===================================================
+# windows per chunk – every chunk's embeddings go through the head in one invoke
+NUM_WINDOWS = 1 + (CHUNK_SAMPLES - FRAME_LEN) // HOP_SAMPLES
+head = None
+if args.sonyc:
+    print(f"[DEBUG] Loading SONYC head from {SONYC_HEAD}")
+    head = Interpreter(model_path=SONYC_HEAD)
+    h_in, h_out = head.get_input_details()[0], head.get_output_details()[0]
+    head.resize_tensor_input(h_in['index'], [NUM_WINDOWS, h_in['shape'][-1]])
+    head.allocate_tensors()
+    h_in_scale, h_in_zero   = h_in['quantization']
+    h_out_scale, h_out_zero = h_out['quantization']
+    if len(SONYC_TAGS) != h_out['shape'][-1]:
+        raise SystemExit(f"[ERROR] head has {h_out['shape'][-1]} outputs, SONYC_TAGS lists {len(SONYC_TAGS)}")
+
+    # preallocated buffers: embeddings → int8, int8 → probabilities
+    emb_f32   = np.zeros((NUM_WINDOWS, h_in['shape'][-1]), dtype=np.float32)
+    emb_q     = np.empty_like(emb_f32)
+    emb_i8    = np.empty(emb_f32.shape, dtype=np.int8)
+    tag_probs = np.empty((NUM_WINDOWS, len(SONYC_TAGS)), dtype=np.float32)
+    win_ts    = np.zeros(NUM_WINDOWS)
+    win_db    = np.zeros(NUM_WINDOWS)
+    win_c1    = np.zeros(NUM_WINDOWS, dtype=np.int64)
+
+    sonyc_sink = EventSink(SONYC_CSV, "csv", flush_sec=FLUSH_SEC, header=["ts", "db", "c1_idx"] + SONYC_TAGS)
+
+    def run_head():
+        """Quantize this chunk's embeddings in place, one head invoke, dequantize into tag_probs."""
+        np.multiply(emb_f32, 1.0 / h_in_scale, out=emb_q)
+        np.add(emb_q, h_in_zero, out=emb_q)
+        np.rint(emb_q, out=emb_q)
+        np.clip(emb_q, -128, 127, out=emb_q)
+        np.copyto(emb_i8, emb_q, casting='unsafe')
+        head.set_tensor(h_in['index'], emb_i8)
+        head.invoke()
+        np.copyto(tag_probs, head.get_tensor(h_out['index']), casting='unsafe')
+        np.subtract(tag_probs, h_out_zero, out=tag_probs)    # in float: int8 - zero point would wrap
+        np.multiply(tag_probs, h_out_scale, out=tag_probs)
+
+# === load second model (optional) ===================================================
+second = sched = None
+if args.second_model:
+    print(f"[DEBUG] Loading second model '{args.second_model}'")
+    second = SECOND_MODELS[args.second_model](labels)
+    t0 = time.perf_counter()
+    second.predict(dummy)
+    print(f"[DEBUG]  → warm-up {second.name}: {time.perf_counter()-t0:.3f}s")
+    sched = BudgetScheduler(HOP_SEC, budget=args.second_budget, every=args.second_every)
+    sched.cost_ema = time.perf_counter() - t0   # seed the latency estimate with the warm-up
+
+# === duty cycling (optional) =====================================================
+# levels never touch the stream or the queue: under pressure we drop resolution, not audio
+ctl = None
+level = {"hop": HOP_SEC, "threads": NUM_THREADS, "second": True, "gate": False}
+if args.duty_cycle:
+    ctl = DutyCycle(HOP_SEC, NUM_THREADS, sys_root=args.sys_root)
+    print(f"[DEBUG] Duty cycling on: {read_thermal(args.sys_root)}")
+    level = ctl.level
+
+# === event logging ===============================================================
+# ts is when the window's first sample hit the ADC (AudioClock), not when it was processed.
+# Each record carries how long the window waited after capture and how long inference took;
+# the publisher adds MQTT transit and database commit (see database/latency.py).
+def stage_latency(ts, t_start, t_done):
+    """Per-stage latencies in ms: window fully captured → inference start → inference done."""
+    captured = ts + FRAME_LEN / TARGET_SR
+    return {"lat_capture_ms": round((t_start - captured) * 1e3, 1),
+            "lat_infer_ms":   round((t_done - t_start) * 1e3, 1)}
+
+# --summarize: YAMNet rows are folded into a per-interval class histogram (summary.py) and only
+# that is published; second-model rows stay in the CSV
+summ = ClassSummary(args.summarize) if args.summarize else None
+
+def publish_summary(payload):
+    if payload is None:
+        return
+    payload.update(device_id=DEVICE_ID, model="yamnet", t_pub=time.time())
+    if not args.quiet:
+        print(f"[DEBUG] summary {datetime.fromtimestamp(payload['start'], pytz.UTC).strftime('%H:%M')}: "
+              f"{payload['windows']} windows, {sum(c[1] for c in payload['classes'])} rows "
+              f"in {len(payload['classes'])} classes")
+    if not args.no_publish:
+        return mqtt_client.publish(pub_topic, json.dumps(payload), qos=1)
+
+def log_event(ts, db_now, top_idx, top_conf, model, t_start, t_done):
+    """Print, append to the CSV and publish one classification if it passes the filters."""
+    if summ is not None and model == "yamnet":
+        publish_summary(summ.roll(ts))          # window timestamps only move forward
+        summ.seen += 1
+    # most windows stop at one of these checks, before anything is formatted or allocated
+    if top_conf[0] < THRESHOLD:
+        return
+    top_name = labels[top_idx[0]]
+    if top_name in EXCLUDED_CLASSES:
+        return
+    if top_name == "Silence":
+        # Check if the top prediction is "Silence" - if so, skip logging entirely
+        if not args.quiet:
+            print(f"{datetime.fromtimestamp(ts, pytz.UTC).strftime('%H:%M:%S')} -> "
+                  f"{'' if model == 'yamnet' else f'[{model}] '}Silence ({top_conf[0]*100:.1f}%) - not logged")
+        return
+    lat = stage_latency(ts, t_start, t_done)
+
+    if not args.quiet:
+        # append highest cf labels, extras if any
+        names = labels[top_idx]
+        confs = [f"{c*100:.1f}%" for c in top_conf]
+        tag   = "" if model == "yamnet" else f"[{model}] "
+        hhmmss = datetime.fromtimestamp(ts, pytz.UTC).strftime('%H:%M:%S')
+        msg = f"{names[0]} ({confs[0]})"
+        if len(names) > 1:
+            extras = [f"{n} ({cf})" for n, cf in zip(names[1:], confs[1:])]
+            msg += " +[" + ", ".join(extras) + "]"
+        print(f"{hhmmss} -> {tag}{msg}  {db_now:.1f} dB")
+
+    # build the row
+    row = [ts, round(db_now, 1)]
+    for idx, c in zip(top_idx, top_conf):
+        row.extend([int(idx), round(c*100, 1), labels[idx]])
+    # pad out any missing columns to preserve schema size (top_k will never exceed 3)
+    for _ in range(3 - len(top_idx)):
+        row.extend([None, None, None])
+    row.extend([model, lat["lat_capture_ms"], lat["lat_infer_ms"]])
+    log_sink.write(row)
+    if summ is not None:
+        if model == "yamnet":
+            summ.add(ts, int(top_idx[0]), round(top_conf[0] * 100, 1), round(db_now, 1))
+        return
+
+    # build the payload with padding if needed
+    payload = {
+        "device_id": DEVICE_ID,
+        "model":     model,
+        "ts":        float(ts),
+        "db":        float(round(db_now, 1)),
+        "c1_idx":    int(top_idx[0]) if len(top_idx) > 0 else None,
+        "c1_cf":     float(round(top_conf[0] * 100, 1)) if len(top_conf) > 0 else None,
+        "c2_idx":    int(top_idx[1]) if len(top_idx) > 1 else None,
+        "c2_cf":     float(round(top_conf[1] * 100, 1)) if len(top_conf) > 1 else None,
+        "c3_idx":    int(top_idx[2]) if len(top_idx) > 2 else None,
+        "c3_cf":     float(round(top_conf[2] * 100, 1)) if len(top_conf) > 2 else None,
+        **lat,
+        "t_pub":     time.time(),
+    }
+    if not args.no_publish:
+        mqtt_client.publish(pub_topic, json.dumps(payload), qos=1)
+
+# preallocated per-window results, reused for every window
+scores   = np.empty(len(labels), dtype=np.float32)
+top_idx  = np.empty(TOP_K, dtype=np.int64)
+top_conf = np.empty(TOP_K, dtype=np.float32)
+
+def pick_top(s):
+    """Top-K of *s* into top_idx / top_conf, best first, without argsorting all 521 scores."""
+    if TOP_K == 1:
+        top_idx[0] = s.argmax()
+    else:
+        top_idx[:] = np.argpartition(s, -TOP_K)[-TOP_K:]
+        top_idx[:] = top_idx[np.argsort(s[top_idx])[::-1]]
+    np.take(s, top_idx, out=top_conf)
+
+def level_db(x):
+    """dBFS of *x* from its dot product with itself (no squared temporary)."""
+    return 20 * math.log10(math.sqrt(float(np.dot(x, x)) / len(x)) + 1e-10)
+
+def run_second(window, scores, ts, db_now, backlog):
+    """Let the scheduler decide whether the second model gets this window; log its result."""
+    p2, p1 = np.partition(scores, -2)[-2:]
+    if sched.should_run(p1, p2, db_now, backlog=backlog):
+        t0 = time.time()
+        scores2 = second.predict(window)
+        t1 = time.time()
+        sched.record(t1 - t0)
+        idx2 = scores2.argsort()[-TOP_K:][::-1]
+        log_event(ts, db_now, idx2, scores2[idx2], second.name, t0, t1)
 
 # === set audio input device ======================================================
 def find_device(name_or_id):
@@ -139,10 +423,15 @@ def find_device(name_or_id):
             return i
     return None
 
-dev_id = find_device(args.device)
-info   = sd.query_devices(dev_id, 'input') if dev_id is not None else sd.query_devices(None,'input')
-dev_sr = int(info['default_samplerate'])
-print(f"[DEBUG] Using input '{info['name']}' @ {dev_sr} Hz → target {TARGET_SR} Hz")
+if args.replay:
+    import soundfile as sf
+    dev_sr = sf.info(args.replay).samplerate
+    print(f"[DEBUG] Replaying '{args.replay}' @ {dev_sr} Hz for {args.replay_sec:.0f} s of audio → target {TARGET_SR} Hz")
+else:
+    dev_id = find_device(args.device)
+    info   = sd.query_devices(dev_id, 'input') if dev_id is not None else sd.query_devices(None,'input')
+    dev_sr = int(info['default_samplerate'])
+    print(f"[DEBUG] Using input '{info['name']}' @ {dev_sr} Hz → target {TARGET_SR} Hz")
 need_resample = (dev_sr != TARGET_SR)
 
 # === audio callback ==========================================─
@@ -153,136 +442,218 @@ q = queue.Queue(maxsize=100)
 def audio_callback(indata, frames, time_info, status):
     if status:
         print(f"[AUDIO STATUS] {status}")
+    t_first = adc_epoch(time_info, frames, dev_sr)
+    sup.beat(t_first + frames / dev_sr)
     try:
-        q.put_nowait(indata[:,0].copy())
+        q.put_nowait((indata[:,0].copy(), t_first))
     except queue.Full:
         print("[AUDIO DROPPED] queue full, dropping block")
 
-stream = sd.InputStream(
-    device=dev_id,
-    channels=1,
-    samplerate=dev_sr,
-    dtype='float32',
-    blocksize=blocksize,
-    latency='high',
-    callback=audio_callback
-)
-stream.start()
+def replay_feeder():
+    """--replay: queue the recording block by block (looped) as fast as it is consumed, then None."""
+    t0, sent, total = time.time(), 0, int(args.replay_sec * dev_sr)
+    while sent < total:
+        with sf.SoundFile(args.replay) as f:
+            for blk in f.blocks(blocksize, dtype='float32', always_2d=True):
+                if len(blk) < blocksize or sent >= total:
+                    break
+                q.put((blk[:, 0].copy(), t0 + sent / dev_sr))    # the file's own clock
+                sent += blocksize
+    q.put(None)
+
+def open_stream():
+    """(Re)open the input stream; the device is looked up again, the sample rate stays what everything was built for."""
+    global dev_id
+    dev_id = find_device(args.device)
+    stream = sd.InputStream(
+        device=dev_id,
+        channels=1,
+        samplerate=dev_sr,
+        dtype='float32',
+        blocksize=blocksize,
+        latency='high',
+        callback=audio_callback,
+        finished_callback=sup.finished
+    )
+    stream.start()
+    return stream
+
+# a stalled or failed stream is rebuilt in place; model, buffers and MQTT stay warm
+sup = None
+if args.replay:
+    stream = threading.Thread(target=replay_feeder, name="replay", daemon=True)
+    stream.start()
+else:
+    sup = StreamSupervisor(open_stream, block_sec=blocksize / dev_sr)
+    stream = sup.start()
 print("Listening… Ctrl-C to stop")
 
 # === MAIN LOOP ============================================================
-chunk_buffer = np.zeros((0,), dtype=np.float32)
-ram_buffer   = []
-last_flush   = time.time()
+# blocks are appended to acc; each full chunk is copied out once and the remainder moved to the front
+if HOP_SAMPLES > CHUNK_SAMPLES:
+    raise SystemExit(f"[ERROR] --hop must not exceed the {CHUNK_SEC:.0f} s chunk")
+acc   = np.empty(2 * CHUNK_SAMPLES, dtype=np.float32)
+fill  = 0
+chunk = np.empty(CHUNK_SAMPLES, dtype=np.float32)
+chunk_start  = 0                                    # audio-clock index of acc[0]
+prof = MemoryProfile() if args.profile_memory else None
+clock = AudioClock(TARGET_SR)
+# chunks don't overlap, so conditioning each one carries the filter state sample by sample
+frontend = FrontEnd(TARGET_SR, enabled=args.frontend)
+last_stats = time.monotonic()
+
+if pool is not None:
+    next_start = 0                                  # ring position of the next window to submit
+    pool_window = np.zeros(FRAME_LEN, dtype=np.float32)
+
+    def run_pool(mono):
+        """Write the block to the ring, submit every window it completes, log finished windows in order."""
+        global next_start
+        ring.write(mono)
+        while ring.pos >= next_start + FRAME_LEN:
+            pool.submit(next_start)
+            next_start += HOP_SAMPLES
+        if pool.pending > 4 * args.workers:
+            print(f"[DEBUG] inference is {pool.pending} windows behind")
+        for seq, start, pool_scores in pool.ready():
+            if pool_scores is None:
+                print(f"[AUDIO DROPPED] window {seq} overwritten before it was classified")
+                continue
+            t_win = time.perf_counter()
+            t_done = time.time()
+            ring.read(start, pool_window)
+            pick_top(pool_scores)
+            db_now = level_db(pool_window)
+            ts = clock.time_of(start)                   # ring positions are audio-clock indices
+            log_event(ts, db_now, top_idx, top_conf, "yamnet", t_done - pool.last_latency, t_done)
+            if second is not None:
+                sched.observe_base(time.perf_counter() - t_win)
+                run_second(pool_window, pool_scores, ts, db_now, q.qsize() + pool.pending)
 
 try:
     while True:
         # 1) pull a block
-        block = q.get()
+        if sup is not None:
+            sup.check()
+        try:
+            item = q.get(timeout=blocksize / dev_sr)
+        except queue.Empty:
+            continue
+        if item is None:                    # end of --replay
+            break
+        block, t_block = item
+        if sup is not None and sup.got(t_block):
+            # first block after an outage: don't stitch audio from both sides of the gap into one chunk
+            fill, chunk_start = 0, clock.samples
+            frontend.reset()
+            if mel is not None:
+                mel.reset()
         mono = resample_poly(block, TARGET_SR, dev_sr) if need_resample else block
+        clock.push(len(mono), t_block)
+        if prof is not None:
+            prof.tick(clock.samples / TARGET_SR)
+
+        if second is not None and time.monotonic() - last_stats >= SECOND_STATS_SEC:
+            print(f"[DEBUG] {second.name}: {sched.summary()}")
+            last_stats = time.monotonic()
+
+        if pool is not None:
+            run_pool(mono)
+            continue
 
         # 2) accumulate until we have CHUNK_SAMPLES
-        chunk_buffer = np.concatenate((chunk_buffer, mono))
-        if len(chunk_buffer) < CHUNK_SAMPLES:
+        acc[fill:fill + len(mono)] = mono
+        fill += len(mono)
+        if fill < CHUNK_SAMPLES:
             continue
 
-        # 3) slice out exactly CHUNK_SAMPLES and leave the rest
-        chunk = chunk_buffer[:CHUNK_SAMPLES]
-        chunk_buffer = chunk_buffer[CHUNK_SAMPLES:]
+        # 3) copy out exactly CHUNK_SAMPLES and move the rest to the front
+        chunk[:] = acc[:CHUNK_SAMPLES]
+        fill -= CHUNK_SAMPLES
+        acc[:fill] = acc[CHUNK_SAMPLES:CHUNK_SAMPLES + fill]
+        chunk_i0, chunk_start = chunk_start, chunk_start + CHUNK_SAMPLES
+        cond  = frontend.process(chunk)     # the chunk itself when --frontend is off
+        if mel is not None:
+            f0 = mel.push(cond)             # only this chunk's new log-mel frames
+
+        # 4) sliding‐window inference (HOP_SAMPLES changes with the duty-cycle level)
+        for w, start in enumerate(range(0, CHUNK_SAMPLES - FRAME_LEN + 1, HOP_SAMPLES)):
+            t_win = time.perf_counter()
+            end   = start + FRAME_LEN
+            window = cond[start:end]         # a view; set_tensor copies it into the interpreter
 
-        # compute how many windows fit in the chunk
-        num_windows = 1 + (CHUNK_SAMPLES - FRAME_LEN) // HOP_SAMPLES
+            # estimate loudness
+            db_now = level_db(chunk[start:end])
+            ts = clock.time_of(chunk_i0 + start)     # capture time of the window's first sample
 
-        # 4) sliding‐window inference
-        for w in range(num_windows):
-            start = w * HOP_SAMPLES
-            end   = start + FRAME_LEN
-            window = chunk[start:end].astype(np.float32)
+            # activity gate (last duty-cycle level): quiet windows skip the model
+            if ctl is not None and not ctl.active(db_now):
+                continue
 
             # invoke the model
-            yam.set_tensor(inp_detail['index'], window)
+            t_start = time.time()
+            if mel is not None:
+                yam.set_tensor(inp_detail['index'], mel.patch(f0 + start // STFT_HOP)[None])
+            else:
+                yam.set_tensor(inp_detail['index'], window)
             yam.invoke()
-            scores = yam.get_tensor(scores_idx)[0]
+            np.copyto(scores, yam.tensor(scores_idx)()[0])    # into the preallocated buffer, not a new get_tensor copy
+            t_done = time.time()
 
             # pick top‐K
-            top_idx  = scores.argsort()[-TOP_K:][::-1]
-            top_conf = scores[top_idx]
+            pick_top(scores)
 
-            # estimate loudness
-            rms    = np.sqrt(np.mean(window**2))
-            db_now = 20 * np.log10(rms + 1e-10)
+            if head is not None and level["second"]:
+                np.copyto(emb_f32[w], yam.tensor(embed_idx)()[0])   # view of the invoke's output, no extra get_tensor copy
+                win_ts[w], win_db[w], win_c1[w] = ts, db_now, top_idx[0]
 
             # if above threshold, record it
-            if top_conf[0] >= THRESHOLD:
-                ts = datetime.now(pytz.UTC).timestamp()  # Use pytz to get the current UTC timestamp
-                names = labels[top_idx]
-                confs = [f"{c*100:.1f}%" for c in top_conf]
-
-                # Check if the top prediction is "Silence" - if so, skip logging entirely
-                if names[0] == "Silence":
-                    # Optionally print for debugging/monitoring
-                    print(f"{datetime.fromtimestamp(ts, pytz.UTC).strftime('%H:%M:%S')} -> Silence ({confs[0]}) - not logged")
-                    continue
-
-                # Skip logging for other excluded environmental labels
-                excluded_classes = [
-                    "Inside, small room",
-                    "Inside, large room or hall", 
-                    "Inside, public space",
-                    "Outside, urban or manmade",
-                    "Outside, rural or natural"
-                ]
-                if names[0] in excluded_classes:
-                    continue
-
-                # append highest cf labels
-                msg = f"{names[0]} ({confs[0]})"
-
-                # extras, if any
-                if len(names) > 1:
-                    extras = [f"{n} ({cf})" for n, cf in zip(names[1:], confs[1:])]
-                    msg += " +[" + ", ".join(extras) + "]"
-
-                # Format the timestamp using UTC
-                print(f"{datetime.fromtimestamp(ts, pytz.UTC).strftime('%H:%M:%S')} -> {msg}  {db_now:.1f} dB")
-
-                # build the row
-                row = [ts, round(db_now, 1)]
-                for idx, c in zip(top_idx, top_conf):
-                    row.extend([int(idx), round(c*100, 1), labels[idx]])
-
-                # pad out any missing columns to preserve schema size (top_k will never exceed 3)
-                pad_slots = 3 - len(top_idx)  # e.g. TOP_K=2 -> pad_slots=1
-                for _ in range(pad_slots):
-                    row.extend([None, None, None])
-
-                ram_buffer.append(row)
-
-                # build the payload with padding if needed
-                payload = {
-                    "ts":        float(ts),
-                    "db":        float(round(db_now, 1)),
-                    "c1_idx":    int(top_idx[0]) if len(top_idx) > 0 else None,
-                    "c1_cf":     float(round(top_conf[0] * 100, 1)) if len(top_conf) > 0 else None,
-                    "c2_idx":    int(top_idx[1]) if len(top_idx) > 1 else None,
-                    "c2_cf":     float(round(top_conf[1] * 100, 1)) if len(top_conf) > 1 else None,
-                    "c3_idx":    int(top_idx[2]) if len(top_idx) > 2 else None,
-                    "c3_cf":     float(round(top_conf[2] * 100, 1)) if len(top_conf) > 2 else None,
-                }
-                
-                mqtt_client.publish(topic, json.dumps(payload), qos=1)
-
-
-        # 5) flush buffer to disk every FLUSH_SEC
-        if time.time() - last_flush >= FLUSH_SEC and ram_buffer:
-            # print(f"[DEBUG] Flushing {len(ram_buffer)} rows to CSV")
-            with open(OUTPUT_CSV, "a", newline="") as f:
-                writer = csv.writer(f)
-                writer.writerows(ram_buffer)
-                f.flush(); os.fsync(f.fileno())
-            ram_buffer.clear()
-            last_flush = time.time()
+            log_event(ts, db_now, top_idx, top_conf, "yamnet", t_start, t_done)
+
+            # second model, when triggered and the latency budget allows
+            if second is not None and level["second"]:
+                sched.observe_base(time.perf_counter() - t_win)
+                run_second(window, scores, ts, db_now, q.qsize())
+            if ctl is not None:
+                ctl.observe_invoke(time.perf_counter() - t_win)
+
+        # 4b) second stage: all of this chunk's windows through the SONYC head at once
+        if head is not None and level["second"]:
+            run_head()
+            for w in np.flatnonzero(tag_probs.max(axis=1) >= SONYC_THRESHOLD):
+                if not args.quiet:
+                    hits = np.flatnonzero(tag_probs[w] >= SONYC_THRESHOLD)
+                    print(f"{datetime.fromtimestamp(win_ts[w], pytz.UTC).strftime('%H:%M:%S')} -> [sonyc] "
+                          + ", ".join(f"{SONYC_TAGS[t]} ({tag_probs[w, t]*100:.1f}%)" for t in hits))
+                sonyc_sink.write([win_ts[w], round(win_db[w], 1), int(win_c1[w])]
+                                 + [round(float(p) * 100, 1) for p in tag_probs[w]])
+
+        # 5) duty cycle: re-evaluate once per chunk against the audio still queued
+        if ctl is not None and ctl.update(q.qsize() * blocksize / dev_sr):
+            prev, level = level, ctl.level
+            HOP_SAMPLES = int(level["hop"] * TARGET_SR)
+            if level["threads"] != prev["threads"]:
+                yam, inp_detail, scores_idx, embed_idx = load_yamnet(level["threads"])
 
 except KeyboardInterrupt:
-    stream.stop()
-    print("Stopped.")
\ No newline at end of file
+    pass
+
+if sup is not None:
+    sup.close()
+if summ is not None:
+    info = publish_summary(summ.flush())
+    if info is not None:
+        info.wait_for_publish(timeout=5)        # the partial last interval, before the process exits
+log_sink.close()
+if head is not None:
+    sonyc_sink.close()
+if second is not None:
+    print(f"[DEBUG] {second.name}: {sched.summary()}")
+if pool is not None:
+    pool.close()
+    ring.close(unlink=True)
+if ctl is not None:
+    ctl.close()
+if prof is not None:
+    prof.report()
+print("Stopped.")
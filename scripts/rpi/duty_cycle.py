@@ -0,0 +1,202 @@
+"""
+duty_cycle.py
+Step classify.py down to cheaper settings when the Pi runs hot or falls behind, and back up when it recovers.
+
+A Pi 3B+ soft-throttles at about 60 °C and slows further as it heats. Until
+now classify.py only reacted by overflowing its audio queue, which loses
+stretches of audio. DutyCycle watches four signals:
+
+  temperature   /sys/class/thermal/thermal_zone0/temp          (m°C)
+  frequency     /sys/devices/system/cpu/cpu0/cpufreq/scaling_cur_freq vs. cpuinfo_max_freq (kHz)
+  lag           seconds of captured audio still waiting in the queue
+  invoke        EMA of the YAMNet invoke time, compared with the current hop
+
+Any pressure signal moves it one LEVEL down, at most once per DWELL_SEC.
+Once every signal has been healthy for RECOVER_SEC, it moves one level back
+up. Each level gives up a little fidelity so that no audio is lost:
+
+  0  full          hop 0.5 s, 2 threads, second stage on, no gate
+  1  no 2nd stage  the SONYC head and --second-model are paused
+  2  longer hop    1.0 s hop (half the windows)
+  3  1 thread      the interpreter is rebuilt single-threaded (cooler, not faster)
+  4  gated         windows within GATE_DB of the noise floor skip YAMNet
+
+Every transition is printed and appended to output/duty_cycle.ndjson.
+
+sys_root points the readers at a directory with the same layout. Tests and
+desktops can use write_standin() to fake a hot Pi.
+
+Usage
+-----
+ctl = DutyCycle(base_hop=0.5, base_threads=2)
+ctl.observe_invoke(sec)              # every window
+if ctl.update(lag_sec):              # every chunk; True when the level changed
+    apply(ctl.level)                 # {"name", "hop", "threads", "second", "gate"}
+
+python scripts/rpi/duty_cycle.py --watch [--sys-root DIR]
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))  # scripts/
+from inferencing.event_sink import EventSink
+
+TEMP_PATH     = "sys/class/thermal/thermal_zone0/temp"
+FREQ_CUR_PATH = "sys/devices/system/cpu/cpu0/cpufreq/scaling_cur_freq"
+FREQ_MAX_PATH = "sys/devices/system/cpu/cpu0/cpufreq/cpuinfo_max_freq"
+
+TEMP_HOT     = 72.0     # °C, degrade above
+TEMP_OK      = 65.0     # °C, recover below
+FREQ_LOW     = 0.9      # cur/max below this = throttled
+LAG_HIGH     = 1.5      # s of queued audio, degrade above
+LAG_OK       = 0.5      # s, recover below
+INVOKE_HIGH  = 0.7      # invoke EMA as a share of the hop, degrade above
+INVOKE_OK    = 0.35     # recover below (measured against the next level up's hop)
+GATE_DB      = 6.0      # level above the noise floor that still runs YAMNet when gated
+DWELL_SEC    = 10.0
+RECOVER_SEC  = 60.0
+LOG_PATH     = "output/duty_cycle.ndjson"
+
+
+def levels(base_hop: float, base_threads: int) -> list[dict]:
+    """Cumulative degradation steps, full fidelity first."""
+    full = {"name": "full", "hop": base_hop, "threads": base_threads, "second": True, "gate": False}
+    steps = [("no 2nd stage", {"second": False}),
+             ("longer hop",   {"hop": max(base_hop, 2 * base_hop)}),
+             ("1 thread",     {"threads": 1}),
+             ("gated",        {"gate": True})]
+    out = [full]
+    for name, change in steps:
+        out.append({**out[-1], **change, "name": name})
+    return out
+
+
+def _read_number(path: Path) -> float | None:
+    try:
+        return float(path.read_text().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def read_thermal(sys_root: str | Path = "/") -> dict:
+    """CPU temperature (°C) and current/max frequency (MHz); None where /sys has no such file."""
+    root = Path(sys_root)
+    temp = _read_number(root / TEMP_PATH)
+    cur, mx = _read_number(root / FREQ_CUR_PATH), _read_number(root / FREQ_MAX_PATH)
+    return {"temp_c": temp / 1000 if temp is not None else None,
+            "freq_mhz": cur / 1000 if cur is not None else None,
+            "freq_max_mhz": mx / 1000 if mx is not None else None}
+
+
+def write_standin(root: str | Path, temp_c: float, freq_mhz: float, freq_max_mhz: float = 1400.0) -> None:
+    """Write fake /sys files under *root* (e.g. for DutyCycle(sys_root=root))."""
+    root = Path(root)
+    for rel, value in ((TEMP_PATH, temp_c * 1000), (FREQ_CUR_PATH, freq_mhz * 1000), (FREQ_MAX_PATH, freq_max_mhz * 1000)):
+        (root / rel).parent.mkdir(parents=True, exist_ok=True)
+        (root / rel).write_text(f"{int(value)}\n")
+
+
+class DutyCycle:
+    def __init__(self, base_hop: float, base_threads: int, sys_root: str | Path = "/",
+                 log_path: str | None = LOG_PATH, max_level: int | None = None):
+        self.levels = levels(base_hop, base_threads)
+        self.max_level = len(self.levels) - 1 if max_level is None else max_level
+        self.sys_root = sys_root
+        self.index = 0
+        self.invoke_ema = None
+        self.floor_db = None
+        self.last_change = -DWELL_SEC
+        self.healthy_since = None
+        self.reading: dict = {}
+        self.sink = EventSink(log_path) if log_path else None
+
+    @property
+    def level(self) -> dict:
+        return self.levels[self.index]
+
+    def observe_invoke(self, sec: float) -> None:
+        self.invoke_ema = sec if self.invoke_ema is None else 0.9 * self.invoke_ema + 0.1 * sec
+
+    def active(self, db_now: float) -> bool:
+        """Activity gate: track the noise floor; True if this window should still be classified."""
+        if self.floor_db is None or db_now < self.floor_db:
+            self.floor_db = db_now
+        else:
+            self.floor_db += 0.005 * (db_now - self.floor_db)
+        return not self.level["gate"] or db_now - self.floor_db >= GATE_DB
+
+    # ---------- control ------------------------------------------------------------ #
+    def _pressure(self, r: dict, lag: float) -> list[str]:
+        why = []
+        if r["temp_c"] is not None and r["temp_c"] >= TEMP_HOT:
+            why.append(f"temp {r['temp_c']:.1f}°C")
+        if r["freq_mhz"] and r["freq_max_mhz"] and r["freq_mhz"] < FREQ_LOW * r["freq_max_mhz"] \
+                and r["temp_c"] is not None and r["temp_c"] >= TEMP_OK:
+            why.append(f"throttled {r['freq_mhz']:.0f}/{r['freq_max_mhz']:.0f} MHz")   # idle scaling alone isn't pressure
+        if lag >= LAG_HIGH:
+            why.append(f"lag {lag:.1f}s")
+        if self.invoke_ema is not None and self.invoke_ema >= INVOKE_HIGH * self.level["hop"]:
+            why.append(f"invoke {self.invoke_ema * 1e3:.0f}ms")
+        return why
+
+    def _healthy(self, r: dict, lag: float) -> bool:
+        up = self.levels[max(self.index - 1, 0)]
+        return ((r["temp_c"] is None or r["temp_c"] < TEMP_OK)
+                and lag < LAG_OK
+                and (self.invoke_ema is None or self.invoke_ema < INVOKE_OK * up["hop"]))
+
+    def update(self, lag: float, now: float | None = None) -> bool:
+        """Re-evaluate; returns True if the level changed (then apply self.level)."""
+        now = time.monotonic() if now is None else now
+        r = self.reading = read_thermal(self.sys_root)
+        why = self._pressure(r, lag)
+        if why:
+            self.healthy_since = None
+            if self.index < self.max_level and now - self.last_change >= DWELL_SEC:
+                return self._move(self.index + 1, ", ".join(why), lag, now)
+            return False
+        if self.index == 0 or not self._healthy(r, lag):
+            self.healthy_since = None
+            return False
+        if self.healthy_since is None:
+            self.healthy_since = now
+        if now - self.healthy_since >= RECOVER_SEC and now - self.last_change >= DWELL_SEC:
+            self.healthy_since = now
+            return self._move(self.index - 1, f"recovered for {RECOVER_SEC:.0f}s", lag, now)
+        return False
+
+    def _move(self, to: int, reason: str, lag: float, now: float) -> bool:
+        old, self.index, self.last_change = self.index, to, now
+        r = self.reading
+        temp = f"{r['temp_c']:.1f}°C" if r["temp_c"] is not None else "n/a"
+        print(f"[DUTY] level {old} ({self.levels[old]['name']}) → {to} ({self.level['name']}): {reason} "
+              f"[temp {temp}, lag {lag:.2f}s, invoke {(self.invoke_ema or 0) * 1e3:.0f}ms]")
+        if self.sink is not None:
+            self.sink.write({"ts": time.time(), "from": old, "to": to, "level": self.level["name"],
+                             "reason": reason, "lag_s": round(lag, 3),
+                             "invoke_ms": round((self.invoke_ema or 0) * 1e3, 1), **r})
+        return True
+
+    def close(self) -> None:
+        if self.sink is not None:
+            self.sink.close()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--watch", action="store_true", help="print temperature/frequency once a second")
+    ap.add_argument("--sys-root", default="/", help="directory laid out like / (stand-in for tests)")
+    args = ap.parse_args()
+    if not args.watch:
+        ap.print_help()
+        raise SystemExit
+    try:
+        while True:
+            print(read_thermal(args.sys_root))
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,67 @@
+"""
+export_yamnet_features.py
+Convert YAMNet cut after its front end: a (96, 64) log-mel patch in, scores
+and the 1024-d embedding out.
+
+classify.py --features-model feeds it patches from logmel.LogMelStream, so the
+STFT/mel work shared by overlapping windows is done once in NumPy instead of
+inside every waveform-model invoke.
+
+Run on the desktop (needs TensorFlow), then copy the .tflite to the Pi and
+check it with `python scripts/rpi/logmel.py --validate`.
+
+Usage
+-----
+git clone https://github.com/tensorflow/models ~/tf-models
+curl -O https://storage.googleapis.com/audioset/yamnet.h5
+python scripts/rpi/export_yamnet_features.py --yamnet-src ~/tf-models/research/audioset/yamnet \
+       --weights yamnet.h5 [--quantize]
+
+Dependencies
+------------
+tensorflow, the yamnet.py / params.py sources from tensorflow/models
+"""
+import argparse
+import sys
+from pathlib import Path
+
+import tensorflow as tf
+
+OUT = "scripts/models/yamnet/yamnet_features.tflite"
+PATCH_FRAMES, MEL_BANDS = 96, 64
+
+
+def build(yamnet_src: str, weights: str) -> tf.keras.Model:
+    sys.path.insert(0, str(Path(yamnet_src).expanduser()))
+    import params as yamnet_params
+    import yamnet as yamnet_lib
+
+    params = yamnet_params.Params()
+    patch = tf.keras.layers.Input(batch_size=1, shape=(PATCH_FRAMES, MEL_BANDS), dtype=tf.float32, name="log_mel_patch")
+    # yamnet() is the part of yamnet_frames_model() after features_lib.waveform_to_log_mel_spectrogram_patches
+    scores, embeddings = yamnet_lib.yamnet(patch, params)
+    model = tf.keras.Model(inputs=patch, outputs=[scores, embeddings], name="yamnet_features")
+    model.load_weights(weights)    # same weighted layers, same order as yamnet_frames_model(); the front end has none
+    return model
+
+
+def convert(model: tf.keras.Model, quantize: bool) -> bytes:
+    conv = tf.lite.TFLiteConverter.from_keras_model(model)
+    if quantize:
+        conv.optimizations = [tf.lite.Optimize.DEFAULT]     # dynamic-range int8 weights
+    return conv.convert()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Export YAMNet as a log-mel patch → scores TFLite model")
+    ap.add_argument("--yamnet-src", required=True, help="tensorflow/models research/audioset/yamnet directory")
+    ap.add_argument("--weights", required=True, help="yamnet.h5")
+    ap.add_argument("--out", default=OUT)
+    ap.add_argument("--quantize", action="store_true", help="dynamic-range quantize the weights")
+    args = ap.parse_args()
+
+    model = build(args.yamnet_src, args.weights)
+    tfl = convert(model, args.quantize)
+    Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+    Path(args.out).write_bytes(tfl)
+    print(f"[DEBUG] wrote {args.out} ({len(tfl) / 1e6:.1f} MB)")
@@ -0,0 +1,278 @@
+"""
+inference_pool.py
+Multi-core YAMNet: a shared-memory audio ring plus one interpreter per worker process.
+
+In classify.py the capture loop, resampling, logging and inference all share
+one Python process, and the interpreter gets NUM_THREADS = 2 while the rest
+of the work holds the GIL. In pool mode the capture process only writes
+16 kHz samples into an AudioRing (multiprocessing.shared_memory) and submits
+window start positions. Each worker process has its own single-threaded
+interpreter. It copies its window straight out of the ring and returns the
+score vector, so no audio is pickled. Results carry a sequence number, and
+InterpreterPool.ready() hands them back in submission order.
+
+A worker whose window was overwritten before it read it (the ring lapped it
+because inference fell behind) returns None for that window instead of
+classifying stale audio.
+
+Usage
+-----
+ring = AudioRing(capacity=10 * 16_000)
+pool = InterpreterPool(MODEL, ring, workers=3)
+ring.write(block); pool.submit(start)
+for seq, start, scores in pool.ready(): ...
+pool.close(); ring.close(unlink=True)
+
+python scripts/rpi/inference_pool.py --benchmark --hops 0.5 0.25 0.125 --workers 2 3
+"""
+from __future__ import annotations
+
+import argparse
+import multiprocessing as mp
+import queue
+import signal
+import time
+from collections import deque
+from multiprocessing import shared_memory
+
+import numpy as np
+
+MODEL     = 'scripts/models/yamnet/tfLite/tflite/1/1.tflite'
+FRAME_LEN = 15_600
+TARGET_SR = 16_000
+N_CLASSES = 521
+LATENCY_KEEP = 10_000     # recent submit → result latencies kept for stats
+
+
+def make_interpreter(path: str, threads: int, frame_len: int = FRAME_LEN):
+    """Waveform YAMNet with a fixed frame_len input; returns (interpreter, input index, scores index)."""
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+        net = Interpreter(model_path=path, num_threads=threads)
+    except ImportError:
+        from tensorflow.lite.python.interpreter import Interpreter
+        net = Interpreter(model_path=path)
+    inp = net.get_input_details()[0]['index']
+    net.resize_tensor_input(inp, [frame_len], strict=True)
+    net.allocate_tensors()
+    out = next(d['index'] for d in net.get_output_details() if d['shape'][-1] == N_CLASSES)
+    return net, inp, out
+
+
+# ---------- shared ring ------------------------------------------------------ #
+class AudioRing:
+    """float32 ring in shared memory. Positions are absolute sample counts.
+
+    A two-int64 header works like a seqlock: [0] is the write position
+    (samples readable so far), [1] the end of the block being written. The
+    writer bumps [1] before it touches any sample and [0] after; a reader
+    checks [1] after its copy, so a window the writer overwrote even
+    partly while it was being read is reported as lapped.
+    """
+
+    def __init__(self, capacity: int, name: str | None = None):
+        self.capacity = capacity
+        self.shm = shared_memory.SharedMemory(name=name, create=name is None, size=16 + 4 * capacity)
+        self.name = self.shm.name
+        self._pos = np.ndarray((2,), dtype=np.int64, buffer=self.shm.buf, offset=0)
+        self.data = np.ndarray((capacity,), dtype=np.float32, buffer=self.shm.buf, offset=16)
+        if name is None:
+            self._pos[:] = 0
+
+    @property
+    def pos(self) -> int:
+        """Samples written so far."""
+        return int(self._pos[0])
+
+    def write(self, block: np.ndarray) -> None:
+        n, p = len(block), self.pos
+        if n > self.capacity:
+            block, p, n = block[-self.capacity:], p + n - self.capacity, self.capacity
+        self._pos[1] = p + n                    # announce the overwrite before the first sample changes
+        i = p % self.capacity
+        k = min(n, self.capacity - i)
+        self.data[i:i + k] = block[:k]
+        self.data[:n - k] = block[k:]
+        self._pos[0] = p + n                    # publish only after the samples are in
+
+    def read(self, start: int, out: np.ndarray) -> bool:
+        """Copy samples start … start+len(out) into *out*. False if part of it was already overwritten."""
+        n = len(out)
+        i = start % self.capacity
+        k = min(n, self.capacity - i)
+        out[:k] = self.data[i:i + k]
+        out[k:] = self.data[:n - k]
+        # checked after the copy against the write in progress: nothing lapped us meanwhile, not even partly
+        return int(self._pos[1]) - start <= self.capacity
+
+    def close(self, unlink: bool = False) -> None:
+        del self._pos, self.data                # drop the views before closing the mapping
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+# ---------- worker pool -------------------------------------------------------- #
+def _worker(model_path, ring_name, capacity, frame_len, threads, tasks, results):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)    # Ctrl-C is the parent's to handle; it sends us None
+    net, inp, out = make_interpreter(model_path, threads, frame_len)
+    ring = AudioRing(capacity, name=ring_name)
+    window = np.zeros(frame_len, dtype=np.float32)
+    net.set_tensor(inp, window)
+    net.invoke()                                # warm-up
+    results.put(("ready", None, None))
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        seq, start = task
+        if not ring.read(start, window):
+            results.put((seq, start, None))
+            continue
+        net.set_tensor(inp, window)
+        net.invoke()
+        results.put((seq, start, net.get_tensor(out)[0].copy()))
+    ring.close()
+
+
+class InterpreterPool:
+    def __init__(self, model_path: str, ring: AudioRing, workers: int = 3, threads: int = 1,
+                 frame_len: int = FRAME_LEN, start_method: str = "spawn"):
+        ctx = mp.get_context(start_method)
+        self.tasks, self.results = ctx.Queue(), ctx.Queue()
+        self.procs = [ctx.Process(target=_worker, daemon=True, name=f"yamnet-{i}",
+                                  args=(model_path, ring.name, ring.capacity, frame_len, threads,
+                                        self.tasks, self.results))
+                      for i in range(workers)]
+        for p in self.procs:
+            p.start()
+        ready = 0
+        while ready < workers:                  # every worker has its model loaded and warmed up
+            try:
+                self.results.get(timeout=1.0)
+                ready += 1
+            except queue.Empty:
+                dead = [p.name for p in self.procs if p.exitcode is not None]
+                if dead:
+                    self.close()
+                    raise RuntimeError(f"inference worker(s) {', '.join(dead)} exited during start-up")
+        self.seq = self.next = 0
+        self.done: dict[int, tuple] = {}
+        self.submitted: dict[int, float] = {}   # seq → submit time, for latency
+        self.latency: deque[float] = deque(maxlen=LATENCY_KEEP)
+        self.last_latency = 0.0                 # submit → result of the window ready() last yielded
+
+    @property
+    def pending(self) -> int:
+        """Windows submitted but not yet handed back by ready()."""
+        return self.seq - self.next
+
+    def submit(self, start: int) -> int:
+        seq = self.seq
+        self.seq += 1
+        self.submitted[seq] = time.perf_counter()
+        self.tasks.put((seq, start))
+        return seq
+
+    def ready(self, block: bool = False):
+        """Yield (seq, start, scores) in submission order; scores is None for a lapped window.
+
+        block=True waits until everything submitted so far has come back.
+        """
+        while self.pending:
+            if self.next not in self.done:
+                try:
+                    seq, start, scores = self.results.get() if block else self.results.get_nowait()
+                except queue.Empty:
+                    return
+                lat = time.perf_counter() - self.submitted.pop(seq)
+                self.done[seq] = (start, scores, lat)
+                self.latency.append(lat)
+                continue
+            start, scores, self.last_latency = self.done.pop(self.next)
+            yield self.next, start, scores
+            self.next += 1
+
+    def close(self) -> None:
+        for _ in self.procs:
+            self.tasks.put(None)
+        for p in self.procs:
+            p.join(timeout=5)
+            if p.is_alive():
+                p.terminate()
+
+
+# ---------- benchmark ---------------------------------------------------------- #
+def _bench_single(model_path, audio, hop, threads):
+    net, inp, out = make_interpreter(model_path, threads)
+    net.set_tensor(inp, audio[:FRAME_LEN])
+    net.invoke()
+    starts = range(0, len(audio) - FRAME_LEN + 1, hop)
+    lat = []
+    t0 = time.perf_counter()
+    for s in starts:
+        t = time.perf_counter()
+        window = audio[s:s + FRAME_LEN]
+        net.set_tensor(inp, window)
+        net.invoke()
+        scores = net.get_tensor(out)[0]
+        scores.argsort()[-1:]                                   # same post-processing as classify.py
+        np.sqrt(np.mean(window ** 2))
+        lat.append(time.perf_counter() - t)
+    return len(starts), time.perf_counter() - t0, lat
+
+
+def _bench_pool(model_path, audio, hop, workers):
+    ring = AudioRing(capacity=10 * TARGET_SR)
+    pool = InterpreterPool(model_path, ring, workers=workers)
+    n, nxt, got = 0, 0, 0
+    t0 = time.perf_counter()
+    for b in range(0, len(audio), hop):
+        while pool.pending > 2 * workers:                       # keep the ring from lapping the workers
+            for _, _, scores in pool.ready():
+                got += scores is not None
+            time.sleep(0.0005)
+        ring.write(audio[b:b + hop])
+        while ring.pos >= nxt + FRAME_LEN:
+            pool.submit(nxt)
+            nxt += hop
+            n += 1
+    for _, _, scores in pool.ready(block=True):
+        got += scores is not None
+    wall = time.perf_counter() - t0
+    lat = pool.latency
+    pool.close()
+    ring.close(unlink=True)
+    return got, wall, lat
+
+
+def benchmark(model_path: str, hops: list[float], workers: list[int], seconds: float, threads: int) -> None:
+    import platform
+    rng = np.random.default_rng(0)
+    audio = (0.1 * rng.standard_normal(int(seconds * TARGET_SR))).astype(np.float32)
+    print(f"[DEBUG] {platform.machine()}, {mp.cpu_count()} cores, {seconds:.0f} s of audio per run")
+    print(f"{'hop s':>6}  {'mode':<22}{'windows/s':>10}{'needed':>8}{'x realtime':>12}{'p50 ms':>8}{'p95 ms':>8}")
+    for hop_sec in hops:
+        hop = int(hop_sec * TARGET_SR)
+        runs = [(f"single, {threads} threads", lambda: _bench_single(model_path, audio, hop, threads))]
+        runs += [(f"pool, {w} workers", lambda w=w: _bench_pool(model_path, audio, hop, w)) for w in workers]
+        for name, fn in runs:
+            n, wall, lat = fn()
+            rate = n / wall
+            p50, p95 = np.percentile(lat, [50, 95]) * 1e3
+            print(f"{hop_sec:>6.3f}  {name:<22}{rate:>10.1f}{1 / hop_sec:>8.1f}{rate * hop_sec:>11.2f}x{p50:>8.1f}{p95:>8.1f}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--benchmark", action="store_true", help="single-process vs. pool throughput per hop size")
+    ap.add_argument("--model", default=MODEL)
+    ap.add_argument("--hops", type=float, nargs="+", default=[0.5, 0.25, 0.125])
+    ap.add_argument("--workers", type=int, nargs="+", default=[2, 3])
+    ap.add_argument("--threads", type=int, default=2, help="interpreter threads of the single-process run")
+    ap.add_argument("--seconds", type=float, default=30.0)
+    args = ap.parse_args()
+    if args.benchmark:
+        benchmark(args.model, args.hops, args.workers, args.seconds, args.threads)
+    else:
+        ap.print_help()
@@ -0,0 +1,206 @@
+"""
+logmel.py
+YAMNet's log-mel front end in NumPy, computed incrementally.
+
+With a 0.975 s window and a 0.5 s hop, consecutive YAMNet inputs share
+46 of their 96 STFT frames, and the waveform model recomputes all of them on
+every invoke. LogMelStream instead turns each new block of 16 kHz samples
+into its new frames only (carrying the < 25 ms of samples that don't yet
+fill a frame) and keeps the recent frames in a buffer. Any window starting on
+a 10 ms boundary is then just a (96, 64) slice of that buffer, ready for a
+"features → scores" TFLite model (see export_yamnet_features.py).
+
+Matches yamnet/features.py: 25 ms periodic-Hann frames every 10 ms, 512-point
+|rfft|, 64 HTK-mel bands 125–7500 Hz (tf.signal.linear_to_mel_weight_matrix),
+log(mel + 0.001); 96-frame patches.
+
+Usage
+-----
+mel = LogMelStream(keep_frames=400)
+f0  = mel.push(chunk_16k)                      # absolute frame index of chunk[0]
+x   = mel.patch(f0 + start // STFT_HOP)        # (96, 64) float32 view
+
+python scripts/rpi/logmel.py --validate [file.wav]   # NumPy vs. waveform model, features model vs. waveform model
+"""
+from __future__ import annotations
+
+import argparse
+import math
+import os
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+SAMPLE_RATE  = 16_000
+STFT_WIN     = 400        # 25 ms
+STFT_HOP     = 160        # 10 ms
+FFT_LEN      = 512
+MEL_BANDS    = 64
+MEL_MIN_HZ   = 125.0
+MEL_MAX_HZ   = 7_500.0
+LOG_OFFSET   = 0.001
+PATCH_FRAMES = 96         # 0.96 s
+WINDOW_SAMPLES = STFT_WIN + (PATCH_FRAMES - 1) * STFT_HOP     # 15 600, YAMNet's FRAME_LEN
+
+
+def _hz_to_mel(f):
+    return 1127.0 * np.log1p(np.asarray(f, dtype=np.float64) / 700.0)
+
+
+def mel_matrix(n_bins: int = FFT_LEN // 2 + 1) -> np.ndarray:
+    """(n_bins, MEL_BANDS) weights, same construction as tf.signal.linear_to_mel_weight_matrix."""
+    freqs = np.linspace(0.0, SAMPLE_RATE / 2, n_bins)[1:]               # DC band stays zero
+    spec_mel = _hz_to_mel(freqs)[:, None]
+    edges = np.linspace(_hz_to_mel(MEL_MIN_HZ), _hz_to_mel(MEL_MAX_HZ), MEL_BANDS + 2)
+    lower, center, upper = edges[:-2], edges[1:-1], edges[2:]
+    w = np.maximum(0.0, np.minimum((spec_mel - lower) / (center - lower),
+                                   (upper - spec_mel) / (upper - center)))
+    return np.vstack([np.zeros((1, MEL_BANDS)), w]).astype(np.float32)
+
+
+HANN = (0.5 - 0.5 * np.cos(2 * math.pi * np.arange(STFT_WIN) / STFT_WIN)).astype(np.float32)   # periodic
+MEL  = mel_matrix()
+
+
+def log_mel_frames(samples: np.ndarray) -> np.ndarray:
+    """(n_frames, 64) log-mel of every complete 25 ms frame in *samples* (no padding)."""
+    samples = np.asarray(samples, dtype=np.float32)
+    if len(samples) < STFT_WIN:
+        return np.zeros((0, MEL_BANDS), dtype=np.float32)
+    frames = sliding_window_view(samples, STFT_WIN)[::STFT_HOP] * HANN
+    mag = np.abs(np.fft.rfft(frames, FFT_LEN)).astype(np.float32)
+    mel = mag @ MEL
+    mel += LOG_OFFSET
+    return np.log(mel, out=mel)
+
+
+class LogMelStream:
+    """Log-mel frames of a continuous 16 kHz stream, each frame computed exactly once."""
+
+    def __init__(self, keep_frames: int = 2 * PATCH_FRAMES):
+        self.keep = max(keep_frames, PATCH_FRAMES)
+        self.tail = np.zeros(0, dtype=np.float32)      # samples not yet covered by a full frame
+        self.buf = np.zeros((0, MEL_BANDS), dtype=np.float32)
+        self.start = 0                                  # absolute frame index of buf[0]
+        self.samples = 0                                # samples pushed so far
+
+    def reset(self) -> None:
+        """Start over (after a gap in the stream); frame indices restart at 0."""
+        self.__init__(self.keep)
+
+    def push(self, block: np.ndarray) -> int:
+        """Add new samples. Returns the absolute frame index that starts at block[0]."""
+        if self.samples % STFT_HOP:
+            raise ValueError(f"blocks must be multiples of {STFT_HOP} samples to keep frames aligned")
+        f0 = self.samples // STFT_HOP
+        self.samples += len(block)
+        s = np.concatenate((self.tail, block)) if len(self.tail) else np.asarray(block, dtype=np.float32)
+        new = log_mel_frames(s)
+        self.tail = s[len(new) * STFT_HOP:].copy()     # *block* may be a reused buffer
+        buf = np.concatenate((self.buf, new)) if len(self.buf) else new
+        drop = max(0, len(buf) - self.keep)
+        self.buf, self.start = buf[drop:], self.start + drop
+        return f0
+
+    @property
+    def end(self) -> int:
+        """One past the newest complete frame."""
+        return self.start + len(self.buf)
+
+    def patch(self, first_frame: int) -> np.ndarray:
+        """(96, 64) view of the frames first_frame … first_frame+95."""
+        i = first_frame - self.start
+        if i < 0 or i + PATCH_FRAMES > len(self.buf):
+            raise IndexError(f"frames {first_frame}..{first_frame + PATCH_FRAMES} not buffered "
+                             f"(have {self.start}..{self.end})")
+        return self.buf[i:i + PATCH_FRAMES]
+
+
+# ---------- validation --------------------------------------------------------- #
+def _interpreter(path: str, threads: int = 2):
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+        return Interpreter(model_path=path, num_threads=threads)
+    except ImportError:
+        from tensorflow.lite.python.interpreter import Interpreter
+        return Interpreter(model_path=path)
+
+
+def _test_signal(sec: float = 20.0) -> np.ndarray:
+    """Speech-band noise bursts, tones and silence when no recording is given."""
+    rng = np.random.default_rng(0)
+    t = np.arange(int(sec * SAMPLE_RATE)) / SAMPLE_RATE
+    x = 0.05 * rng.standard_normal(len(t)) * (np.sin(2 * np.pi * 0.3 * t) > 0)
+    x += 0.2 * np.sin(2 * np.pi * (440 + 200 * np.sin(2 * np.pi * 0.1 * t)) * t) * (np.sin(2 * np.pi * 0.17 * t) > 0.3)
+    return x.astype(np.float32)
+
+
+def validate(waveform_model: str, features_model: str | None, wav: str | None, hop: int = 8_000) -> None:
+    if wav:
+        import soundfile as sf
+        from scipy.signal import resample_poly
+        x, sr = sf.read(wav, dtype="float32", always_2d=True)
+        x = x.mean(axis=1)
+        if sr != SAMPLE_RATE:
+            g = math.gcd(sr, SAMPLE_RATE)
+            x = resample_poly(x, SAMPLE_RATE // g, sr // g).astype(np.float32)
+    else:
+        x = _test_signal()
+
+    wave = _interpreter(waveform_model)
+    w_in = wave.get_input_details()[0]
+    wave.resize_tensor_input(w_in["index"], [WINDOW_SAMPLES], strict=True)
+    wave.allocate_tensors()
+    outs = wave.get_output_details()
+    w_scores = outs[0]["index"]
+    w_mel = next((d["index"] for d in outs if d["shape"][-1] == MEL_BANDS), None)
+
+    feat = None
+    if features_model:
+        feat = _interpreter(features_model)
+        feat.allocate_tensors()
+        f_in = feat.get_input_details()[0]
+        f_scores = next(d["index"] for d in feat.get_output_details() if d["shape"][-1] == 521)
+
+    mel = LogMelStream(keep_frames=4 * PATCH_FRAMES)
+    mel_err, score_err, agree, n = 0.0, 0.0, 0, 0
+    for start in range(0, len(x) - WINDOW_SAMPLES + 1, hop):
+        # push only what the stream hasn't seen yet, as classify.py would
+        if mel.samples < start + WINDOW_SAMPLES:
+            upto = start + WINDOW_SAMPLES + (-(start + WINDOW_SAMPLES) % STFT_HOP)
+            mel.push(x[mel.samples:upto])
+        patch = mel.patch(start // STFT_HOP)
+
+        wave.set_tensor(w_in["index"], x[start:start + WINDOW_SAMPLES])
+        wave.invoke()
+        ref = wave.get_tensor(w_scores)[0]
+        if w_mel is not None:
+            mel_err = max(mel_err, float(np.abs(wave.get_tensor(w_mel) - patch).max()))
+        if feat is not None:
+            feat.set_tensor(f_in["index"], patch.reshape(f_in["shape"]))
+            feat.invoke()
+            got = feat.get_tensor(f_scores).reshape(-1)
+            score_err = max(score_err, float(np.abs(got - ref).max()))
+            agree += int(got.argmax() == ref.argmax())
+        n += 1
+
+    print(f"[DEBUG] {n} windows, hop {hop} samples")
+    if w_mel is not None:
+        print(f"[DEBUG] log-mel   max |numpy - waveform model| = {mel_err:.2e}")
+    if feat is not None:
+        print(f"[DEBUG] scores    max |features - waveform model| = {score_err:.2e}, top-1 agreement {agree}/{n}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--validate", nargs="?", const="", metavar="WAV",
+                    help="compare against the waveform model (synthetic audio if no WAV)")
+    ap.add_argument("--waveform-model", default="scripts/models/yamnet/tfLite/tflite/1/1.tflite")
+    ap.add_argument("--features-model", default="scripts/models/yamnet/yamnet_features.tflite")
+    ap.add_argument("--hop", type=int, default=8_000, help="window hop in samples (multiple of 160)")
+    args = ap.parse_args()
+    if args.validate is None:
+        ap.print_help()
+    else:
+        validate(args.waveform_model, args.features_model if os.path.exists(args.features_model) else None,
+                 args.validate or None, args.hop)
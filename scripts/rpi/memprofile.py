@@ -0,0 +1,112 @@
+"""
+memprofile.py
+Memory trend of a long classify.py run: RSS over time plus tracemalloc's top allocators.
+
+pm2 restarts yamnet-classifying at max_memory_restart 300M (ecosystem.config.cjs).
+A flat-looking process that gains a few kB per window hits that limit after
+days. To see it in an hour instead, classify.py --profile-memory replays a
+recording as fast as it can be classified, with MemoryProfile sampling after
+every SAMPLE_SEC of audio:
+
+  rss_mb        resident set size (/proc/self/statm)
+  traced_mb     Python heap tracemalloc can see (NumPy buffers included)
+  top           the TOP lines whose allocations grew most since the baseline
+
+The baseline is the first sample, so model loading and warm-up are not
+counted as growth. report() fits a line through the RSS samples after the
+first few minutes and extrapolates it to a week. Every sample also goes to
+output/memory_profile.ndjson.
+
+Usage
+-----
+python scripts/rpi/classify.py --replay rec.wav --replay-sec 3600 --profile-memory --no-publish
+"""
+from __future__ import annotations
+
+import os
+import resource
+import time
+import tracemalloc
+
+import numpy as np
+
+from inferencing.event_sink import EventSink
+
+SAMPLE_SEC  = 60.0       # audio seconds between samples
+TOP         = 10
+SETTLE_SEC  = 300.0      # ignore the first 5 min of audio in the trend fit
+LOG_PATH    = "output/memory_profile.ndjson"
+
+
+def _snapshot() -> tracemalloc.Snapshot:
+    """Current allocations minus tracemalloc's and this module's own bookkeeping."""
+    return tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap*>")))
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:                                     # no procfs (macOS): peak instead of current
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**20
+
+
+class MemoryProfile:
+    def __init__(self, sample_sec: float = SAMPLE_SEC, top: int = TOP, frames: int = 1,
+                 log_path: str | None = LOG_PATH):
+        self.sample_sec, self.top = sample_sec, top
+        tracemalloc.start(frames)
+        self.baseline = None
+        self.next_at = 0.0
+        self.t0 = time.monotonic()
+        self.audio: list[float] = []
+        self.rss: list[float] = []
+        self.sink = EventSink(log_path) if log_path else None
+
+    def tick(self, audio_sec: float) -> None:
+        """Call once per chunk with the seconds of audio classified so far."""
+        if audio_sec >= self.next_at:
+            self.next_at = audio_sec + self.sample_sec
+            self.sample(audio_sec)
+
+    def _growth(self, snap):
+        if self.baseline is None:
+            return []
+        return [s for s in snap.compare_to(self.baseline, "lineno") if s.size_diff > 0][:self.top]
+
+    def sample(self, audio_sec: float) -> None:
+        rss = rss_mb()
+        traced, peak = tracemalloc.get_traced_memory()
+        snap = _snapshot()
+        top = self._growth(snap)
+        if self.baseline is None:
+            self.baseline = snap
+        self.audio.append(audio_sec)
+        self.rss.append(rss)
+        print(f"[MEM] audio {audio_sec / 60:6.1f} min  wall {(time.monotonic() - self.t0) / 60:6.1f} min  "
+              f"rss {rss:7.1f} MB  traced {traced / 2**20:6.1f} MB (peak {peak / 2**20:.1f})")
+        if self.sink is not None:
+            self.sink.write({"ts": time.time(), "audio_sec": round(audio_sec, 1), "rss_mb": round(rss, 2),
+                             "traced_mb": round(traced / 2**20, 3), "peak_mb": round(peak / 2**20, 3),
+                             "top": [[str(s.traceback[0]), s.size_diff, s.count_diff] for s in top]})
+
+    def report(self) -> None:
+        """Top allocators since the baseline and the RSS trend, extrapolated to a week."""
+        snap = _snapshot()
+        print(f"[MEM] top {self.top} allocation sites grown since baseline:")
+        for s in self._growth(snap):
+            print(f"[MEM]   {s.size_diff / 1024:+9.1f} KiB  {s.count_diff:+7d} blocks  {s.traceback[0]}")
+        a, r = np.asarray(self.audio), np.asarray(self.rss)
+        keep = a >= SETTLE_SEC
+        if keep.sum() >= 3:
+            slope = np.polyfit(a[keep] / 3600, r[keep], 1)[0]      # MB per hour of audio
+            print(f"[MEM] rss {r[keep][0]:.1f} → {r[-1]:.1f} MB; trend {slope:+.2f} MB/h "
+                  f"→ {slope * 24 * 7:+.0f} MB per week of uptime")
+        else:
+            print(f"[MEM] not enough samples after {SETTLE_SEC / 60:.0f} min of audio for a trend")
+        if self.sink is not None:
+            self.sink.close()
+        tracemalloc.stop()
@@ -0,0 +1,138 @@
+"""
+model_scheduler.py
+Run a heavier second model next to YAMNet without falling behind real time.
+
+classify.py runs YAMNet on every 0.5 s hop. A second model (PANNs CNN14 for
+now) is far too slow for that on a Pi, so BudgetScheduler decides, window by
+window, whether it may run:
+
+  triggers   – every `every`-th window, or when YAMNet is ambiguous (top-1
+               confidence inside `ambiguous` or top-1/top-2 margin below
+               `margin`), or when the activity gate fires (level `gate_db`
+               above the slowly tracked noise floor)
+  budget     – a token bucket in seconds of CPU: each window adds
+               budget × hop_sec, capped so YAMNet's own measured cost plus a
+               safety margin always fits in the hop; a run needs the EMA of
+               the second model's invoke time and spends what it really took
+  backlog    – nothing runs while audio blocks are queueing up
+
+So the effective cadence adapts to measured latency: a slow model, a busy
+CPU or a hot (throttled) Pi simply runs less often.
+
+Usage
+-----
+sched  = BudgetScheduler(hop_sec=0.5, budget=0.35, every=10)
+second = Cnn14Model(labels)              # labels = YAMNet display names
+if sched.should_run(top1, top2, db_now, backlog=q.qsize()):
+    t0 = time.perf_counter(); scores = second.predict(window); sched.record(time.perf_counter() - t0)
+"""
+from __future__ import annotations
+
+import math
+
+import numpy as np
+from scipy.signal import resample_poly
+
+
+class BudgetScheduler:
+    def __init__(self, hop_sec: float, budget: float = 0.35, every: int = 10,
+                 ambiguous: tuple[float, float] = (0.2, 0.5), margin: float = 0.1,
+                 gate_db: float = 10.0, safety: float = 0.2, max_backlog: int = 2):
+        self.hop_sec, self.budget, self.every = hop_sec, budget, every
+        self.ambiguous, self.margin, self.gate_db = ambiguous, margin, gate_db
+        self.safety, self.max_backlog = safety, max_backlog
+        self.credit = 0.0
+        self.cap = 4 * hop_sec            # never bank more than a couple of runs (but always enough for one)
+        self.cost_ema = None              # second model invoke, seconds
+        self.base_ema = 0.0               # first model's per-window cost, seconds
+        self.floor_db = None
+        self.since_run = 0
+        self.stats = {"windows": 0, "runs": 0, "no_trigger": 0, "no_budget": 0, "backlog": 0}
+
+    # ---------- bookkeeping ---------------------------------------------------- #
+    def observe_base(self, sec: float) -> None:
+        """Per-window cost of everything that always runs (YAMNet invoke etc.)."""
+        self.base_ema = 0.9 * self.base_ema + 0.1 * sec
+
+    def record(self, sec: float) -> None:
+        """A second-model run took *sec*."""
+        self.credit -= sec
+        self.cost_ema = sec if self.cost_ema is None else 0.8 * self.cost_ema + 0.2 * sec
+        self.since_run = 0
+        self.stats["runs"] += 1
+
+    @property
+    def cadence(self) -> float:
+        """Windows per run the budget can sustain right now (≥ 1; inf when there is no headroom at all)."""
+        if not self.cost_ema:
+            return 1.0
+        rate = self._accrual()
+        return math.inf if rate <= 0 else max(1.0, self.cost_ema / rate)
+
+    def _accrual(self) -> float:
+        free = self.hop_sec * (1 - self.safety) - self.base_ema   # real-time headroom per hop
+        return max(0.0, min(self.budget * self.hop_sec, free))
+
+    # ---------- decision ------------------------------------------------------- #
+    def should_run(self, top1: float, top2: float, db_now: float, backlog: int = 0) -> bool:
+        self.stats["windows"] += 1
+        self.since_run += 1
+        accrual = self._accrual()
+        # a model slower than the cap must still be able to save up for one run
+        self.credit = min(max(self.cap, (self.cost_ema or 0.0) + accrual), self.credit + accrual)
+        if self.floor_db is None or db_now < self.floor_db:
+            self.floor_db = db_now                               # floor drops at once ...
+        else:
+            self.floor_db += 0.005 * (db_now - self.floor_db)    # ... and creeps up slowly
+
+        if backlog > self.max_backlog:
+            self.stats["backlog"] += 1
+            return False
+        lo, hi = self.ambiguous
+        triggered = (self.since_run >= self.every
+                     or lo <= top1 < hi
+                     or top1 - top2 < self.margin
+                     or db_now - self.floor_db >= self.gate_db)
+        if not triggered:
+            self.stats["no_trigger"] += 1
+            return False
+        if self.credit < (self.cost_ema or 0.0):
+            self.stats["no_budget"] += 1
+            return False
+        return True
+
+    def summary(self) -> str:
+        s = self.stats
+        ema = f"{self.cost_ema * 1e3:.0f} ms" if self.cost_ema else "n/a"
+        cadence = self.cadence
+        sustain = "never (no real-time headroom)" if math.isinf(cadence) else f"1/{cadence:.1f}"
+        return (f"{s['runs']}/{s['windows']} windows, invoke {ema}, yamnet {self.base_ema * 1e3:.0f} ms, "
+                f"sustainable {sustain}, skipped: {s['no_budget']} budget, {s['backlog']} backlog")
+
+
+class Cnn14Model:
+    """PANNs CNN14 (AudioSet, 32 kHz) with its scores re-indexed to YAMNet's class list."""
+    name = "cnn14"
+    SR = 32_000
+
+    def __init__(self, yamnet_labels, checkpoint: str | None = None):
+        from panns_inference import AudioTagging
+
+        kw = {"checkpoint_path": checkpoint} if checkpoint else {}
+        self.tagger = AudioTagging(device="cpu", **kw)
+        # both are AudioSet ontologies; YAMNet dropped 6 classes, match by display name
+        yam_idx = {n: i for i, n in enumerate(yamnet_labels)}
+        pairs = [(c, yam_idx[n]) for c, n in enumerate(self.tagger.labels) if n in yam_idx]
+        self.src = np.array([c for c, _ in pairs])
+        self.dst = np.array([y for _, y in pairs])
+        self.scores = np.zeros(len(yamnet_labels), dtype=np.float32)   # reused every call
+
+    def predict(self, window_16k: np.ndarray) -> np.ndarray:
+        """Scores over YAMNet's indices (classes CNN14 lacks stay 0). The returned array is reused."""
+        wav = resample_poly(window_16k, self.SR // 16_000, 1).astype(np.float32)
+        clipwise, _ = self.tagger.inference(wav[None, :])
+        self.scores[self.dst] = clipwise[0, self.src]
+        return self.scores
+
+
+SECOND_MODELS = {"cnn14": Cnn14Model}
@@ -1,9 +1,8 @@
 #!/usr/bin/env python3
-import os
 import csv
-import json
 import time
 import asyncio
+import sys
 from pathlib import Path
 from collections import deque
 
@@ -14,6 +13,10 @@ import sounddevice as sd
 
 import ai_edge_litert.interpreter as litert
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))  # scripts/
+from inferencing.event_sink import EventSink
+from inferencing.frontend import FrontEnd, Meter
+
 # ——— USER SETTINGS ————————————————————————————————————————————————
 INPUT_DEVICE_NAME = "USB PnP Sound Device: Audio (hw:2,0)"  # adjust to match an item in sd.query_devices()
 HOP_SEC           = 0.5       # hop length in seconds (50% overlap)
@@ -27,6 +30,7 @@ FLUSH_SEC         = 5         # write results to disk every N seconds
 ACCUM_SEC         = 3         # time window over which dominant label is decided
 TOP_K             = 1         # how many labels to report each window
 HP_FC             = 100       # one-pole high-pass corner frequency (Hz)
+FRONTEND          = True      # hard-knee compressor, then high-pass (False = raw audio)
 
 DEBUG            = True      # print top-5 scores even if below threshold
 QUEUE_SIZE       = 8         # queue to ease callback pressure
@@ -118,29 +122,13 @@ HOP_LEN    = int(HOP_SEC * 16000)       # Calculate hop length at 16 kHz
 
 print(f"Buffering {FRAME_LEN} samples (~{WINDOW_SEC:.3f}s) with {HOP_LEN}-sample hop")
 
-# ——— helper utils ————————————————————————————————————————
-def compressor(audio, thr=0.1, ratio=4.0):
-    """Very cheap soft-knee compressor to reduce mic clipping artefacts."""
-    a = np.copy(audio)
-    mask = np.abs(a) > thr
-    a[mask] = np.sign(a[mask]) * (thr + (np.abs(a[mask]) - thr) / ratio)
-    return a
-
-def hipass(x, fs_in, fc=HP_FC):
-    """Single-pole high-pass primarily to rm traffic rumble < 100 Hz."""
-    if fc <= 0:
-        return x
-    alpha = np.exp(-2.0 * np.pi * fc / fs_in)
-    y = np.empty_like(x)
-    y[0] = x[0]
-    for n in range(1, len(x)):
-        y[n] = alpha * y[n-1] + x[n] - x[n-1]
-    return y
-
-def rms_db(x):
-    """Return RMS level in dBFS (0 dBFS = full-scale)."""
-    rms = np.sqrt(np.mean(np.square(x), dtype=np.float64))
-    return 20.0 * np.log10(rms + 1e-12)
+# ——— front end ————————————————————————————————————————————
+# hard-knee compressor (mic clipping artefacts), then high-pass (traffic rumble
+# < HP_FC) – the prototype's original order – applied once to each new block
+# with the filter state carried over
+compressor = FrontEnd(fs_native, hp_fc=None, knee=0, enabled=FRONTEND)
+hipass     = FrontEnd(fs_native, hp_fc=HP_FC, compress=False, enabled=FRONTEND)
+meter      = Meter(fs_native)
 
 # ————————————————————————————————————————————————————————————————
 
@@ -162,20 +150,20 @@ async def producer(q):
 async def consumer(q):
     buf = np.zeros(FRAME_LEN, dtype='float32')
     accum = deque()
-    ram_buffer = []
-    last_flush = time.time()
+    # newline-delimited JSON, appended + fsynced every FLUSH_SEC by a background thread
+    sink = EventSink(OUTPUT_JSON, flush_sec=FLUSH_SEC)
 
     while True:
         chunk = await q.get()
-        buf = np.roll(buf, -len(chunk))
-        buf[-len(chunk):] = chunk
 
         # ===  meter before comp =========
-        db_now = rms_db(chunk) 
+        db_now = meter.update(chunk)
 
-        # light front-end conditioning
-        cmp = compressor(buf)
-        cmp = hipass(cmp, fs_native)
+        # light front-end conditioning of the new samples only, shifted in place
+        n = len(chunk)
+        buf[:-n] = buf[n:]
+        buf[-n:] = hipass.process(compressor.process(chunk))
+        cmp = buf
 
         # Resample/trim/pad to exactly MODEL_INPUT_LEN @ 16 kHz
         if fs_native != 16000:
@@ -229,7 +217,7 @@ async def consumer(q):
             }
             print(f"{ts:.2f} → {entry['cl']} "
                   f"({entry['cf']}%)  {entry['db']} dBFS")
-            ram_buffer.append(entry)
+            sink.write(entry)
 
         # if nothing crossed the threshold but DEBUG is on, still print one line
         if DEBUG and not printed:
@@ -237,18 +225,6 @@ async def consumer(q):
             print(f"buggy {time.time():.2f}  {db_now:5.1f} dB  "
                 f"{class_names[i]} {mean_scores[i]*100:.1f}%")
 
-
-        # Periodic, append-only disk write (newline-delimited JSON)
-        now = time.time()
-        if now - last_flush >= FLUSH_SEC and ram_buffer:
-            with open(OUTPUT_JSON, "a") as f:
-                for e in ram_buffer:
-                    f.write(json.dumps(e) + "\n")
-                f.flush()            # push to kernel
-                os.fsync(f.fileno()) # push to SD card
-            ram_buffer.clear()
-            last_flush = now
-
 async def main():
     q = asyncio.Queue(maxsize=QUEUE_SIZE)  # back-pressure if consumer stalls
     print("+++++ LOOPING +++++")
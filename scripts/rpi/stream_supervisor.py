@@ -0,0 +1,136 @@
+"""
+stream_supervisor.py
+Keep classify.py's sd.InputStream alive: detect a stalled or failed stream and rebuild only the stream.
+
+A USB mic that drops off the bus, an ALSA xrun PortAudio can't recover from,
+or a stream that just stops calling back used to leave classify.py waiting on
+q.get() until pm2 or systemd restarted the whole process. A restart reloads
+the interpreter, reconnects MQTT and re-warms everything.
+
+StreamSupervisor watches the callback's heartbeat. When no block has arrived
+within STALL_BLOCKS block durations, or PortAudio finished the stream on its
+own, it aborts the stream, re-initialises PortAudio (so a re-plugged device
+is seen again) and calls the caller's open_stream(). That re-resolves the
+device through find_device and starts a new stream. The interpreter, buffers
+and MQTT connection are never touched. A failed rebuild is retried every
+RETRY_SEC.
+
+Each outage is recorded as an explicit interval in output/outages.ndjson:
+start (capture time just after the last good block), end (capture time of the
+first block after recovery), the reason, attempts and the rebuild time.
+
+Usage
+-----
+sup = StreamSupervisor(open_stream, block_sec=0.5)
+stream = sup.start()
+# in the audio callback:   sup.beat(t_first + frames / sr)
+# in the main loop:        sup.check(); ...; if sup.got(t_block): reset_buffers()
+# in sd.InputStream(...):  finished_callback=sup.finished
+"""
+from __future__ import annotations
+
+import time
+from typing import Callable
+
+from inferencing.event_sink import EventSink
+
+STALL_BLOCKS = 4          # no callback for this many block durations = stalled
+RETRY_SEC    = 2.0
+LOG_PATH     = "output/outages.ndjson"
+
+
+class StreamSupervisor:
+    def __init__(self, open_stream: Callable[[], object], block_sec: float, stall_blocks: int = STALL_BLOCKS,
+                 retry_sec: float = RETRY_SEC, log_path: str | None = LOG_PATH):
+        self.open_stream = open_stream
+        self.stall_sec = stall_blocks * block_sec
+        self.retry_sec = retry_sec
+        self.stream = None
+        self.last_beat = time.monotonic()
+        self.failed: str | None = None      # set from PortAudio's thread by finished()
+        self.outage: dict | None = None     # open interval, closed by the first block after recovery
+        self.last_end = None                # capture time just after the last block the callback delivered
+        self.next_try = 0.0
+        self.outages = 0
+        self.sink = EventSink(log_path) if log_path else None
+
+    def start(self):
+        self.stream = self.open_stream()
+        self.last_beat = time.monotonic()
+        return self.stream
+
+    # ---------- called from the audio thread -------------------------------------- #
+    def beat(self, t_end: float) -> None:
+        """Every callback, with the capture time just after its last sample."""
+        self.last_beat = time.monotonic()
+        self.last_end = t_end
+
+    def finished(self) -> None:
+        """finished_callback: PortAudio stopped the stream (error, device gone, or our own stop)."""
+        if self.failed is None:
+            self.failed = "stream finished"
+
+    # ---------- called from the main loop ----------------------------------------- #
+    def check(self) -> None:
+        """Rebuild the stream if it has failed or stalled; cheap when it is healthy."""
+        now = time.monotonic()
+        if self.outage is None:
+            if self.failed is not None:
+                reason = self.failed
+            elif now - self.last_beat > self.stall_sec:
+                reason = f"no audio for {now - self.last_beat:.1f}s"
+            else:
+                return
+            self.outage = {"start": self.last_end if self.last_end is not None else time.time(),
+                           "reason": reason, "attempts": 0}
+            print(f"[AUDIO OUTAGE] {reason}; rebuilding the input stream")
+        elif now < self.next_try or (self.stream is not None and self.failed is None
+                                     and now - self.last_beat <= self.stall_sec):
+            return                              # backing off, or rebuilt and waiting for its first block
+        self._rebuild()
+
+    def _rebuild(self) -> None:
+        import sounddevice as sd
+        self.outage["attempts"] += 1
+        t0 = time.perf_counter()
+        old, self.stream = self.stream, None
+        if old is not None:
+            try:
+                old.abort(ignore_errors=True)
+                old.close(ignore_errors=True)
+            except Exception as e:
+                print(f"[ERROR] closing the old stream: {e}")
+        try:
+            sd._terminate()                     # rescan devices: a re-plugged mic gets a new index
+            sd._initialize()
+            self.failed = None
+            self.stream = self.open_stream()
+        except Exception as e:
+            self.stream = None
+            self.next_try = time.monotonic() + self.retry_sec
+            print(f"[ERROR] stream rebuild attempt {self.outage['attempts']} failed: {e}; retrying in {self.retry_sec:g}s")
+            return
+        self.outage["rebuild_ms"] = round((time.perf_counter() - t0) * 1e3, 1)
+        self.last_beat = time.monotonic()
+        print(f"[DEBUG] input stream rebuilt in {self.outage['rebuild_ms']:.0f} ms "
+              f"(attempt {self.outage['attempts']})")
+
+    def got(self, t_block: float) -> bool:
+        """True for the first dequeued block captured after an open outage (which is then closed and logged)."""
+        if self.outage is None or self.stream is None or t_block < self.outage["start"]:
+            return False                        # still draining blocks from before the outage
+        o, self.outage = self.outage, None
+        o["end"] = t_block
+        o["duration_s"] = round(o["end"] - o["start"], 3)
+        self.outages += 1
+        print(f"[AUDIO OUTAGE] {o['duration_s']:.2f}s of audio lost ({o['reason']})")
+        if self.sink is not None:
+            self.sink.write(o)
+        return True
+
+    def close(self) -> None:
+        if self.stream is not None:
+            self.failed = "closing"             # our own stop fires finished_callback too
+            self.stream.stop()
+        if self.sink is not None:
+            self.sink.close()
@@ -0,0 +1,99 @@
+"""
+summary.py
+Per-interval class histograms for classify.py --summarize: one MQTT message a minute instead of one per window.
+
+The dashboard bins rows by class and time, and the periodicity and occupancy
+analyses only count events per class and bin. A sensor on a weak link
+therefore doesn't need to send every accepted window. ClassSummary keeps a
+fixed (521, 7) float64 array for the current interval. Each accepted YAMNet
+window updates its class row:
+
+  N          accepted windows with this top-1 class
+  CF_MAX     highest confidence (%)
+  TS_MAX     when that was (epoch s)
+  DB_AT_MAX  level of that window
+  DB_SUM     for the mean
+  DB_MIN / DB_MAX
+
+When a window's timestamp crosses into the next interval (aligned to
+multiples of SUMMARY_SEC, audio clock), roll() returns the finished interval
+as one compact payload. Only classes that occurred are included, as
+[idx, n, cf_max, ts_max - start, db_at_max, db_mean, db_min, db_max].
+"windows" counts every classified window, so an empty interval ("alive, nothing
+above threshold") can be told apart from an outage. storage.py writes
+these payloads into the rollup-shaped <table>_summary table, one row per class
+and interval. Raw rows still go to the local CSV.
+
+Usage
+-----
+summ = ClassSummary(sec=60)
+summ.add(ts, c1_idx, c1_cf_pct, db)        # accepted windows
+summ.seen += 1                             # every window
+payload = summ.roll(ts_now)                # dict once an interval has closed, else None
+payload = summ.flush()                     # at exit: the open, partial interval
+"""
+from __future__ import annotations
+
+import math
+
+import numpy as np
+
+SUMMARY_SEC = 60
+N_CLASSES   = 521
+N, CF_MAX, TS_MAX, DB_AT_MAX, DB_SUM, DB_MIN, DB_MAX = range(7)
+
+
+class ClassSummary:
+    def __init__(self, sec: int = SUMMARY_SEC, n_classes: int = N_CLASSES):
+        self.sec = sec
+        self.stats = np.zeros((n_classes, 7), dtype=np.float64)
+        self.start = None           # epoch start of the open interval
+        self.seen = 0
+        self._clear()
+
+    def _clear(self) -> None:
+        self.stats[:] = 0.0
+        self.stats[:, DB_MIN] = math.inf
+        self.stats[:, DB_MAX] = -math.inf
+        self.seen = 0
+
+    def add(self, ts: float, idx: int, cf: float, db: float) -> None:
+        """One accepted window (cf in %). Call roll(ts) first so it lands in the right interval."""
+        if self.start is None:
+            self.start = ts // self.sec * self.sec
+        r = self.stats[idx]
+        r[N] += 1
+        if cf > r[CF_MAX]:
+            r[CF_MAX], r[TS_MAX], r[DB_AT_MAX] = cf, ts, db
+        r[DB_SUM] += db
+        if db < r[DB_MIN]:
+            r[DB_MIN] = db
+        if db > r[DB_MAX]:
+            r[DB_MAX] = db
+
+    def roll(self, ts: float) -> dict | None:
+        """If *ts* lies past the open interval, return that interval's payload and start the next."""
+        if self.start is None:
+            self.start = ts // self.sec * self.sec
+            return None
+        if ts < self.start + self.sec:
+            return None
+        s = self.stats
+        hit = np.flatnonzero(s[:, N])
+        payload = {
+            "kind":    "summary",
+            "start":   self.start,
+            "sec":     self.sec,
+            "ts":      self.start + self.sec,
+            "windows": self.seen,
+            "classes": [[int(i), int(s[i, N]), round(s[i, CF_MAX], 1), round(s[i, TS_MAX] - self.start, 2),
+                         round(s[i, DB_AT_MAX], 1), round(s[i, DB_SUM] / s[i, N], 1),
+                         round(s[i, DB_MIN], 1), round(s[i, DB_MAX], 1)] for i in hit],
+        }
+        self._clear()
+        self.start = ts // self.sec * self.sec
+        return payload
+
+    def flush(self) -> dict | None:
+        """Close the open interval now (at exit); its "windows" tells how much of it was covered."""
+        return None if self.start is None else self.roll(self.start + self.sec)
@@ -1,9 +1,12 @@
-import pandas as pd, numpy as np, pathlib, json, re
+import pandas as pd, numpy as np, pathlib, json, re, os
 
 CSV = '/Volumes/EXT_HEATON/GSAPP/rhythmanalysis/3966543/annotations.csv'
 TAX = '/Volumes/EXT_HEATON/GSAPP/rhythmanalysis/3966543/dcase-ust-taxonomy.yaml'
+OUT_DIR   = pathlib.Path('/Users/matthewheaton/Documents/GitHub/rhythmanalysis/scripts/transfer/datasets')
+STORE_DIR = pathlib.Path('/Users/matthewheaton/Documents/GitHub/rhythmanalysis/scripts/transfer/embeddings_store')
+CHUNKSIZE = 200_000                 # CSV rows per read; annotation files can be larger than RAM
 
-df = pd.read_csv(CSV)
+header = pd.read_csv(CSV, nrows=0).columns
 
 # Choose a target granularity  ---------
 
@@ -13,7 +16,7 @@ df = pd.read_csv(CSV)
 #   – do NOT contain '-X_'  (drop the “other-unknown …” rows)
 
 FINE_COLS = [
-    c for c in df.columns
+    c for c in header
     if re.match(r'^\d+-\d+_', c)          #  digit-dash-digit-underscore
     and '-X_' not in c                    #  drop the 6 “other-unknown” tags
     and c.endswith('_presence')
@@ -24,34 +27,61 @@ print(FINE_COLS)
 
 # coarse = 8 high-level classes
 COARSE_COLS = [
-    c for c in df.columns
+    c for c in header
     if re.match(r'^\d+_', c)              #  digit-underscore
     and not re.match(r'^\d+-\d+_', c)     #  exclude fine pattern
     and c.endswith('_presence')
 ]
 
-print("Coarse columns:", len(COARSE_COLS)) 
+print("Coarse columns:", len(COARSE_COLS))
 print(COARSE_COLS)
 
+# Both taxonomies in one pass --------------------------------
+# Per clip:
+#   1) use verified row (annotator_id == 0) if present
+#   2) otherwise majority vote across volunteers & staff: votes >= rows / 2
+# Each chunk contributes per-clip vote sums + row counts and its first verified
+# row; chunks are combined with one more groupby-sum, so no Python loop per clip.
+COLS = FINE_COLS + COARSE_COLS
+votes, rows, verified = [], [], []
+for chunk in pd.read_csv(CSV, usecols=['audio_filename', 'annotator_id'] + COLS, chunksize=CHUNKSIZE):
+    pres = chunk[COLS].eq(1).astype(np.uint16)
+    pres.index = chunk['audio_filename'].values
+    g = pres.groupby(level=0, sort=False)
+    votes.append(g.sum())
+    rows.append(g.size())
+    v = pres[chunk['annotator_id'].values == 0]
+    verified.append(v[~v.index.duplicated()])
 
-COLS = COARSE_COLS                         # ← switch to COARSE_COLS for 8 tags
+votes    = pd.concat(votes).groupby(level=0).sum()                 # sorted by clip
+rows     = pd.concat(rows).groupby(level=0).sum().reindex(votes.index)
+verified = pd.concat(verified)
+verified = verified[~verified.index.duplicated()]                  # first verified row wins
 
+labels = (votes.values >= rows.values[:, None] / 2)
+has_v  = votes.index.isin(verified.index)
+labels[has_v] = verified.reindex(votes.index[has_v]).values.astype(bool)
+labels = labels.astype(np.uint8)
+clips  = votes.index.tolist()
+print(f"{len(clips):,} clips, {int(has_v.sum()):,} with a verified annotation")
 
-def agg(group):
-    # 1) use verified row if present
-    verified = group[group.annotator_id == 0]
-    if len(verified):
-        row = verified.iloc[0]
-        return (row[COLS] == 1).astype(int).values
-    # 2) majority vote across volunteers & staff
-    votes = (group[COLS] == 1).sum(axis=0)
-    return (votes >= (len(group) / 2)).astype(int).values
-
-label_map = {}
-for clip, g in df.groupby('audio_filename'):
-    label_map[clip] = agg(g)
-
-# Save to disk
-json.dump({k: v.tolist() for k, v in label_map.items()},
-          open('labels_coarse.json', 'w'))
+# Save to disk ----------------------------------------------
+#   labels_<tax>.npy   (n_clips, n_tags) uint8, rows in label_clips.json order
+#   labels_<tax>.json  {clip: [0/1, …]} for 2_extractYAMNetEmbeddings.py
+OUT_DIR.mkdir(parents=True, exist_ok=True)
+json.dump(clips, open(OUT_DIR / 'label_clips.json', 'w'))
+for tax, cols in (('fine', FINE_COLS), ('coarse', COARSE_COLS)):
+    lab = labels[:, [COLS.index(c) for c in cols]]
+    np.save(OUT_DIR / f'labels_{tax}.npy', lab)
+    json.dump(dict(zip(clips, lab.tolist())), open(OUT_DIR / f'labels_{tax}.json', 'w'))
 
+# Align the fine labels with an existing embedding store (its clips.json order)
+if (STORE_DIR / 'clips.json').exists():
+    store_clips = json.load(open(STORE_DIR / 'clips.json'))
+    pos = pd.Index(clips).get_indexer(store_clips)                  # -1 = no annotation
+    fine = labels[:, :len(FINE_COLS)]
+    aligned = np.where((pos >= 0)[:, None], fine[pos], 0).astype(np.uint8)
+    tmp = STORE_DIR / '.labels.tmp.npy'
+    np.save(tmp, aligned)
+    os.replace(tmp, STORE_DIR / 'labels.npy')
+    print(f"... labels.npy aligned to {len(store_clips):,} stored clips ({int((pos < 0).sum())} unlabelled)")
@@ -1,16 +1,64 @@
-import tensorflow_hub as hub, tensorflow as tf, numpy as np, pathlib, json, tqdm
+import pathlib, json, os, time, tqdm
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-yamnet = hub.load('/Users/matthewheaton/.cache/kagglehub/models/google/yamnet/tensorFlow2/yamnet/1')
-labels  = json.load(open('/Users/matthewheaton/Documents/GitHub/rhythmanalysis/scripts/transfer/datasets/labels_fine.json'))
-outdir  = pathlib.Path('/Users/matthewheaton/Documents/GitHub/rhythmanalysis/scripts/transfer/embeddings'); outdir.mkdir(exist_ok=True)
+from embedding_store import EmbeddingWriter
 
-for wav in tqdm.tqdm(pathlib.Path('/Volumes/EXT_HEATON/GSAPP/rhythmanalysis/3966543/resampled').glob('*.wav')):
+# ───────────────────────────────────────────────  CONFIG  ──
+YAMNET_PATH = '/Users/matthewheaton/.cache/kagglehub/models/google/yamnet/tensorFlow2/yamnet/1'
+LABELS      = pathlib.Path('/Users/matthewheaton/Documents/GitHub/rhythmanalysis/scripts/transfer/datasets/labels_fine.json')
+WAV_DIR     = pathlib.Path('/Volumes/EXT_HEATON/GSAPP/rhythmanalysis/3966543/resampled')
+STORE_DIR   = pathlib.Path('/Users/matthewheaton/Documents/GitHub/rhythmanalysis/scripts/transfer/embeddings_store')
+STORE_DTYPE = 'float16'            # or 'int8' (per-row scale, ¼ of float32)
+WORKERS     = max(1, (os.cpu_count() or 2) // 2)
+CHECKPOINT_SEC = 30
+# ───────────────────────────────────────────────────────────
+
+yamnet = None
+
+
+def init_worker(threads):
+    global yamnet
+    import tensorflow as tf, tensorflow_hub as hub
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+    yamnet = hub.load(YAMNET_PATH)
+
+
+def embed_clip(wav):
+    import tensorflow as tf
     audio = tf.io.read_file(str(wav))
     wav16k, _ = tf.audio.decode_wav(audio)          # (480000, 1)
     scores, embeds, _ = yamnet(wav16k[:, 0])        # embeds: (patches, 1024)
+    return embeds.numpy()
+
+
+if __name__ == '__main__':
+    labels = json.load(open(LABELS))
+    store  = EmbeddingWriter(STORE_DIR, dtype=STORE_DTYPE)
+
+    # Each patch inherits the clip-level label vector – stored once per clip in labels.npy
+    wavs = [w for w in sorted(WAV_DIR.glob('*.wav')) if w.name in labels and w.name not in store]
+    print(f"{len(store.clips):,} clips already stored, extracting {len(wavs):,} with {WORKERS} workers")
+
+    threads = max(1, (os.cpu_count() or 1) // WORKERS)
+    last_ckpt = time.monotonic()
+    # spawn: TensorFlow doesn't survive fork
+    with ProcessPoolExecutor(WORKERS, mp_context=mp.get_context('spawn'),
+                             initializer=init_worker, initargs=(threads,)) as pool:
+        futures = {pool.submit(embed_clip, w): w for w in wavs}
+        try:
+            for fut in tqdm.tqdm(as_completed(futures), total=len(futures), unit='clip'):
+                wav = futures[fut]
+                try:
+                    store.append(wav.name, fut.result())
+                except Exception as e:
+                    tqdm.tqdm.write(f"❌  Failed on {wav}: {e}")
+                if time.monotonic() - last_ckpt >= CHECKPOINT_SEC:
+                    store.checkpoint()
+                    last_ckpt = time.monotonic()
+        finally:
+            store.close()
 
-    # Each patch inherits the clip-level label vector
-    y = np.array(labels[wav.name], dtype=np.int8)
-    for i, e in enumerate(embeds.numpy()):
-        np.savez_compressed(outdir / f'{wav.stem}_{i}.npz',
-                            x=e.astype(np.float32), y=y)
+    store.write_labels(labels)
+    print(f"... {store.total:,} patches from {len(store.clips):,} clips in {len(store.shards)} shard(s) → {STORE_DIR}")
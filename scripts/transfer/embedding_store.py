@@ -0,0 +1,274 @@
+"""
+embedding_store.py
+Sharded, append-only store for YAMNet patch embeddings.
+
+Replaces one .npz per patch with a handful of large files:
+
+    <root>/meta.json          dim, dtype, shard capacity, shards [{file, rows}], total rows
+    <root>/shard_00000.npy    (rows, dim) float16, or int8 …
+    <root>/scale_00000.npy    … plus one float32 scale per row (int8 only, x ≈ q * scale)
+    <root>/index.npy          (total, 2) int32: clip id, patch number of every row
+    <root>/clips.json         clip file names; a clip's id is its position here
+    <root>/labels.npy         (n_clips, n_tags) uint8, aligned with clips.json
+
+Shards are preallocated .npy memmaps of SHARD_ROWS rows and filled in place.
+A clip's rows are contiguous, clips are only ever appended, and meta.json is
+rewritten last on every checkpoint, so after a crash the store reopens at the
+last checkpoint and extraction carries on from there.
+
+EmbeddingStore reads everything memory-mapped. Sequential batches are views
+straight into the shard files (no copy for float16); selections of rows
+(e.g. a train/val split by clip) are gathered one batch at a time.
+
+Usage
+-----
+w = EmbeddingWriter("embeddings_store", dtype="float16")
+w.append("clip.wav", embeds)          # (patches, 1024) float32
+w.close()
+
+store = EmbeddingStore("embeddings_store")
+for x, y in store.iter_batches(1024):
+    ...
+"""
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+from typing import Iterator
+
+import numpy as np
+
+SHARD_ROWS = 65_536                 # 128 MB of float16 × 1024 per shard
+DTYPES     = ("float16", "int8")
+
+
+def _atomic_write(path: Path, text: str) -> None:
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_text(text)
+    os.replace(tmp, path)
+
+
+def _atomic_save(path: Path, arr: np.ndarray) -> None:
+    tmp = path.with_name(f".{path.stem}.tmp.npy")
+    np.save(tmp, arr)
+    os.replace(tmp, path)
+
+
+def quantize_int8(x: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-row int8: x ≈ q * scale."""
+    scale = np.abs(x).max(axis=1) / 127.0
+    scale[scale == 0] = 1.0
+    q = np.rint(x / scale[:, None]).clip(-127, 127).astype(np.int8)
+    return q, scale.astype(np.float32)
+
+
+class EmbeddingWriter:
+    """Appends clips' embeddings to the store at *root*, creating it or continuing an existing one."""
+
+    def __init__(self, root: str | Path, dim: int = 1024, dtype: str = "float16",
+                 shard_rows: int = SHARD_ROWS):
+        if dtype not in DTYPES:
+            raise ValueError(f"dtype must be one of {DTYPES}, not {dtype!r}")
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        meta_path = self.root / "meta.json"
+        if meta_path.exists():
+            meta = json.loads(meta_path.read_text())
+            if (meta["dim"], meta["dtype"]) != (dim, dtype):
+                raise ValueError(f"{self.root} holds {meta['dtype']} × {meta['dim']}, "
+                                 f"not {dtype} × {dim}")
+            shard_rows = meta["shard_rows"]
+            self.shards = meta["shards"]
+            self.total = meta["total"]
+            # clips.json is written before meta.json: entries past meta["clips"] never got their rows
+            self.clips = json.loads((self.root / "clips.json").read_text())[:meta["clips"]]
+            self.index = [np.load(self.root / "index.npy")[:self.total]]
+        else:
+            self.shards, self.total, self.clips = [], 0, []
+            self.index = [np.zeros((0, 2), np.int32)]
+        self.dim, self.dtype, self.shard_rows = dim, dtype, shard_rows
+        self._x = self._s = None            # memmaps of the open (last) shard
+        self._clip_ids = {c: i for i, c in enumerate(self.clips)}
+        if self.shards and self.shards[-1]["rows"] < shard_rows:
+            self._reopen_last()
+
+    def __contains__(self, clip: str) -> bool:
+        return clip in self._clip_ids
+
+    # ---------- shards ------------------------------------------------------ #
+    def _paths(self, k: int) -> tuple[Path, Path]:
+        return self.root / f"shard_{k:05d}.npy", self.root / f"scale_{k:05d}.npy"
+
+    def _open_shard(self, k: int, keep: int = 0) -> None:
+        """Preallocate shard k, copying its first *keep* rows from a trimmed (closed) file."""
+        xp, sp = self._paths(k)
+        old_x = np.load(xp)[:keep] if keep else None
+        old_s = np.load(sp)[:keep] if keep and self.dtype == "int8" else None
+        self._x = np.lib.format.open_memmap(xp, mode="w+", dtype=self.dtype,
+                                            shape=(self.shard_rows, self.dim))
+        if old_x is not None:
+            self._x[:keep] = old_x
+        if self.dtype == "int8":
+            self._s = np.lib.format.open_memmap(sp, mode="w+", dtype=np.float32, shape=(self.shard_rows,))
+            if old_s is not None:
+                self._s[:keep] = old_s
+
+    def _reopen_last(self) -> None:
+        k, rows = len(self.shards) - 1, self.shards[-1]["rows"]
+        xp, sp = self._paths(k)
+        if np.load(xp, mmap_mode="r").shape[0] == self.shard_rows:   # still preallocated
+            self._x = np.load(xp, mmap_mode="r+")
+            self._s = np.load(sp, mmap_mode="r+") if self.dtype == "int8" else None
+        else:
+            self._open_shard(k, keep=rows)
+
+    def append(self, clip: str, x: np.ndarray) -> None:
+        """Add one clip's (patches, dim) embeddings."""
+        if clip in self._clip_ids:
+            raise ValueError(f"{clip} is already in the store")
+        if x.ndim != 2 or x.shape[1] != self.dim:
+            raise ValueError(f"expected (patches, {self.dim}), got {x.shape}")
+        if self.dtype == "int8":
+            q, scale = quantize_int8(np.asarray(x, np.float32))
+        else:
+            q, scale = np.asarray(x).astype(np.float16), None
+
+        cid = len(self.clips)
+        self.clips.append(clip)
+        self._clip_ids[clip] = cid
+        self.index.append(np.stack([np.full(len(q), cid, np.int32),
+                                    np.arange(len(q), dtype=np.int32)], axis=1))
+        done = 0
+        while done < len(q):
+            if not self.shards or self.shards[-1]["rows"] == self.shard_rows:
+                self._flush_shard()
+                self.shards.append({"file": self._paths(len(self.shards))[0].name, "rows": 0})
+                self._open_shard(len(self.shards) - 1)
+            sh = self.shards[-1]
+            n = min(len(q) - done, self.shard_rows - sh["rows"])
+            self._x[sh["rows"]:sh["rows"] + n] = q[done:done + n]
+            if scale is not None:
+                self._s[sh["rows"]:sh["rows"] + n] = scale[done:done + n]
+            sh["rows"] += n
+            done += n
+        self.total += len(q)
+
+    def _flush_shard(self) -> None:
+        if self._x is not None:
+            self._x.flush()
+            if self._s is not None:
+                self._s.flush()
+
+    # ---------- commit ------------------------------------------------------ #
+    def checkpoint(self) -> None:
+        """Make everything appended so far durable (meta.json is the commit point)."""
+        self._flush_shard()
+        index = np.concatenate(self.index)
+        self.index = [index]
+        _atomic_save(self.root / "index.npy", index)
+        _atomic_write(self.root / "clips.json", json.dumps(self.clips))
+        meta = {"dim": self.dim, "dtype": self.dtype, "shard_rows": self.shard_rows,
+                "shards": self.shards, "total": self.total, "clips": len(self.clips)}
+        _atomic_write(self.root / "meta.json", json.dumps(meta, indent=1))
+
+    def close(self) -> None:
+        """Checkpoint, then trim the last shard to its row count."""
+        self.checkpoint()
+        if self.shards and self.shards[-1]["rows"] < self.shard_rows:
+            rows = self.shards[-1]["rows"]
+            xp, sp = self._paths(len(self.shards) - 1)
+            x, s = np.array(self._x[:rows]), (np.array(self._s[:rows]) if self._s is not None else None)
+            self._x = self._s = None
+            _atomic_save(xp, x)
+            if s is not None:
+                _atomic_save(sp, s)
+        self._x = self._s = None
+
+    def write_labels(self, label_map: dict[str, list[int]], n_tags: int | None = None) -> np.ndarray:
+        """labels.npy (n_clips, n_tags) uint8 in clips.json order; clips without labels get zeros."""
+        n_tags = n_tags or len(next(iter(label_map.values())))
+        labels = np.zeros((len(self.clips), n_tags), np.uint8)
+        for i, clip in enumerate(self.clips):
+            if clip in label_map:
+                labels[i] = label_map[clip]
+        _atomic_save(self.root / "labels.npy", labels)
+        return labels
+
+
+class EmbeddingStore:
+    """Read-only, memory-mapped view of a store."""
+
+    def __init__(self, root: str | Path):
+        self.root = Path(root)
+        meta = json.loads((self.root / "meta.json").read_text())
+        self.dim, self.dtype, self.total = meta["dim"], meta["dtype"], meta["total"]
+        self.shards = [np.load(self.root / s["file"], mmap_mode="r")[:s["rows"]] for s in meta["shards"]]
+        self.scales = ([np.load(self.root / s["file"].replace("shard_", "scale_"), mmap_mode="r")[:s["rows"]]
+                        for s in meta["shards"]] if self.dtype == "int8" else None)
+        self.offsets = np.cumsum([0] + [len(s) for s in self.shards])
+        self.index = np.load(self.root / "index.npy", mmap_mode="r")[:self.total]
+        self.clips = json.loads((self.root / "clips.json").read_text())[:meta["clips"]]
+        lp = self.root / "labels.npy"
+        self.labels = np.load(lp, mmap_mode="r") if lp.exists() else None
+
+    def __len__(self) -> int:
+        return self.total
+
+    @property
+    def clip_ids(self) -> np.ndarray:
+        """Clip id of every row."""
+        return self.index[:, 0]
+
+    def rows_of(self, clip_ids: np.ndarray) -> np.ndarray:
+        """Row numbers belonging to any of *clip_ids*, in store order."""
+        return np.flatnonzero(np.isin(self.clip_ids, clip_ids))
+
+    def _labels_for(self, a: int, b: int | None = None, rows: np.ndarray | None = None) -> np.ndarray | None:
+        if self.labels is None:
+            return None
+        cid = self.index[a:b, 0] if rows is None else self.index[rows, 0]
+        return self.labels[cid]
+
+    def _x(self, k: int, a: int, b: int) -> np.ndarray:
+        x = self.shards[k][a:b]
+        if self.scales is not None:
+            x = x.astype(np.float32) * self.scales[k][a:b, None]
+        return x
+
+    def read(self, rows: np.ndarray) -> np.ndarray:
+        """Gather arbitrary rows (copy) as float16/float32."""
+        rows = np.asarray(rows)
+        k = np.searchsorted(self.offsets, rows, side="right") - 1
+        out = np.empty((len(rows), self.dim), np.float32 if self.scales is not None else self.dtype)
+        for s in np.unique(k):
+            m = k == s
+            local = rows[m] - self.offsets[s]
+            x = self.shards[s][local]
+            if self.scales is not None:
+                x = x.astype(np.float32) * self.scales[s][local, None]
+            out[m] = x
+        return out
+
+    def iter_batches(self, batch: int, rows: np.ndarray | None = None, shuffle: bool = False,
+                     seed: int | None = None) -> Iterator[tuple[np.ndarray, np.ndarray | None]]:
+        """
+        (x, y) batches. Without *rows*: contiguous slices of each shard – views
+        into the memmap for float16 (batches never span shards, so the last one
+        of a shard may be short); *shuffle* then permutes batch order only.
+        With *rows*: those rows gathered batch by batch (shuffled if asked).
+        """
+        rng = np.random.default_rng(seed)
+        if rows is None:
+            spans = [(k, a, min(a + batch, len(s))) for k, s in enumerate(self.shards)
+                     for a in range(0, len(s), batch)]
+            if shuffle:
+                spans = [spans[i] for i in rng.permutation(len(spans))]
+            for k, a, b in spans:
+                off = self.offsets[k]
+                yield self._x(k, a, b), self._labels_for(off + a, off + b)
+            return
+        rows = rng.permutation(rows) if shuffle else np.asarray(rows)
+        for a in range(0, len(rows), batch):
+            sel = np.sort(rows[a:a + batch])          # sorted → sequential reads
+            yield self.read(sel), self._labels_for(0, rows=sel)
@@ -0,0 +1,171 @@
+"""
+head_dataset.py
+TFRecord shards + tf.data input pipeline for training the SONYC head on the embedding store.
+
+build_dataset() splits the store's clips into train/val deterministically
+(crc32 of the clip name, so a clip never changes sides as the store grows)
+and writes each split as `shards` TFRecord files in parallel, one process per
+shard. Records hold BLOCK_ROWS patches each – x as raw float16 bytes, y as raw
+uint8 bytes – instead of one tf.train.Example of 1024 floats per patch.
+
+<dataset_dir>/dataset.json is the sidecar: shapes, split rule, and every
+shard's file, record/patch/clip counts, plus the store's size it was built
+from. Counting is a read of that file, and a stale sidecar (the store has
+grown) triggers a rebuild.
+
+make_dataset() reads a split's shards in parallel, caches the decoded float16
+blocks (memory, or a file cache), and only then shuffles/batches, so every
+epoch after the first runs from the cache and val is the same every epoch.
+benchmark() reports examples/s through a pipeline.
+
+Usage
+-----
+from head_dataset import build_dataset, load_sidecar, make_dataset
+meta = build_dataset(STORE_DIR, DATASET_DIR, shards=8)
+train_ds = make_dataset(DATASET_DIR, "train", batch=128, meta=meta)
+"""
+from __future__ import annotations
+
+import json
+import multiprocessing as mp
+import os
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from embedding_store import EmbeddingStore
+
+BLOCK_ROWS = 256
+VAL_FRAC   = 0.1
+SIDECAR    = "dataset.json"
+
+
+def split_of(clip: str, val_frac: float = VAL_FRAC) -> str:
+    return "val" if zlib.crc32(clip.encode()) % 1000 < val_frac * 1000 else "train"
+
+
+def _write_shard(store_dir: str, path: str, clip_ids: list[int], compression: str) -> dict:
+    """Worker: write one shard with all rows of *clip_ids*."""
+    import tensorflow as tf
+
+    store = EmbeddingStore(store_dir)
+    rows = store.rows_of(np.asarray(clip_ids, np.int32))
+    records = 0
+    with tf.io.TFRecordWriter(path, options=compression or None) as w:
+        for x, y in store.iter_batches(BLOCK_ROWS, rows=rows):
+            ex = tf.train.Example(features=tf.train.Features(feature={
+                "x": tf.train.Feature(bytes_list=tf.train.BytesList(value=[x.astype("<f2").tobytes()])),
+                "y": tf.train.Feature(bytes_list=tf.train.BytesList(value=[y.astype(np.uint8).tobytes()])),
+                "n": tf.train.Feature(int64_list=tf.train.Int64List(value=[len(x)])),
+            }))
+            w.write(ex.SerializeToString())
+            records += 1
+    return {"file": Path(path).name, "records": records, "patches": int(len(rows)), "clips": len(clip_ids)}
+
+
+def load_sidecar(dataset_dir: str | Path) -> dict | None:
+    path = Path(dataset_dir) / SIDECAR
+    return json.loads(path.read_text()) if path.exists() else None
+
+
+def build_dataset(store_dir: str | Path, dataset_dir: str | Path, shards: int = os.cpu_count() or 4,
+                  val_frac: float = VAL_FRAC, compression: str = "", force: bool = False) -> dict:
+    """Write train/val shards + sidecar unless an up-to-date sidecar exists. Returns the sidecar."""
+    dataset_dir = Path(dataset_dir)
+    dataset_dir.mkdir(parents=True, exist_ok=True)
+    store = EmbeddingStore(store_dir)
+    meta = load_sidecar(dataset_dir)
+    if (not force and meta is not None and meta["store_total"] == store.total
+            and meta["val_frac"] == val_frac and meta["compression"] == compression):
+        return meta
+    if store.labels is None:
+        raise RuntimeError(f"{store_dir} has no labels.npy – run 2_extractYAMNetEmbeddings.py first")
+
+    t0 = time.perf_counter()
+    by_split = {"train": [], "val": []}
+    for cid, clip in enumerate(store.clips):
+        by_split[split_of(clip, val_frac)].append(cid)
+
+    ext = ".tfrecord.gz" if compression == "GZIP" else ".tfrecord"
+    jobs = []
+    for split, cids in by_split.items():
+        n = max(1, min(shards, len(cids)))
+        for i in range(n):
+            path = dataset_dir / f"{split}-{i:04d}-of-{n:04d}{ext}"
+            jobs.append((split, str(path), cids[i::n]))
+
+    # spawn: children import TensorFlow themselves
+    with ProcessPoolExecutor(max_workers=shards, mp_context=mp.get_context("spawn")) as pool:
+        results = list(pool.map(_write_shard, [str(store_dir)] * len(jobs), [j[1] for j in jobs],
+                                [j[2] for j in jobs], [compression] * len(jobs)))
+
+    meta = {
+        "dim": store.dim, "num_tags": int(store.labels.shape[1]),
+        "x_dtype": "float16", "y_dtype": "uint8", "block_rows": BLOCK_ROWS,
+        "val_frac": val_frac, "split_rule": "crc32(clip) % 1000 < val_frac * 1000",
+        "compression": compression, "store_total": store.total, "store_clips": len(store.clips),
+        "splits": {s: {"patches": 0, "clips": len(c), "shards": []} for s, c in by_split.items()},
+    }
+    for (split, _, _), r in zip(jobs, results):
+        meta["splits"][split]["shards"].append(r)
+        meta["splits"][split]["patches"] += r["patches"]
+    tmp = dataset_dir / f".{SIDECAR}.tmp"
+    tmp.write_text(json.dumps(meta, indent=1))
+    os.replace(tmp, dataset_dir / SIDECAR)
+    # shards from an earlier build with a different shard count
+    keep = {r["file"] for r in results}
+    for old in dataset_dir.glob("*-of-*.tfrecord*"):
+        if old.name not in keep:
+            old.unlink()
+    print(f"... wrote {len(jobs)} shards ({meta['splits']['train']['patches']:,} train / "
+          f"{meta['splits']['val']['patches']:,} val patches) in {time.perf_counter() - t0:.1f}s")
+    return meta
+
+
+def make_dataset(dataset_dir: str | Path, split: str, batch: int, meta: dict | None = None,
+                 shuffle_buffer: int = 10_000, cache: str = "", seed: int | None = None):
+    """Batched (x float32, y int8) tf.data pipeline for *split*; cache '' = in memory, else a file prefix."""
+    import tensorflow as tf
+
+    meta = meta or load_sidecar(dataset_dir)
+    dim, tags = meta["dim"], meta["num_tags"]
+    files = [str(Path(dataset_dir) / s["file"]) for s in meta["splits"][split]["shards"]]
+    spec = {
+        "x": tf.io.FixedLenFeature([], tf.string),
+        "y": tf.io.FixedLenFeature([], tf.string),
+        "n": tf.io.FixedLenFeature([], tf.int64),
+    }
+
+    def parse(rec):
+        f = tf.io.parse_single_example(rec, spec)
+        x = tf.reshape(tf.io.decode_raw(f["x"], tf.float16), [-1, dim])
+        y = tf.reshape(tf.io.decode_raw(f["y"], tf.uint8), [-1, tags])
+        return x, y
+
+    ds = (tf.data.TFRecordDataset(files, compression_type=meta["compression"] or None,
+                                  num_parallel_reads=tf.data.AUTOTUNE)
+            .map(parse, num_parallel_calls=tf.data.AUTOTUNE)
+            .cache(cache)
+            .unbatch())
+    if split == "train":
+        ds = ds.shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+    return (ds.batch(batch)
+              .map(lambda x, y: (tf.cast(x, tf.float32), tf.cast(y, tf.int8)),
+                   num_parallel_calls=tf.data.AUTOTUNE)
+              .prefetch(tf.data.AUTOTUNE))
+
+
+def benchmark(ds, epochs: int = 2) -> list[float]:
+    """examples/s per full pass over *ds* (the first pass fills the cache)."""
+    rates = []
+    for e in range(epochs):
+        t0, n = time.perf_counter(), 0
+        for x, _ in ds:
+            n += int(x.shape[0])
+        dt = time.perf_counter() - t0
+        rates.append(n / dt)
+        print(f"[DEBUG] epoch {e}: {n:,} examples in {dt:.2f}s → {n / dt:,.0f} examples/s")
+    return rates
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+bench_quant.py
+Accuracy / latency benchmark for YAMNet backbone and SONYC head variants (float32, float16, int8 …).
+
+Every backbone variant runs over the same frames – 0.975 s windows every
+HOP_SEC from a labelled clip set – through the LiteRT interpreter, and every
+head variant then runs on each backbone's embeddings. Per model it reports:
+
+  • load time (interpreter construction + allocate_tensors) and file size
+  • memory: RSS growth over loading + running the model
+  • per-invoke latency: mean, p50, p90, p99 (ms)
+  • backbone vs. the reference backbone: top-1 class agreement, mean |Δscore|,
+    mean embedding cosine similarity
+  • head vs. the reference head on the reference backbone: mean |Δprob| and
+    agreement of the 0.5-thresholded tags; plus clip-level macro AUC against
+    the labels (clip prob = max over its patches)
+
+Results go to --out as JSON (with host/platform info) so runs on the Pi and
+a laptop can be diffed; a summary is printed.
+
+Usage
+-----
+python scripts/transfer/test/bench_quant.py \
+       --clips /path/to/sonyc/resampled --labels scripts/models/sonyc/labels_fine.json --limit 200 \
+       --backbone float32=scripts/models/yamnet/yamnet_waveform.tflite \
+       --backbone int8=scripts/models/yamnet/yamnet_int8.tflite \
+       --head int8=scripts/models/sonyc/sonyc_head_v3_int8.tflite \
+       --out output/bench_quant_$(hostname).json
+
+The first --backbone/--head is the reference unless one is named "float32".
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import time
+from datetime import datetime, timezone
+from math import gcd
+from pathlib import Path
+
+import numpy as np
+from scipy.io import wavfile
+from scipy.signal import resample_poly
+
+try:
+    from ai_edge_litert.interpreter import Interpreter
+    BACKEND = "ai_edge_litert"
+except ImportError:
+    from tensorflow.lite.python.interpreter import Interpreter
+    BACKEND = "tensorflow"
+
+SR        = 16_000
+FRAME_LEN = 15_600
+HOP_SEC   = 0.5
+EMBED_DIM = 1024
+
+
+# ---------- helpers --------------------------------------------------------- #
+def rss_mb() -> float:
+    """Current RSS (Linux /proc), falling back to peak RSS elsewhere."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def latency_stats(sec: list[float]) -> dict:
+    ms = np.asarray(sec) * 1e3
+    return {"n": int(ms.size), "mean_ms": float(ms.mean()),
+            **{f"p{p}_ms": float(np.percentile(ms, p)) for p in (50, 90, 99)}}
+
+
+def load(path: str, threads: int, input_shape: list[int] | None = None):
+    t0 = time.perf_counter()
+    try:
+        itp = Interpreter(model_path=path, num_threads=threads)
+    except TypeError:  # older TF Interpreter without num_threads
+        itp = Interpreter(model_path=path)
+    if input_shape is not None:
+        itp.resize_tensor_input(itp.get_input_details()[0]["index"], input_shape, strict=False)
+    itp.allocate_tensors()
+    return itp, time.perf_counter() - t0
+
+
+def to_input(x: np.ndarray, detail: dict) -> np.ndarray:
+    """Quantize float input if the model takes int8/uint8."""
+    if detail["dtype"] in (np.int8, np.uint8):
+        scale, zero = detail["quantization"]
+        info = np.iinfo(detail["dtype"])
+        return np.clip(np.rint(x / scale + zero), info.min, info.max).astype(detail["dtype"])
+    return x.astype(detail["dtype"], copy=False)
+
+
+def from_output(y: np.ndarray, detail: dict) -> np.ndarray:
+    if detail["dtype"] in (np.int8, np.uint8):
+        scale, zero = detail["quantization"]
+        return (y.astype(np.float32) - zero) * scale
+    return y.astype(np.float32, copy=False)
+
+
+def macro_auc(y: np.ndarray, p: np.ndarray) -> float | None:
+    """Mean ROC AUC over tags that have both classes (rank / Mann-Whitney form, ties averaged)."""
+    aucs = []
+    for t in range(y.shape[1]):
+        pos = y[:, t] > 0
+        n_pos, n_neg = int(pos.sum()), int((~pos).sum())
+        if not n_pos or not n_neg:
+            continue
+        order = np.argsort(p[:, t], kind="mergesort")
+        ranks = np.empty(len(order))
+        sorted_p = p[order, t]
+        # average ranks over ties
+        _, first, counts = np.unique(sorted_p, return_index=True, return_counts=True)
+        avg = first + (counts + 1) / 2.0
+        ranks[order] = np.repeat(avg, counts)
+        aucs.append((ranks[pos].sum() - n_pos * (n_pos + 1) / 2) / (n_pos * n_neg))
+    return float(np.mean(aucs)) if aucs else None
+
+
+# ---------- data ------------------------------------------------------------ #
+def load_frames(clip_dir: Path, labels: dict, limit: int | None) -> tuple[np.ndarray, np.ndarray, np.ndarray, list[str]]:
+    """(frames (N, FRAME_LEN), clip id per frame, clip labels (C, tags), clip names)."""
+    names = sorted(n for n in labels if (clip_dir / n).exists())[:limit]
+    if not names:
+        sys.exit(f"[ERROR] no labelled clips found in {clip_dir}")
+    hop = int(HOP_SEC * SR)
+    frames, owner = [], []
+    for cid, name in enumerate(names):
+        sr, x = wavfile.read(clip_dir / name)
+        x = x.astype(np.float32) / (np.iinfo(x.dtype).max if x.dtype.kind == "i" else 1.0)
+        if x.ndim > 1:
+            x = x.mean(axis=1)
+        if sr != SR:
+            g = gcd(sr, SR)
+            x = resample_poly(x, SR // g, sr // g).astype(np.float32)
+        if x.size < FRAME_LEN:
+            x = np.pad(x, (0, FRAME_LEN - x.size))
+        starts = range(0, x.size - FRAME_LEN + 1, hop)
+        frames.extend(x[s:s + FRAME_LEN] for s in starts)
+        owner.extend([cid] * len(starts))
+    y = np.asarray([labels[n] for n in names], dtype=np.uint8)
+    return np.stack(frames), np.asarray(owner), y, names
+
+
+# ---------- runs ------------------------------------------------------------ #
+def run_backbone(path: str, frames: np.ndarray, threads: int) -> tuple[dict, np.ndarray, np.ndarray]:
+    rss0 = rss_mb()
+    itp, load_sec = load(path, threads, [FRAME_LEN])
+    inp = itp.get_input_details()[0]
+    outs = itp.get_output_details()
+    s_det = next(d for d in outs if d["shape"][-1] == 521)
+    e_det = next(d for d in outs if d["shape"][-1] == EMBED_DIM)
+
+    itp.set_tensor(inp["index"], to_input(frames[0], inp))
+    itp.invoke()                                    # warm-up, not timed
+    scores = np.empty((len(frames), 521), np.float32)
+    embeds = np.empty((len(frames), EMBED_DIM), np.float32)
+    lat = []
+    for i, fr in enumerate(frames):
+        x = to_input(fr, inp)
+        t0 = time.perf_counter()
+        itp.set_tensor(inp["index"], x)
+        itp.invoke()
+        lat.append(time.perf_counter() - t0)
+        scores[i] = from_output(itp.get_tensor(s_det["index"]), s_det).reshape(-1, 521)[0]
+        embeds[i] = from_output(itp.get_tensor(e_det["index"]), e_det).reshape(-1, EMBED_DIM)[0]
+    res = {
+        "path": path, "file_mb": os.path.getsize(path) / 2**20, "load_sec": load_sec,
+        "rss_mb": rss_mb() - rss0, "input_dtype": np.dtype(inp["dtype"]).name,
+        "latency": latency_stats(lat),
+    }
+    return res, scores, embeds
+
+
+def run_head(path: str, embeds: np.ndarray, threads: int, batch: int) -> tuple[dict, np.ndarray]:
+    rss0 = rss_mb()
+    itp, load_sec = load(path, threads, [batch, EMBED_DIM])
+    inp, out = itp.get_input_details()[0], itp.get_output_details()[0]
+    n = len(embeds)
+    padded = np.zeros((-(-n // batch) * batch, EMBED_DIM), np.float32)
+    padded[:n] = embeds
+    probs, lat = [], []
+    for a in range(0, len(padded), batch):
+        x = to_input(padded[a:a + batch], inp)
+        t0 = time.perf_counter()
+        itp.set_tensor(inp["index"], x)
+        itp.invoke()
+        lat.append(time.perf_counter() - t0)
+        probs.append(from_output(itp.get_tensor(out["index"]), out))
+    res = {
+        "path": path, "file_mb": os.path.getsize(path) / 2**20, "load_sec": load_sec,
+        "rss_mb": rss_mb() - rss0, "input_dtype": np.dtype(inp["dtype"]).name,
+        "batch": batch, "latency": latency_stats(lat),
+    }
+    return res, np.concatenate(probs)[:n]
+
+
+def pick_reference(variants: list[tuple[str, str]]) -> str:
+    names = [n for n, _ in variants]
+    return "float32" if "float32" in names else names[0]
+
+
+def parse_variant(s: str) -> tuple[str, str]:
+    name, sep, path = s.partition("=")
+    return (name, path) if sep else (Path(s).stem, s)
+
+
+def main(argv: list[str] | None = None) -> None:
+    p = argparse.ArgumentParser(description="Quantization accuracy/latency benchmark for YAMNet + SONYC head variants.")
+    p.add_argument("--clips", type=Path, required=True, help="Directory of labelled WAV clips.")
+    p.add_argument("--labels", type=Path, required=True, help="JSON {clip.wav: [0/1, …]}.")
+    p.add_argument("--limit", type=int, default=100, help="Clips to use (sorted by name).")
+    p.add_argument("--backbone", action="append", type=parse_variant, required=True, help="NAME=PATH (repeat).")
+    p.add_argument("--head", action="append", type=parse_variant, default=[], help="NAME=PATH (repeat).")
+    p.add_argument("--threads", type=int, default=2)
+    p.add_argument("--head-batch", type=int, default=5, help="Windows per head invoke (classify.py: 5).")
+    p.add_argument("--out", type=Path, help="Write results as JSON here.")
+    args = p.parse_args(argv)
+
+    frames, owner, y, names = load_frames(args.clips, json.loads(args.labels.read_text()), args.limit)
+    print(f"[DEBUG] {len(names)} clips → {len(frames)} frames, backend {BACKEND}, {args.threads} threads")
+
+    results = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "host": {"node": platform.node(), "machine": platform.machine(), "system": platform.system(),
+                 "release": platform.release(), "python": platform.python_version(),
+                 "cpus": os.cpu_count(), "backend": BACKEND},
+        "config": {"clips": len(names), "frames": int(len(frames)), "hop_sec": HOP_SEC,
+                   "threads": args.threads, "head_batch": args.head_batch},
+        "backbones": {}, "heads": {},
+    }
+
+    # backbones
+    out_b = {}
+    for name, path in args.backbone:
+        res, scores, embeds = run_backbone(path, frames, args.threads)
+        out_b[name] = (scores, embeds)
+        results["backbones"][name] = res
+    ref_b = pick_reference(args.backbone)
+    rs, re_ = out_b[ref_b]
+    for name, (scores, embeds) in out_b.items():
+        cos = (embeds * re_).sum(1) / (np.linalg.norm(embeds, axis=1) * np.linalg.norm(re_, axis=1) + 1e-12)
+        results["backbones"][name]["vs_" + ref_b] = {
+            "top1_agreement": float((scores.argmax(1) == rs.argmax(1)).mean()),
+            "mean_abs_score_diff": float(np.abs(scores - rs).mean()),
+            "embedding_cosine": float(cos.mean()),
+        }
+
+    # heads × backbones
+    if args.head:
+        ref_h = pick_reference(args.head)
+        probs = {}
+        for hname, hpath in args.head:
+            results["heads"][hname] = {}
+            for bname, (_, embeds) in out_b.items():
+                res, pr = run_head(hpath, embeds, args.threads, args.head_batch)
+                clip_p = np.full((len(names), pr.shape[1]), -np.inf, np.float32)
+                np.maximum.at(clip_p, owner, pr)
+                res["clip_macro_auc"] = macro_auc(y, clip_p)
+                probs[hname, bname] = pr
+                results["heads"][hname][bname] = res
+        ref = probs[ref_h, ref_b]
+        for (hname, bname), pr in probs.items():
+            results["heads"][hname][bname][f"vs_{ref_h}@{ref_b}"] = {
+                "mean_abs_prob_diff": float(np.abs(pr - ref).mean()),
+                "tag_agreement@0.5": float(((pr >= 0.5) == (ref >= 0.5)).mean()),
+            }
+
+    # summary
+    print(f"\n{'backbone':<12} {'load s':>7} {'MB':>7} {'RSS MB':>7} {'p50 ms':>7} {'p99 ms':>7} {'top1 agr':>8} {'cos':>6}")
+    for name, r in results["backbones"].items():
+        v = r["vs_" + ref_b]
+        print(f"{name:<12} {r['load_sec']:7.2f} {r['file_mb']:7.1f} {r['rss_mb']:7.1f} "
+              f"{r['latency']['p50_ms']:7.2f} {r['latency']['p99_ms']:7.2f} "
+              f"{v['top1_agreement']:8.3f} {v['embedding_cosine']:6.3f}")
+    for hname, per_b in results["heads"].items():
+        for bname, r in per_b.items():
+            auc = r["clip_macro_auc"]
+            v = r[f"vs_{ref_h}@{ref_b}"]
+            print(f"head {hname:<8} on {bname:<10} p50 {r['latency']['p50_ms']:6.3f} ms  "
+                  f"AUC {auc if auc is None else round(auc, 4)}  tag agr {v['tag_agreement@0.5']:.3f}")
+
+    if args.out:
+        args.out.parent.mkdir(parents=True, exist_ok=True)
+        args.out.write_text(json.dumps(results, indent=1))
+        print(f"\n[DEBUG] results → {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,67 @@
+import argparse
 import json
 import math
+import sys
 import numpy as np
 import matplotlib.pyplot as plt
 from datetime import datetime
+from pathlib import Path
 import random
 
-# import ext json
-with open("scripts/output/classifications_yamnet.json") as f:
-    data = json.load(f)
+
+def occupancy_clock(utc_offset_h=0.0, minute_bin=15, top=12):
+    """24 h clock of when each class usually happens, read from the occupancy cube (scripts/analysis/occupancy.py)."""
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "analysis"))
+    from occupancy import OccupancyCube
+    from sources import LOG_CSV, load_class_names, location_key
+
+    cube = OccupancyCube.for_source(location_key("csv", LOG_CSV.resolve()), utc_offset_h)
+    if not len(cube):
+        raise ValueError("The occupancy cube is empty – run scripts/analysis/occupancy.py update first!")
+    res = cube.query(minute_bin=minute_bin, names=load_class_names())
+    per_bin = res.counts.sum(axis=1)                  # all weekdays: (classes, bins)
+    order = [g for g in np.argsort(-per_bin.sum(axis=1))[:top] if per_bin[g].any()]
+
+    n_bins = per_bin.shape[1]
+    angles = -(np.arange(n_bins) + 0.5) / n_bins * 2 * math.pi
+    radii = np.linspace(1.0, 0.25, len(order), endpoint=False)
+    cmap = plt.get_cmap("tab20")
+    peak = per_bin[order].max()
+
+    fig, ax = plt.subplots(subplot_kw={"projection": "polar"}, figsize=(10,10))
+    for i, (g, r0) in enumerate(zip(order, radii)):
+        c = per_bin[g]
+        ax.scatter(angles[c > 0], np.full(int((c > 0).sum()), r0), s=c[c > 0] / peak * 200,
+                   alpha=0.6, color=cmap(i), edgecolor='k', linewidth=0.3, label=res.labels[g])
+        ax.plot(np.linspace(0, 2*math.pi, 360), [r0]*360, color='gray', lw=0.5, alpha=0.2)
+
+    ax.legend(bbox_to_anchor=(1.1, 1), title="Event classes")
+    ax.set_ylim(0, 1.1)
+    ax.set_yticks([])
+    hours = np.arange(24)
+    ax.set_xticks(-hours / 24 * 2 * math.pi)
+    ax.set_xticklabels([f"{h:02d}:00" for h in hours])
+    ax.set_title(f"Usual time of day per class, {len(cube):,} cells (UTC{utc_offset_h:+g})", va="bottom")
+    plt.tight_layout()
+    plt.show()
+
+
+# --occupancy: the long-term view from the precomputed cube instead of the last run's events
+parser = argparse.ArgumentParser(description="Clock plot of classified events.")
+parser.add_argument("--occupancy", action="store_true", help="Usual time of day per class, from the occupancy cube.")
+parser.add_argument("--utc-offset", type=float, default=0.0, help="Offset the cube was built with.")
+args = parser.parse_args()
+if args.occupancy:
+    occupancy_clock(args.utc_offset)
+    sys.exit(0)
+
+# import ext json – yamnet_realtime.py now appends ndjson; older runs wrote one JSON array
+try:
+    with open("scripts/output/classifications_yamnet.ndjson") as f:
+        data = [json.loads(line) for line in f if line.strip()]
+except FileNotFoundError:
+    with open("scripts/output/classifications_yamnet.json") as f:
+        data = json.load(f)
 
 # sort by timestamp + choose window
 WINDOW_MINUTES = 120
@@ -32,6 +32,109 @@ const app = express();
 app.use(cors());
 app.use(compression());               // enable gzip
 
+// Materialized responses written by scripts/database/materialize.py
+const MATERIALIZED_DIR = process.env.MATERIALIZED_DIR
+  || path.resolve(__dirname, "../../output/materialized");
+const MATERIALIZED_MAX_AGE_S = parseFloat(process.env.MATERIALIZED_MAX_AGE_S || "300");
+
+const indexCache = new Map();   // binSeconds -> { mtimeMs, index }
+const bucketCache = new Map();  // file -> { etag, rows } (final buckets never change)
+
+function readMaterializedIndex(binSeconds) {
+  const file = path.join(MATERIALIZED_DIR, `bin${binSeconds}`, "index.json");
+  let stat;
+  try {
+    stat = fs.statSync(file);
+  } catch {
+    return null;
+  }
+  const cached = indexCache.get(binSeconds);
+  if (cached && cached.mtimeMs === stat.mtimeMs) return cached.index;
+  const index = JSON.parse(fs.readFileSync(file, "utf8"));
+  indexCache.set(binSeconds, { mtimeMs: stat.mtimeMs, index });
+  return index;
+}
+
+function sendPrecompressed(req, res, file, etag) {
+  res.set({
+    "ETag": etag,
+    "Content-Type": "application/json; charset=utf-8",
+    "Vary": "Accept-Encoding",
+    "Cache-Control": "public, max-age=60",
+  });
+  if (req.headers["if-none-match"] === etag) {
+    res.status(304).end();
+    return;
+  }
+  const accepts = req.headers["accept-encoding"] || "";
+  let target = file;
+  if (/\bbr\b/.test(accepts) && fs.existsSync(`${file}.br`)) {
+    target = `${file}.br`;
+    res.set("Content-Encoding", "br");   // compression() leaves encoded bodies alone
+  } else if (/\bgzip\b/.test(accepts) && fs.existsSync(`${file}.gz`)) {
+    target = `${file}.gz`;
+    res.set("Content-Encoding", "gzip");
+  }
+  res.sendFile(target);
+}
+
+// Answer a binned window from materialized files; false if none are fresh enough
+function serveMaterialized(req, res, { start, end, binSeconds, hours, offset }) {
+  const index = readMaterializedIndex(binSeconds);
+  if (!index || Date.now() / 1000 - index.generated_at > MATERIALIZED_MAX_AGE_S) return false;
+  const dir = path.join(MATERIALIZED_DIR, `bin${binSeconds}`);
+
+  // the exact window a page load asks for: stream the pre-compressed response
+  const win = index.windows[`h${hours}_off${offset}`];
+  if (win) {
+    sendPrecompressed(req, res, path.join(dir, win.file), win.etag);
+    return true;
+  }
+
+  // any other recent window (e.g. the clock's drifting refreshes): stitch hour buckets
+  const covered = index.buckets.length && index.buckets[0].start <= start;
+  if (!covered) return false;
+  const data = [];
+  for (const b of index.buckets) {
+    if (b.end <= start || b.start > end) continue;
+    const file = path.join(dir, `${b.start}.json`);
+    let cached = bucketCache.get(file);
+    if (!cached || cached.etag !== b.etag) {
+      cached = { etag: b.etag, rows: JSON.parse(fs.readFileSync(file, "utf8")) };
+      bucketCache.set(file, cached);
+    }
+    for (const r of cached.rows) {
+      if (r.ts >= start && r.ts <= end) data.push(r);
+    }
+  }
+  for (const [file, cached] of bucketCache) {
+    if (!index.buckets.some(b => path.join(dir, `${b.start}.json`) === file)) bucketCache.delete(file);
+  }
+  res.json({ windowStart: start, windowEnd: end, total: index.total, data });
+  return true;
+}
+
+// audio_logs.model and audio_logs_summary come from storage.py's ensure_schema; until a publisher
+// has run it against this database the binned query must do without them
+const SCHEMA_RECHECK_MS = 60_000;
+let schema = null;   // { model, summary, checkedAt }
+
+async function loadSchema() {
+  if (schema && ((schema.model && schema.summary) || Date.now() - schema.checkedAt < SCHEMA_RECHECK_MS)) {
+    return schema;
+  }
+  const { rows } = await pool.query(`
+    SELECT to_regclass('audio_logs_summary') IS NOT NULL AS summary,
+           EXISTS (SELECT 1
+                     FROM information_schema.columns
+                    WHERE table_schema = ANY (current_schemas(false))
+                      AND table_name = 'audio_logs'
+                      AND column_name = 'model') AS model
+  `);
+  schema = { ...rows[0], checkedAt: Date.now() };
+  return schema;
+}
+
 // Parse the CSV once at startup
 const csvPath = path.join(__dirname, "yamnet_class_map.csv");
 let classMap = [];
@@ -64,6 +167,12 @@ app.get("/api/audio_logs", async (req, res) => {
         .toSeconds() - offset * 3600;
     }
 
+    // common dashboard windows come from materialize.py, no database round trip
+    if (binSeconds && !(req.query.start && req.query.end) && rowOffset === 0) {
+      const hours = req.query.hours ? parseFloat(req.query.hours) : 24;
+      if (serveMaterialized(req, res, { start, end, binSeconds, hours, offset })) return;
+    }
+
     // approximate total via pg_class.reltuples
     const estResult = await pool.query(
       `SELECT reltuples AS estimate
@@ -75,6 +184,7 @@ app.get("/api/audio_logs", async (req, res) => {
     // fetch your data (binned vs. raw)
     let text, params;
     if (binSeconds) {
+      const { model, summary } = await loadSchema();
       text = `
         SELECT * FROM (
           SELECT *,
@@ -85,8 +195,19 @@ app.get("/api/audio_logs", async (req, res) => {
                 PARTITION BY c1_idx, FLOOR(EXTRACT(EPOCH FROM ts) / $3)
                 ORDER BY c1_cf DESC, ts DESC
               ) AS rn
-          FROM audio_logs
-          WHERE ts BETWEEN to_timestamp($1) AND to_timestamp($2)
+          FROM (
+            SELECT id, ts, db, c1_idx, c1_cf
+              FROM audio_logs
+             WHERE ts BETWEEN to_timestamp($1) AND to_timestamp($2)
+               ${model ? "AND (model IS NULL OR model = 'yamnet')" /* second-model rows reuse YAMNet's classes */ : ""}
+            ${summary ? `
+            UNION ALL
+            -- sensors on classify.py --summarize: each class's best window per interval
+            SELECT -id, ts_max, db_at_max, c1_idx, cf_max
+              FROM audio_logs_summary
+             WHERE bin_start BETWEEN to_timestamp($1) - INTERVAL '1 hour' AND to_timestamp($2)
+               AND ts_max BETWEEN to_timestamp($1) AND to_timestamp($2)` : ""}
+          ) logs
         ) sub
         WHERE rn = 1
         ORDER BY c1_idx, bin